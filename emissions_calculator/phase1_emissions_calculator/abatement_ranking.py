@@ -0,0 +1,140 @@
+"""
+abatement_ranking.py
+
+Ranks the DR products of every DR plan by their marginal abatement,
+the avoided emissions per MW of DR potential and per event hour,
+for each emissions scenario, DR plan and season, to set program priorities.
+
+The ranking is calculated in one pass over the stacked impacts and DR
+potential arrays of stack_impacts_inputs in subcomponent c, with a column
+for every DR plan, season and product, rather than table by table.
+Cumulative abatement curves (cumulative avoided emissions against
+cumulative DR potential, in ranked order) are derived from the ranking.
+"""
+
+import pandas as pd
+import numpy as np
+
+from subcomp_c_calculate_emissions import stack_impacts_inputs, calc_impacts_array, \
+    get_column_labels, compensated_sum
+
+ABATEMENT_METRICS = ['Tons per MW', 'Tons per Event Hour']
+
+
+def get_abatement_table(inputs, impacts=None, metric='Tons per MW'):
+    """
+    Calculates the marginal abatement of every product of every DR plan,
+    season and emissions scenario, and ranks the products within each
+    emissions scenario, DR plan and season.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        impacts: optional array of yearly avoided emissions with shape
+            (scenario, year, product), calculated from inputs if None
+        metric: the column (str) to rank by, see ABATEMENT_METRICS
+
+    Returns:
+        df_abatement: dataframe with columns "Scenario", "Plan", "Season",
+            "Bin", "Product", "Rank", "Potential" (average DR potential, MW),
+            "Event Hours" (hours per year with DR), "Avoided Emissions"
+            (average yearly avoided emissions, metric tons CO2e),
+            "Tons per MW" and "Tons per Event Hour", sorted by rank
+            within each emissions scenario, DR plan and season
+    """
+    if metric not in ABATEMENT_METRICS:
+        raise ValueError('Please input one of '+', '.join(ABATEMENT_METRICS)\
+                         +' for the metric argument')
+    if impacts is None:
+        impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'],
+                                     inputs['potential'], inputs['months'])
+
+    # Averages over years of every column, shape (scenario, product)
+    nyears = len(inputs['years'])
+    avoided = compensated_sum(np.asarray(impacts, dtype=np.float64).transpose(0, 2, 1)) / nyears
+    potential = np.asarray(inputs['potential'], dtype=np.float64).mean(axis=0)
+    event_hours = (inputs['hours'] > 0).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_mw = np.where(potential > 0, avoided / potential, np.nan)
+        per_hour = np.where(event_hours > 0, avoided / event_hours, np.nan)
+
+    labels = get_column_labels(inputs)
+    nscenarios, ncols = avoided.shape
+    df_abatement = pd.concat([labels] * nscenarios, ignore_index=True)
+    df_abatement.insert(0, 'Scenario', np.repeat([x.replace(' Emissions Rate Estimate', '') \
+                                                  for x in inputs['scenarios']], ncols))
+    df_abatement['Potential'] = np.tile(potential, nscenarios)
+    df_abatement['Event Hours'] = np.tile(event_hours, nscenarios)
+    df_abatement['Avoided Emissions'] = avoided.ravel()
+    df_abatement['Tons per MW'] = per_mw.ravel()
+    df_abatement['Tons per Event Hour'] = per_hour.ravel()
+
+    # Sort by the metric within each scenario, DR plan and season, keeping
+    # their input order, with products without a metric value last
+    group = df_abatement.groupby(['Scenario', 'Plan', 'Season'], sort=False).ngroup().values
+    values = df_abatement[metric].values
+    order = np.lexsort((-np.nan_to_num(values, nan=-np.inf), group))
+    df_abatement = df_abatement.iloc[order].reset_index(drop=True)
+    df_abatement.insert(5, 'Rank', df_abatement.groupby(group[order]).cumcount().values + 1)
+
+    return df_abatement
+
+
+def get_abatement_curves(df_abatement):
+    """
+    Calculates the cumulative abatement curves of a ranking, i.e. the
+    cumulative avoided emissions against the cumulative DR potential of the
+    products in ranked order, for each emissions scenario, DR plan and season.
+
+    Args:
+        df_abatement: output of get_abatement_table()
+
+    Returns:
+        df_curves: dataframe with columns "Scenario", "Plan", "Season",
+            "Rank", "Product", "Cumulative Potential" (MW),
+            "Cumulative Event Hours", "Cumulative Avoided Emissions"
+            (metric tons CO2e per year) and "Cumulative Share" (fraction of
+            the total avoided emissions of the scenario, DR plan and season)
+    """
+    if not isinstance(df_abatement,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the df_abatement argument')
+
+    keys = ['Scenario', 'Plan', 'Season']
+    grouped = df_abatement.groupby(keys, sort=False)
+    df_curves = df_abatement[keys + ['Rank', 'Product']].copy()
+    df_curves['Cumulative Potential'] = grouped['Potential'].cumsum()
+    df_curves['Cumulative Event Hours'] = grouped['Event Hours'].cumsum()
+    df_curves['Cumulative Avoided Emissions'] = grouped['Avoided Emissions'].cumsum()
+
+    totals = grouped['Avoided Emissions'].transform('sum')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df_curves['Cumulative Share'] = np.where(totals != 0,
+            df_curves['Cumulative Avoided Emissions'] / totals, np.nan)
+
+    return df_curves
+
+
+def abatement_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                     rebound_kernels=None, potential_profiles=None, metric='Tons per MW'):
+    """
+    Ranks the DR products by marginal abatement and calculates the
+    cumulative abatement curves, for every emissions scenario,
+    DR plan and season.
+
+    Args:
+        em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+            rebound_kernels, potential_profiles: see subcomp_c_runall
+        metric: the column (str) to rank by, see ABATEMENT_METRICS
+
+    Returns:
+        df_abatement: output of get_abatement_table()
+        df_curves: output of get_abatement_curves()
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+
+    inputs = stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info,
+                                  bins, seasons, rebound_kernels, potential_profiles)
+    df_abatement = get_abatement_table(inputs, metric=metric)
+
+    return df_abatement, get_abatement_curves(df_abatement)
@@ -0,0 +1,324 @@
+"""
+dr_schedule_optimizer.py
+
+Searches for DR schedules that maximize avoided emissions, given the
+hourly emissions rates, and for each DR product its event length,
+the hours of the day allowed for events, a budget of events per season,
+and whether it is a shift product (with the rebound kernels of
+subcomponent c, see REBOUND_KERNELS).
+
+The avoided emissions of an event starting in each hour of the year
+(its window score) are precomputed for all hours at once, from the
+cumulative sum of the hourly rates over the event (see get_rates_cumsum
+and calc_interval_sums in subcomponent c) plus the rebound
+kernel before and after it. Schedules are then chosen from the window
+scores by
+(a) 'greedy': the best event of each day, on the days with the largest
+    avoided emissions, with at most one event per day; or
+(b) 'dp': dynamic programming over the hours of the season, allowing
+    several events per day as long as the events and their rebound
+    hours do not overlap.
+
+Outputs DR hours dataframes in the create_dr_hours_df_dict format
+(columns hourID, Month, Day and a column for each DR product),
+which can be written to a DR hours workbook.
+"""
+
+import pandas as pd
+import numpy as np
+
+from emissions_parameters import DAYS_IN_MONTH, SEASON_MONTHS, REBOUND_KERNELS
+from subcomp_b_process_emissions_factors import get_rates_array
+from subcomp_c_calculate_emissions import get_rebound_kernel, get_rates_cumsum, \
+    calc_interval_sums
+
+
+def get_calendar():
+    """
+    Outputs the hourID, Month and Day of each hour of a DR hours year
+    (365 days, as in the DR hours workbooks).
+
+    Returns:
+        calendar: dataframe with columns "hourID", "Month" and "Day"
+    """
+    months = np.repeat(np.arange(1, 13), np.array(DAYS_IN_MONTH)*24)
+    days = np.concatenate([np.repeat(np.arange(1, ndays+1), 24) for ndays in DAYS_IN_MONTH])
+    hour_ids = np.tile(np.arange(1, 25), sum(DAYS_IN_MONTH))
+
+    return pd.DataFrame({'hourID': hour_ids, 'Month': months, 'Day': days})
+
+
+def get_hour_weights(rates, potential=None):
+    """
+    Sums the hourly emissions rates over the years, weighted by the DR
+    potential of a product in each year, since a DR hours schedule
+    repeats every year.
+
+    Args:
+        rates: array of hourly emissions rates with shape (year, hour)
+        potential: optional array of DR potential (MW) in each year,
+            defaults to 1 in every year
+
+    Returns:
+        weights: array of the weighted rates of each hour
+    """
+    if potential is None:
+        potential = np.ones(rates.shape[0])
+
+    return np.matmul(np.nan_to_num(np.asarray(potential, dtype=float)), rates)
+
+
+def get_window_scores(weights, event_length, kernel=None):
+    """
+    Calculates the score of an event starting in each hour: the weights
+    summed over the event, plus the weights of the rebound hours times
+    the rebound kernel. Rebound hours outside the year wrap around to
+    the other end of the year, as in subcomponent c.
+
+    Args:
+        weights: output of get_hour_weights()
+        event_length: number of hours (int) in each event
+        kernel: rebound kernel dictionary with 'pre' and 'post' arrays,
+            or None for shed products
+
+    Returns:
+        scores: array of the score of an event starting in each hour
+    """
+    nhours = len(weights)
+    starts = np.arange(nhours)
+    rates_cumsum = get_rates_cumsum(np.concatenate([weights, weights[:event_length]]))
+    scores = calc_interval_sums(rates_cumsum, starts, starts + event_length)
+
+    if kernel is not None:
+        for j, weight in enumerate(kernel['pre'][::-1]):
+            scores += weight*np.roll(weights, j+1)
+        for j, weight in enumerate(kernel['post']):
+            scores += weight*np.roll(weights, -(event_length+j))
+
+    return scores
+
+
+def get_allowed_starts(calendar, event_length, window, months):
+    """
+    Flags the hours in which an event can start: every hour of the event
+    is within the window of hours allowed on the same day, in the season.
+
+    Args:
+        calendar: output of get_calendar()
+        event_length: number of hours (int) in each event
+        window: (first, last) hourID (int) allowed for event hours
+        months: list of months (int) in the season
+
+    Returns:
+        allowed: array of bools for each hour
+    """
+    hour_ids = calendar['hourID'].values
+    allowed = (hour_ids >= window[0]) & (hour_ids + event_length - 1 <= window[1])
+
+    return allowed & np.isin(calendar['Month'].values, months)
+
+
+def greedy_schedule(scores, allowed, budget):
+    """
+    Chooses the best event start of each day, and the budget of days
+    with the largest positive scores. This is optimal when there is
+    at most one event per day.
+
+    Args:
+        scores: output of get_window_scores()
+        allowed: output of get_allowed_starts()
+        budget: maximum number of events (int)
+
+    Returns:
+        starts: sorted array of event start hours
+    """
+    day_scores = np.where(allowed, scores, -np.inf).reshape(-1, 24)
+    best_hour = day_scores.argmax(axis=1)
+    best_score = day_scores[np.arange(len(day_scores)), best_hour]
+
+    days = np.argsort(-best_score, kind='stable')[:budget]
+    days = days[best_score[days] > 0]
+
+    return np.sort(days*24 + best_hour[days])
+
+
+def dp_schedule(scores, allowed, footprint, budget):
+    """
+    Chooses event starts that maximize the total score with at most
+    budget events, by dynamic programming over the hours, such that
+    events start at least footprint hours apart.
+
+    Args:
+        scores: output of get_window_scores()
+        allowed: output of get_allowed_starts()
+        footprint: minimum number of hours (int) between event starts,
+            i.e. the event length plus its rebound hours
+        budget: maximum number of events (int)
+
+    Returns:
+        starts: sorted array of event start hours
+    """
+    nhours = len(scores)
+    gains = np.where(allowed & (scores > 0), scores, 0.)
+
+    # best[t, k]: best total score of at most k events starting before hour t
+    best = np.zeros((nhours+1, budget+1))
+    take = np.zeros((nhours, budget+1), dtype=bool)
+    for hour in range(nhours):
+        best[hour+1] = best[hour]
+        if gains[hour] > 0:
+            with_event = best[max(hour+1-footprint, 0), :-1] + gains[hour]
+            take[hour, 1:] = with_event > best[hour, 1:]
+            best[hour+1, 1:] = np.maximum(best[hour, 1:], with_event)
+
+    # Trace back the chosen starts
+    starts = []
+    hour, events = nhours-1, budget
+    while hour >= 0 and events > 0:
+        if take[hour, events]:
+            starts.append(hour)
+            hour -= footprint
+            events -= 1
+        else:
+            hour -= 1
+
+    return np.sort(np.array(starts, dtype=int))
+
+
+def schedule_to_hours(starts, event_length, nhours):
+    """
+    Converts event start hours into 1-or-0 DR hours.
+
+    Args:
+        starts: array of event start hours
+        event_length: number of hours (int) in each event
+        nhours: number of hours (int) in the year
+
+    Returns:
+        dr_hours: array of DR hours flags
+    """
+    dr_hours = np.zeros(nhours, dtype=np.int64)
+    dr_hours[(np.asarray(starts)[:, None] + np.arange(event_length)).ravel() % nhours] = 1
+
+    return dr_hours
+
+
+def optimize_dr_hours(rates, product_rules, dr_name, seasons, method='greedy', potential=None):
+    """
+    Searches for the DR hours of each product and season that maximize
+    avoided emissions.
+
+    Args:
+        rates: array of hourly emissions rates with shape (year, hour),
+            e.g. one scenario of get_rates_array()
+        product_rules: dictionary with the rules of each DR product, e.g.
+            {'DVR': {'event_length': 4, 'window': (15, 21),
+                     'budget': {'Winter': 10, 'Summer': 20}, 'shift': False}}
+            where window gives the first and last hourID allowed for event hours,
+            and budget gives the number of events in each season
+        dr_name: the name of the DR plan (str)
+        seasons: list of seasons (str) of the DR plan, see SEASON_MONTHS
+        method: 'greedy' or 'dp' (see the module docstring)
+        potential: optional dictionary of arrays of DR potential in each year
+            by product, to weight the years
+
+    Returns:
+        dr_hours_df_dict: dictionary of DR hours dataframes with keys such as
+            "newbins_Winter", in the create_dr_hours_df_dict format
+    """
+    if method not in ['greedy', 'dp']:
+        raise ValueError('Please input greedy or dp for the method argument')
+    if potential is None:
+        potential = {}
+
+    calendar = get_calendar()
+    nhours = len(calendar)
+    if rates.shape[-1] != nhours:
+        raise ValueError('Emissions rates must have '+str(nhours)+' hours per year')
+
+    # Window scores do not depend on the season, so compute them once per product
+    scores = {}
+    kernels = {}
+    for product, rules in product_rules.items():
+        kernel = None
+        if rules.get('shift', False):
+            kernel = REBOUND_KERNELS.get(product, get_rebound_kernel(rules['event_length']))
+        kernels[product] = kernel
+        scores[product] = get_window_scores(get_hour_weights(rates, potential.get(product)),
+                                            rules['event_length'], kernel)
+
+    dr_hours_df_dict = {}
+    for season in seasons:
+        dr_hours_df = calendar.copy()
+        for product, rules in product_rules.items():
+            event_length = rules['event_length']
+            budget = rules['budget'].get(season, 0)
+            allowed = get_allowed_starts(calendar, event_length, rules['window'],
+                                         SEASON_MONTHS[season])
+            if method == 'greedy':
+                starts = greedy_schedule(scores[product], allowed, budget)
+            else:
+                kernel = kernels[product]
+                footprint = event_length if kernel is None \
+                    else event_length + len(kernel['pre']) + len(kernel['post'])
+                starts = dp_schedule(scores[product], allowed, footprint, budget)
+            dr_hours_df[product] = schedule_to_hours(starts, event_length, nhours)
+
+        dr_hours_df_dict[dr_name + '_' + season] = dr_hours_df
+
+    return dr_hours_df_dict
+
+
+def write_dr_hours_workbook(dr_hours_df_dict, dr_name, file_name):
+    """
+    Writes the DR hours of a DR plan to a workbook with a sheet for each
+    season, which can be read by create_dr_hours_df_dict in subcomponent a.
+
+    Args:
+        dr_hours_df_dict: output of optimize_dr_hours()
+        dr_name: the name of the DR plan (str)
+        file_name: the DR hours workbook (str) to write
+    """
+    with pd.ExcelWriter(file_name) as writer:
+        for key, dr_hours_df in dr_hours_df_dict.items():
+            if key.startswith(dr_name + '_'):
+                dr_hours_df.to_excel(writer, sheet_name=key[len(dr_name)+1:], index=False)
+
+
+def dr_schedule_optimizer_runall(em_rates, product_rules, dr_name, seasons, method='greedy',
+                                 scenario='Baseline', dr_potential=None, file_name=None):
+    """
+    Runs the DR schedule optimizer for one DR plan.
+
+    Args:
+        em_rates: emissions rates dataframe from subcomponent a
+        product_rules, dr_name, seasons, method: see optimize_dr_hours
+        scenario: the emissions scenario (str) to optimize for
+        dr_potential: optional DR potential dataframe with columns "Year"
+            and DR products (e.g. from subcomponent a), to weight the years
+        file_name: optional DR hours workbook (str) to write
+
+    Returns:
+        dr_hours_df_dict: output of optimize_dr_hours()
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+    if not isinstance(product_rules,dict):
+        raise ValueError('Please input a dictionary for the product_rules argument')
+    for season in seasons:
+        if season not in SEASON_MONTHS:
+            raise ValueError('Unknown season: '+str(season))
+
+    rates, years = get_rates_array(em_rates, [scenario])
+    potential = None
+    if dr_potential is not None:
+        dr_potential = dr_potential.set_index('Year').reindex(years)
+        potential = {x: dr_potential[x].values for x in product_rules \
+                     if x in dr_potential.columns}
+
+    dr_hours_df_dict = optimize_dr_hours(rates[0], product_rules, dr_name, seasons,
+                                         method, potential)
+    if file_name is not None:
+        write_dr_hours_workbook(dr_hours_df_dict, dr_name, file_name)
+
+    return dr_hours_df_dict
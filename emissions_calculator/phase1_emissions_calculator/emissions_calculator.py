@@ -6,10 +6,19 @@ for the dashboard.
 """
 from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS,\
                                     DIR_DATA_PROC
-from subcomp_a_organize_data import subcomp_a_runall
-from subcomp_b_process_emissions_factors import subcomp_b_runall
-from subcomp_c_calculate_emissions import subcomp_c_runall
+from subcomp_a_organize_data import subcomp_a_runall, create_potential_profile_dict
+from subcomp_b_process_emissions_factors import subcomp_b_runall, \
+    alldays_oneyear_seasonal_ave, month_hour_ave, set_precision, alldays_stratified_ave, \
+    effective_rates, best_daily_windows, seasonal_best_windows
+from subcomp_c_calculate_emissions import subcomp_c_runall, stack_impacts_inputs, \
+    get_hourly_impacts, cube_to_dictionary, make_cube_barchart_df, get_impact_attribution
 from subcomp_d_output_data import subcomp_d_runall
+from monte_carlo_impacts import monte_carlo_runall
+from incremental_pipeline import incremental_runall
+from parallel_scenarios import parallel_runall
+from precision_check import precision_check_runall
+from impacts_cache import cached_subcomp_c_runall
+from abatement_ranking import get_abatement_table, get_abatement_curves
 
 #### DATA ANALYST USERS: UPDATE THIS SECTION ####
 # Users can specify any number of scenarios, e.g. ['Baseline','LimitedMarkets']
@@ -17,6 +26,19 @@ emissions_scenario_list = ['Baseline']
 emissions_rates_files = [DIR_EMISSIONS_RATES + 'AvoidedEmissionsRate' + x \
                          + '.xlsx' for x in emissions_scenario_list]
 EMISSIONS_YEAR = 2022 #year to show emissions rates for gen pub
+# Number of bootstrap resamples for confidence intervals on DR days
+# emissions rates averages, or 0 to skip the confidence intervals.
+N_BOOTSTRAP = 0
+BOOTSTRAP_SEED = 2022
+# Output hourly emissions rates averages of all days by day type
+# (weekday, weekend, holiday) and for the peak days of each year
+OUTPUT_STRATIFIED_AVE = False
+# Output the effective emissions rate of each DR bin for each year, i.e. the
+# hourly emissions rates over its DR hours weighted by the DR potential
+OUTPUT_EFFECTIVE_RATES = False
+# Output the best DR event window of each day (highest sum of emissions rates)
+# and how far the DR hours of each product are from it in each season
+OUTPUT_BEST_WINDOWS = False
 dr_name = ['oldbins','newbins']
 dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
 # The following lists should be the same length as dr_name
@@ -25,33 +47,185 @@ dr_potential_files = ['DR RPM Inputs_071420.xlsx','DR RPM Inputs_021621_newaMWbi
 dr_potential_files = [DIR_DR_POTENTIAL_HRS+ x for x in dr_potential_files]
 dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
 subset_products = [[0],['DVR','ResTOU']]
+# Optional files with hour-varying DR potential multipliers,
+# or None for flat DR potential in every DR hour.
+dr_profile_files = [None, None]
+# Number of Monte Carlo draws for uncertainty bands on emissions impacts,
+# or 0 to skip the Monte Carlo analysis (see MONTE_CARLO_DISTRIBUTIONS).
+N_MONTE_CARLO = 0
+MONTE_CARLO_SEED = 2022
+# Output hourly emissions impacts of every product and year (large files)
+OUTPUT_HOURLY_IMPACTS = False
+# Output the emissions impacts of every product and year by month and hour,
+# split into load reductions and rebound (compressed numpy files)
+OUTPUT_IMPACT_ATTRIBUTION = False
+# Output the DR products ranked by avoided emissions per MW of potential,
+# with cumulative abatement curves, for each scenario, DR plan and season
+OUTPUT_ABATEMENT_RANKING = False
+# File to save the pipeline state in, to recompute only the outputs affected
+# by changed input files in the next run, or None to always run everything.
+# Incremental runs do not include the Monte Carlo or hourly impacts outputs.
+INCREMENTAL_STATE_FILE = None
+# Number of worker processes for subcomponents b and c, with a work unit
+# for each emissions scenario and DR plan, or 1 to run in this process.
+# Runs without bootstrap confidence intervals only.
+N_WORKERS = 1
+# Floating point precision of subcomponents b and c, and of the Monte Carlo
+# analysis and optional outputs built on them, 'float64' or 'float32'.
+# Set VERIFY_PRECISION to print the deviation of a float32 run from float64.
+PRECISION = 'float64'
+VERIFY_PRECISION = False
+# Directory to cache subcomponent c results in, keyed by a hash of its inputs,
+# or None to always recompute them (see IMPACTS_CACHE_MAX_BYTES).
+# Runs in this process only (N_WORKERS = 1).
+IMPACTS_CACHE_DIR = None
 #################################################
 
+def get_ignored_settings():
+    """
+    Lists the settings above that do not apply to a run with the other
+    settings, so that main can warn about them rather than silently
+    ignoring them.
+
+    Returns:
+        ignored: list of (setting name, reason) tuples of str
+    """
+    ignored = []
+    if INCREMENTAL_STATE_FILE is not None:
+        defaults = {'N_WORKERS': 1, 'PRECISION': 'float64', 'VERIFY_PRECISION': False,
+                    'IMPACTS_CACHE_DIR': None, 'N_MONTE_CARLO': 0,
+                    'OUTPUT_STRATIFIED_AVE': False, 'OUTPUT_EFFECTIVE_RATES': False,
+                    'OUTPUT_BEST_WINDOWS': False, 'OUTPUT_HOURLY_IMPACTS': False,
+                    'OUTPUT_IMPACT_ATTRIBUTION': False, 'OUTPUT_ABATEMENT_RANKING': False}
+        ignored += [(x, 'not supported by incremental runs (INCREMENTAL_STATE_FILE)') \
+                    for x, default in defaults.items() if globals()[x] != default]
+    elif N_WORKERS > 1 and N_BOOTSTRAP > 0:
+        ignored.append(('N_WORKERS', 'not supported with bootstrap confidence intervals '\
+                        '(N_BOOTSTRAP), running subcomponents b and c in this process'))
+    elif N_WORKERS > 1 and IMPACTS_CACHE_DIR is not None:
+        ignored.append(('IMPACTS_CACHE_DIR', 'not supported on worker processes (N_WORKERS)'))
+
+    return ignored
+
+
 def main(dir_out):
     """
     Runs subcomponents A-D to read, process, and output
     emissions impacts data for the dashboard.
     """
+    for setting, reason in get_ignored_settings():
+        print('Warning: '+setting+' is '+reason)
+
+    if INCREMENTAL_STATE_FILE is not None:
+        print('Running subcomponents a-d for changed inputs')
+        incremental_runall(INCREMENTAL_STATE_FILE, emissions_rates_files, \
+                emissions_scenario_list, dr_hrs_files, dr_name, dr_seasons, \
+                dr_potential_files, subset_products, EMISSIONS_YEAR, dir_out, \
+                dr_profile_files, N_BOOTSTRAP, BOOTSTRAP_SEED)
+        return
 
     # Read files and create dataframes
     print('Running subcomponent a')
     emissions_rates_df_out, dr_hours_df_dict_out, \
-    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out, product_registry = \
         subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
-                        dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
-
-    # Calculate average hourly emissions rates for dashboard
-    print('Running subcomponent b')
-    df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave = \
-        subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,\
-                        emissions_rates_df_out, dr_hours_df_dict_out, EMISSIONS_YEAR)
-
-    # Calculate emissions impacts
-    print('Running subcomponent c')
-    emissions_impacts_dict, emissions_annual_df, newbins_barchart_df = \
-        subcomp_c_runall(emissions_rates_df_out, dr_hours_df_dict_out, \
+                        dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products,
+                        return_registry=True)
+    dr_profile_df_dict_out = create_potential_profile_dict(dr_profile_files, dr_name)
+
+    if N_WORKERS > 1 and N_BOOTSTRAP == 0:
+        # Calculate average hourly emissions rates and emissions impacts
+        print('Running subcomponents b and c on '+str(N_WORKERS)+' workers')
+        if not EMISSIONS_YEAR in emissions_rates_df_out['Report_Year'].tolist():
+            raise ValueError('Year unavailable!')
+        df_seasonal_ave, df_annual_ave, emissions_impacts_cube = \
+            parallel_runall(emissions_rates_df_out, dr_hours_df_dict_out, \
                 dr_potential_df_dict_out, dr_product_info_df_dict_out, \
-                        dr_name, dr_seasons)
+                dr_name, dr_seasons, N_WORKERS, potential_profiles=dr_profile_df_dict_out, \
+                precision=PRECISION, registry=product_registry)
+        emissions_rates_df_b = set_precision(emissions_rates_df_out, emissions_scenario_list, \
+                PRECISION)
+        df_oneyear_seasonal_ave = alldays_oneyear_seasonal_ave(emissions_scenario_list, \
+                emissions_rates_df_b, EMISSIONS_YEAR)
+        df_month_hour_ave = month_hour_ave(emissions_scenario_list, emissions_rates_df_b)
+        df_stratified_ave = alldays_stratified_ave(emissions_scenario_list, \
+                emissions_rates_df_b) if OUTPUT_STRATIFIED_AVE else None
+        emissions_impacts_dict = cube_to_dictionary(emissions_impacts_cube)
+        emissions_annual_df, newbins_barchart_df = \
+            make_cube_barchart_df(emissions_impacts_cube)
+    else:
+        # Calculate average hourly emissions rates for dashboard
+        print('Running subcomponent b')
+        df_b = subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,\
+                            emissions_rates_df_out, dr_hours_df_dict_out, EMISSIONS_YEAR,
+                            N_BOOTSTRAP, BOOTSTRAP_SEED, PRECISION, OUTPUT_STRATIFIED_AVE)
+        df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave, df_month_hour_ave = df_b[:4]
+        df_stratified_ave = df_b[4] if OUTPUT_STRATIFIED_AVE else None
+
+        # Calculate emissions impacts
+        print('Running subcomponent c')
+        if IMPACTS_CACHE_DIR is not None:
+            emissions_impacts_dict, emissions_annual_df, newbins_barchart_df = \
+                cached_subcomp_c_runall(IMPACTS_CACHE_DIR, emissions_rates_df_out, \
+                        dr_hours_df_dict_out, dr_potential_df_dict_out, \
+                        dr_product_info_df_dict_out, dr_name, dr_seasons, \
+                        potential_profiles=dr_profile_df_dict_out, precision=PRECISION, \
+                        registry=product_registry)
+        else:
+            emissions_impacts_dict, emissions_annual_df, newbins_barchart_df = \
+                subcomp_c_runall(emissions_rates_df_out, dr_hours_df_dict_out, \
+                        dr_potential_df_dict_out, dr_product_info_df_dict_out, \
+                                dr_name, dr_seasons, potential_profiles=dr_profile_df_dict_out, \
+                                precision=PRECISION, registry=product_registry)
+
+    if VERIFY_PRECISION:
+        print('Verifying float32 precision against float64')
+        print(precision_check_runall(emissions_rates_df_out, dr_hours_df_dict_out, \
+                dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons, \
+                EMISSIONS_YEAR, potential_profiles=dr_profile_df_dict_out).to_string(index=False))
+
+    df_effective_rates = None
+    if OUTPUT_EFFECTIVE_RATES:
+        df_effective_rates = effective_rates(dr_name, dr_seasons, emissions_scenario_list, \
+                set_precision(emissions_rates_df_out, emissions_scenario_list, PRECISION), \
+                dr_hours_df_dict_out, dr_potential_df_dict_out, \
+                dr_product_info_df_dict_out, registry=product_registry)
+
+    df_best_windows = None
+    df_seasonal_windows = None
+    if OUTPUT_BEST_WINDOWS:
+        emissions_rates_df_b = set_precision(emissions_rates_df_out, emissions_scenario_list, \
+                PRECISION)
+        df_best_windows = best_daily_windows(emissions_scenario_list, emissions_rates_df_b)
+        df_seasonal_windows = seasonal_best_windows(dr_name, dr_seasons, \
+                emissions_scenario_list, emissions_rates_df_b, dr_hours_df_dict_out)
+
+    df_monte_carlo_bands = None
+    if N_MONTE_CARLO > 0:
+        print('Running Monte Carlo analysis')
+        df_monte_carlo_bands = monte_carlo_runall(emissions_rates_df_out, \
+                dr_hours_df_dict_out, dr_potential_df_dict_out, \
+                dr_product_info_df_dict_out, dr_name, dr_seasons, \
+                n_draws=N_MONTE_CARLO, seed=MONTE_CARLO_SEED, \
+                potential_profiles=dr_profile_df_dict_out, precision=PRECISION)
+
+    hourly_impacts = None
+    df_attribution = None
+    df_abatement = None
+    df_abatement_curves = None
+    if OUTPUT_HOURLY_IMPACTS or OUTPUT_IMPACT_ATTRIBUTION or OUTPUT_ABATEMENT_RANKING:
+        impacts_inputs = stack_impacts_inputs(emissions_rates_df_out, \
+                dr_hours_df_dict_out, dr_potential_df_dict_out, \
+                dr_product_info_df_dict_out, dr_name, dr_seasons, \
+                potential_profiles=dr_profile_df_dict_out, precision=PRECISION, \
+                registry=product_registry)
+        if OUTPUT_HOURLY_IMPACTS:
+            hourly_impacts = get_hourly_impacts(impacts_inputs)
+        if OUTPUT_IMPACT_ATTRIBUTION:
+            df_attribution = get_impact_attribution(impacts_inputs)
+        if OUTPUT_ABATEMENT_RANKING:
+            df_abatement = get_abatement_table(impacts_inputs)
+            df_abatement_curves = get_abatement_curves(df_abatement)
 
     # Output csv files for dashboard
     print('Running subcomponent d')
@@ -59,7 +233,12 @@ def main(dir_out):
         dr_product_info_df_dict_out, df_seasonal_ave, df_annual_ave,
         df_oneyear_seasonal_ave, EMISSIONS_YEAR,
         emissions_impacts_dict, emissions_annual_df, newbins_barchart_df,
-        dir_out)
+        dir_out, df_month_hour_ave=df_month_hour_ave,
+        df_monte_carlo_bands=df_monte_carlo_bands, hourly_impacts=hourly_impacts,
+        df_attribution=df_attribution, df_abatement=df_abatement,
+        df_abatement_curves=df_abatement_curves, registry=product_registry,
+        df_stratified_ave=df_stratified_ave, df_effective_rates=df_effective_rates,
+        df_best_windows=df_best_windows, df_seasonal_windows=df_seasonal_windows)
 
 if __name__ == '__main__':
     main(DIR_DATA_PROC)
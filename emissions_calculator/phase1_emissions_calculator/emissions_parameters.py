@@ -27,7 +27,42 @@ DIR_DR_POTENTIAL_HRS = DIR_DATA_IN + 'DRPotentialandHours/'
 
 # Parameters and Constants
 SEASONS_ALLDAYS = ['Winter', 'Spring', 'Summer', 'Fall', 'Annual']
+SEASON_MONTHS = {'Winter': [1, 2, 3], 'Spring': [4, 5, 6], 'Summer': [7, 8, 9],
+                 'Fall': [10, 11, 12], 'Annual': list(range(1, 13))}
+DAY_TYPES = ['Weekday', 'Weekend', 'Holiday']
 DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
 # factor*emissions rates in lbs CO2e/kWh = metric tons CO2e/MWh
 EMISSIONS_CHANGEUNITS = .4536
+
+# Rebound kernels of DR shift products, as load changes (fraction of DR potential)
+# in the hours before the start ('pre', ending the hour before the event)
+# and after the end ('post', starting the hour after the event) of each event.
+# Shift products not listed shift half of each event to either side.
+# e.g. {'ResTOU_shift': {'pre': [-0.5, -0.5], 'post': [0, -0.5, -1, -1, -0.5]}}
+REBOUND_KERNELS = {}
+
+# Distributions of the Monte Carlo perturbations (see monte_carlo_impacts.py),
+# as a numpy random Generator method and its parameters, or ('fixed', value):
+# multipliers of the emissions rates (each year and month), multipliers of
+# the DR potential (each DR product), and the fraction of event load
+# shifted to the rebound hours by DR shift products (each DR product).
+MONTE_CARLO_DISTRIBUTIONS = {'rates': ('normal', 1.0, 0.1),
+                             'potential': ('normal', 1.0, 0.2),
+                             'shift_fraction': ('triangular', 0.5, 1.0, 1.0)}
+
+# Parameters of the sensitivity sweep (see sensitivity_sweep.py) and their
+# values in subcomponent c: multipliers of the DR potential and emissions
+# rates, the fraction of event load shifted by DR shift products, and
+# the number of hours to move every DR event (positive for later).
+SWEEP_DEFAULTS = {'potential_scale': 1.0, 'rate_scale': 1.0,
+                  'shift_fraction': 1.0, 'start_shift': 0}
+
+# Floating point precisions for the arrays of subcomponents b and c.
+# float32 halves memory and bandwidth; the check in precision_check.py
+# reports its deviation from float64.
+PRECISIONS = ['float64', 'float32']
+
+# Size cap (bytes) of the on-disk cache of subcomponent c results
+# (see impacts_cache.py); least recently used results are evicted first.
+IMPACTS_CACHE_MAX_BYTES = 256*2**20
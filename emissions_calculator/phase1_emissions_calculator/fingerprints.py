@@ -0,0 +1,50 @@
+"""
+fingerprints.py
+
+Fingerprints (content hashes) of bytes, dataframes, files and the source
+code of modules, shared by the incremental pipeline and the cache of
+subcomponent c results to detect changed inputs, settings and code.
+"""
+
+import hashlib
+from os import path
+
+import pandas as pd
+
+
+def hash_bytes(data):
+    """
+    Outputs the fingerprint (str) of bytes.
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_frame(data):
+    """
+    Outputs the fingerprint (str) of the values and labels
+    of a dataframe or series.
+    """
+    values = pd.util.hash_pandas_object(data, index=True).values.tobytes()
+    labels = str(list(data.columns) if isinstance(data, pd.DataFrame) else data.name)
+
+    return hash_bytes(values + labels.encode())
+
+
+def get_file_fingerprint(file_name):
+    """
+    Outputs the fingerprint (str) of the contents of a file,
+    or None for no file.
+    """
+    if file_name is None or not path.exists(file_name):
+        return None
+    with open(file_name, 'rb') as file:
+        return hash_bytes(file.read())
+
+
+def get_code_fingerprint(modules):
+    """
+    Outputs the fingerprint (str) of the source files of a list of modules,
+    to detect changes to the code that produced an output.
+    """
+    return hash_bytes(''.join([str(get_file_fingerprint(x.__file__)) \
+                               for x in modules]).encode())
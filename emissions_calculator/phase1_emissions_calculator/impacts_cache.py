@@ -0,0 +1,170 @@
+"""
+impacts_cache.py
+
+Memoizes subcomp_c_runall on disk, so that repeated runs with identical
+inputs (e.g. rebuilding the dashboard data) return the emissions impacts
+dictionary, barchart and newbins barchart without recomputing them.
+
+Results are keyed by a content hash of every input dataframe, the
+parameters (with the resolved rebound kernels and unit conversion factor),
+and the source of emissions_parameters.py and subcomponents a-c, so a change
+to any of these is a cache miss. Each result is a pickle file in the cache
+directory. Reading a result marks it as recently used, and after each new
+result the least recently used results are evicted until the cache fits in
+IMPACTS_CACHE_MAX_BYTES.
+"""
+
+import os
+import pickle
+from os import path
+
+import emissions_parameters
+import subcomp_a_organize_data
+import subcomp_b_process_emissions_factors
+import subcomp_c_calculate_emissions
+from emissions_parameters import IMPACTS_CACHE_MAX_BYTES
+from fingerprints import hash_bytes, hash_frame, get_code_fingerprint
+from subcomp_c_calculate_emissions import subcomp_c_runall
+
+
+def hash_frame_dict(frames):
+    """
+    Outputs the fingerprint (str) of a dictionary of dataframes,
+    including its keys and their order, or of None.
+    """
+    if frames is None:
+        return 'None'
+
+    return hash_bytes(''.join([str(x) + hash_frame(frames[x]) for x in frames]).encode())
+
+
+def get_cache_key(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                  rebound_kernels=None, potential_profiles=None, precision='float64'):
+    """
+    Outputs the cache key (str) of a subcomp_c_runall call, a content hash
+    of its inputs, of the rebound kernels and unit conversion factor it uses,
+    and of the source of emissions_parameters.py and subcomponents a-c.
+
+    Args:
+        see subcomp_c_runall
+    """
+    # The kernels and unit conversion factor as seen by subcomponent c
+    if rebound_kernels is None:
+        rebound_kernels = subcomp_c_calculate_emissions.REBOUND_KERNELS
+
+    parts = [get_code_fingerprint([emissions_parameters, subcomp_a_organize_data,
+                                   subcomp_b_process_emissions_factors,
+                                   subcomp_c_calculate_emissions]),
+             hash_frame(em_rates),
+             hash_frame_dict(dr_hours),
+             hash_frame_dict(dr_potential),
+             hash_frame_dict(dr_product_info),
+             hash_frame_dict(potential_profiles),
+             hash_bytes(pickle.dumps([bins, seasons, rebound_kernels, precision,
+                                       subcomp_c_calculate_emissions.EMISSIONS_CHANGEUNITS]))]
+
+    return hash_bytes(''.join(parts).encode())
+
+
+def load_cached(cache_dir, key):
+    """
+    Loads a cached result and marks it as recently used.
+
+    Args:
+        cache_dir: the cache directory (str)
+        key: output of get_cache_key()
+
+    Returns:
+        the cached result, or None if there is none
+    """
+    file_name = path.join(cache_dir, key + '.pkl')
+    try:
+        with open(file_name, 'rb') as file:
+            result = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    os.utime(file_name)
+
+    return result
+
+
+def evict_lru(cache_dir, max_bytes=IMPACTS_CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used results until the cached results
+    take up at most max_bytes.
+
+    Args:
+        cache_dir: the cache directory (str)
+        max_bytes: size cap (int) of the cache
+
+    Returns:
+        evicted: list of the evicted keys
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            stat = os.stat(path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum([x[1] for x in entries])
+    evicted = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path.join(cache_dir, name))
+        total -= size
+        evicted.append(name[:-len('.pkl')])
+
+    return evicted
+
+
+def store_cached(cache_dir, key, result, max_bytes=IMPACTS_CACHE_MAX_BYTES):
+    """
+    Saves a result in the cache, then evicts least recently used
+    results beyond the size cap.
+
+    Args:
+        cache_dir: the cache directory (str), created if needed
+        key: output of get_cache_key()
+        result: the result to cache
+        max_bytes: size cap (int) of the cache
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    file_name = path.join(cache_dir, key + '.pkl')
+
+    # Write to a temporary file first, so a partly written result is never read
+    with open(file_name + '.tmp', 'wb') as file:
+        pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_name + '.tmp', file_name)
+
+    evict_lru(cache_dir, max_bytes)
+
+
+def cached_subcomp_c_runall(cache_dir, em_rates, dr_hours, dr_potential, dr_product_info,
+                            bins, seasons, rebound_kernels=None, potential_profiles=None,
+                            precision='float64', max_bytes=IMPACTS_CACHE_MAX_BYTES,
+                            registry=None):
+    """
+    Runs subcomp_c_runall, or returns its cached result for identical inputs.
+
+    Args:
+        cache_dir: the cache directory (str)
+        max_bytes: size cap (int) of the cache
+        the other arguments: see subcomp_c_runall
+
+    Returns:
+        out_dict, barchart_df, newbins_barchart: see subcomp_c_runall
+    """
+    if not isinstance(max_bytes,int) or max_bytes < 0:
+        raise ValueError('Please input a non-negative integer for the max_bytes argument')
+
+    key = get_cache_key(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                        rebound_kernels, potential_profiles, precision)
+    result = load_cached(cache_dir, key)
+    if result is None:
+        result = subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins,
+                                  seasons, rebound_kernels, potential_profiles, precision,
+                                  registry)
+        store_cached(cache_dir, key, result, max_bytes)
+
+    return result
@@ -0,0 +1,393 @@
+"""
+incremental_pipeline.py
+
+Runs subcomponents A-D incrementally: after a change to the input files,
+only the outputs that depend on the changed inputs are recomputed
+and rewritten.
+
+The pipeline state, saved between runs, holds a fingerprint of each
+input file, the dataframes read from them, and the outputs. Inputs are
+tracked at the level of
+(a) the emissions rates of each scenario;
+(b) the DR hours of each DR plan, season and product;
+(c) the DR potential of each DR plan, season and product;
+(d) the product info of each DR plan and product; and
+(e) the potential profile of each DR plan,
+and each output records which of these it depends on.
+
+Only input files that changed are read again, and only the affected
+emissions impacts tables (one per scenario, DR plan, season and bin),
+emissions rates averages and csv files are recomputed and rewritten.
+"""
+
+import pickle
+from os import path
+
+import emissions_parameters
+import subcomp_a_organize_data
+import subcomp_b_process_emissions_factors
+import subcomp_c_calculate_emissions
+import subcomp_d_output_data
+from fingerprints import hash_bytes, hash_frame, get_file_fingerprint, get_code_fingerprint
+from subcomp_a_organize_data import create_emissions_rates_df, create_dr_hours_df_dict, \
+    create_dr_potential_df_dict, create_product_info_df_dict, create_potential_profile_dict, \
+    create_product_registry, get_bin_products
+from subcomp_b_process_emissions_factors import seasonal_ave, annual_ave, \
+    alldays_oneyear_seasonal_ave, month_hour_ave
+from subcomp_c_calculate_emissions import calc_yearly_avoided_emissions, get_save_name, \
+    get_scenario_impacts, make_barchart_df
+from subcomp_d_output_data import output_dr_hours, output_dr_potential, \
+    output_dr_days_ave, output_alldays_ave, output_month_hour_ave, output_emissions_impacts
+
+
+def load_state(state_file):
+    """
+    Loads the pipeline state saved by incremental_runall,
+    or an empty state if there is no state file.
+    """
+    if state_file is None or not path.exists(state_file):
+        return {}
+    with open(state_file, 'rb') as file:
+        return pickle.load(file)
+
+
+def save_state(state, state_file):
+    """
+    Saves the pipeline state for the next incremental run.
+    """
+    with open(state_file, 'wb') as file:
+        pickle.dump(state, file)
+
+
+def read_changed_inputs(state, emissions_rates_files, emissions_scenario_list,
+                        dr_hrs_files, dr_name, dr_seasons, dr_potential_files,
+                        subset_products, dr_profile_files):
+    """
+    Reads only the input files that changed since the last run (see
+    subcomponent a), reusing the dataframes of the other files from the state.
+
+    Args:
+        state: the pipeline state, updated in place
+        the other arguments: see subcomp_a_runall and create_potential_profile_dict
+
+    Returns:
+        inputs: dictionary with the emissions rates dataframe ('rates'),
+            and dictionaries of DR hours ('hours'), DR potential ('potential'),
+            DR product info ('info') and potential profiles ('profiles')
+    """
+    files = state.setdefault('files', {})
+    data = state.setdefault('data', {'hours': {}, 'potential': {}, 'info': {},
+                                     'profiles': {}})
+
+    def changed(file_name):
+        fingerprint = get_file_fingerprint(file_name)
+        is_changed = files.get(file_name, '') != fingerprint
+        files[file_name] = fingerprint
+        return is_changed
+
+    # Emissions rates files must share the same times, so they are read together
+    if any([changed(x) for x in emissions_rates_files]) or 'rates' not in data:
+        data['rates'] = create_emissions_rates_df(emissions_rates_files,
+                                                  emissions_scenario_list)
+
+    for idx, drname in enumerate(dr_name):
+        if changed(dr_hrs_files[idx]) or drname not in data['hours']:
+            data['hours'][drname] = create_dr_hours_df_dict([dr_hrs_files[idx]], [drname],
+                                                            [dr_seasons[idx]])
+        if changed(dr_potential_files[idx]) or drname not in data['potential']:
+            data['potential'][drname] = create_dr_potential_df_dict(
+                [dr_potential_files[idx]], [drname], [dr_seasons[idx]], [subset_products[idx]])
+            data['info'][drname] = create_product_info_df_dict([dr_potential_files[idx]],
+                                                               [drname])
+        if changed(dr_profile_files[idx]) or drname not in data['profiles']:
+            data['profiles'][drname] = create_potential_profile_dict([dr_profile_files[idx]],
+                                                                     [drname])
+
+    inputs = {'rates': data['rates'], 'hours': {}, 'potential': {}, 'info': {},
+              'profiles': {}}
+    for drname in dr_name:
+        for key in ['hours', 'potential', 'info', 'profiles']:
+            inputs[key].update(data[key][drname])
+
+    return inputs
+
+
+def get_input_fingerprints(inputs):
+    """
+    Fingerprints each tracked input: the emissions rates of each scenario,
+    the DR hours and DR potential of each DR plan, season and product,
+    the product info of each DR plan and product, and the potential profile
+    of each DR plan.
+
+    Args:
+        inputs: output of read_changed_inputs()
+
+    Returns:
+        fingerprints: dictionary of fingerprints (str) with keys such as
+            ('rates', scenario), ('hours', plan_season, product),
+            ('potential', plan_season, product), ('info', plan, product)
+            and ('profile', plan)
+    """
+    fingerprints = {}
+    rates = inputs['rates']
+    time_hash = hash_frame(rates[rates.columns[:4]])
+    for column in rates.columns[4:]:
+        scenario = column.replace(' Emissions Rate Estimate', '')
+        fingerprints[('rates', scenario)] = time_hash + hash_frame(rates[column])
+
+    for key in ['hours', 'potential']:
+        for plan_season, df_in in inputs[key].items():
+            n_labels = 3 if key == 'hours' else 1
+            label_hash = hash_frame(df_in[df_in.columns[:n_labels]])
+            for product in df_in.columns[n_labels:]:
+                fingerprints[(key, plan_season, product)] = label_hash + hash_frame(df_in[product])
+
+    for plan, df_info in inputs['info'].items():
+        for _, row in df_info.iterrows():
+            fingerprints[('info', plan, row['Product'])] = hash_bytes(str(list(row)).encode())
+
+    for plan, profile in inputs['profiles'].items():
+        fingerprints[('profile', plan)] = hash_frame(profile)
+
+    return fingerprints
+
+
+def get_changed_keys(old_fingerprints, new_fingerprints):
+    """
+    Outputs the set of input keys that were added, removed or changed.
+    """
+    keys = set(old_fingerprints) | set(new_fingerprints)
+
+    return {x for x in keys if old_fingerprints.get(x) != new_fingerprints.get(x)}
+
+
+def get_affected_outputs(changed_keys, inputs, dr_name, dr_seasons, previous_info=None,
+                         registry=None):
+    """
+    Maps changed inputs to the outputs that depend on them.
+
+    Args:
+        changed_keys: output of get_changed_keys()
+        inputs: output of read_changed_inputs()
+        dr_name: list of the names of each DR plan (str)
+        dr_seasons: array containing a list of seasons (str) with DR hours
+                    for each DR plan
+        previous_info: optional dictionary of the DR product info of the last
+                    run, so that the bins that changed products were in
+                    before are also recomputed
+        registry: optional output of create_product_registry() for inputs['info']
+
+    Returns:
+        affected: dictionary with sets of the affected
+            'impacts': (scenario, plan, season, bin) impacts tables
+            'seasonal_ave': (plan_season, scenario) DR days averages
+            'annual_ave': (plan, scenario) DR days averages
+            'rates': scenarios with all days averages
+            'dr_hours': plan_seasons with changed DR hours
+            'dr_potential': plan_seasons with changed DR potential or product info
+    """
+    scenarios = [x.replace(' Emissions Rate Estimate', '') for x in inputs['rates'].columns[4:]]
+    changed_rates = {x[1] for x in changed_keys if x[0] == 'rates'}
+    affected = {'impacts': set(), 'seasonal_ave': set(), 'annual_ave': set(),
+                'rates': changed_rates & set(scenarios), 'dr_hours': set(), 'dr_potential': set()}
+    if registry is None:
+        registry = create_product_registry(inputs['info'])
+    previous_bins = create_product_registry(previous_info or {})['bin_products']
+
+    for idx, drname in enumerate(dr_name):
+        plan_changed = ('profile', drname) in changed_keys
+        for season in dr_seasons[idx]:
+            plan_season = drname + '_' + season
+            products = list(inputs['hours'][plan_season].columns[3:])
+            changed_products = {x[-1] for x in changed_keys \
+                                if (x[0] in ['hours', 'potential'] and x[1] == plan_season) \
+                                or (x[0] == 'info' and x[1] == drname)}
+            if any([x[0] == 'hours' and x[1] == plan_season for x in changed_keys]):
+                affected['dr_hours'].add(plan_season)
+            if any([(x[0] == 'potential' and x[1] == plan_season) \
+                    or (x[0] == 'info' and x[1] == drname) for x in changed_keys]):
+                affected['dr_potential'].add(plan_season)
+
+            # Bins of the products now, and of the changed products in the last run
+            bin_dict = get_bin_products(registry, drname, products)
+            for bin_num, bin_drs in previous_bins.get(drname, {}).items():
+                if changed_products & set(bin_drs):
+                    bin_dict.setdefault(bin_num, [])
+                    bin_dict[bin_num] = bin_dict[bin_num] + bin_drs
+
+            for bin_num, bin_drs in bin_dict.items():
+                bin_changed = plan_changed or bool(changed_products & set(bin_drs))
+                for scenario in scenarios:
+                    if bin_changed or scenario in changed_rates:
+                        affected['impacts'].add((scenario, drname, season, bin_num))
+
+            for scenario in scenarios:
+                if plan_season in affected['dr_hours'] or scenario in changed_rates:
+                    affected['seasonal_ave'].add((plan_season, scenario))
+                    affected['annual_ave'].add((drname, scenario))
+
+    return affected
+
+
+def recompute_impacts(affected, inputs, impacts_dict, rebound_kernels=None, registry=None):
+    """
+    Recomputes the affected emissions impacts tables (see subcomponent c),
+    with only the affected scenarios and the products of the affected bins,
+    and updates impacts_dict in place.
+
+    Args:
+        affected: output of get_affected_outputs()
+        inputs: output of read_changed_inputs()
+        impacts_dict: the emissions impacts dictionary of the last run
+        rebound_kernels: see subcomp_c_runall
+        registry: optional output of create_product_registry() for inputs['info']
+
+    Returns:
+        keys: list of the updated keys of impacts_dict
+    """
+    rates = inputs['rates']
+    if registry is None:
+        registry = create_product_registry(inputs['info'])
+    groups = {}
+    for scenario, drname, season, bin_num in affected['impacts']:
+        group = groups.setdefault((drname, season), {'scenarios': set(), 'bins': set()})
+        group['scenarios'].add(scenario)
+        group['bins'].add(bin_num)
+
+    keys = []
+    for (drname, season), group in groups.items():
+        plan_season = drname + '_' + season
+        hours = inputs['hours'][plan_season]
+        bin_dict = get_bin_products(registry, drname, list(hours.columns[3:]))
+        products = [x for bin_num in group['bins'] for x in bin_dict.get(bin_num, [])]
+        if not products:
+            # Only bins that no longer exist, dropped below
+            continue
+        columns = [x for x in rates.columns[4:] \
+                   if x.replace(' Emissions Rate Estimate', '') in group['scenarios']]
+
+        out_dict = calc_yearly_avoided_emissions(
+            rates[list(rates.columns[:4]) + columns],
+            {plan_season: hours[list(hours.columns[:3]) + products]},
+            {plan_season: inputs['potential'][plan_season][['Year'] + products]},
+            inputs['info'], [drname], [[season]], rebound_kernels, inputs['profiles'],
+            registry)
+        impacts_dict.update(out_dict)
+        keys += list(out_dict.keys())
+
+    # Drop tables of bins that no longer exist
+    expected = set()
+    for idx, drname in enumerate(inputs['dr_name']):
+        for season in inputs['dr_seasons'][idx]:
+            plan_season = drname + '_' + season
+            bin_dict = get_bin_products(registry, drname,
+                                        list(inputs['hours'][plan_season].columns[3:]))
+            for column in rates.columns[4:]:
+                for bin_num in bin_dict:
+                    expected.add(get_save_name(column, drname, season, bin_num))
+    for key in set(impacts_dict) - expected:
+        del impacts_dict[key]
+
+    return keys
+
+
+def incremental_runall(state_file, emissions_rates_files, emissions_scenario_list,
+                       dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products,
+                       year, dir_out, dr_profile_files=None, n_boot=0, seed=None,
+                       rebound_kernels=None):
+    """
+    Runs subcomponents A-D, recomputing and rewriting only the outputs
+    affected by inputs that changed since the run that saved state_file.
+    The first run, or a run with different settings, runs everything.
+
+    Args:
+        state_file: file (str) to load and save the pipeline state
+        year, n_boot, seed: see subcomp_b_runall
+        rebound_kernels: see subcomp_c_runall
+        dir_out: the directory to output files to
+        the other arguments: see subcomp_a_runall and create_potential_profile_dict
+
+    Returns:
+        affected: output of get_affected_outputs() for this run
+    """
+    if dr_profile_files is None:
+        dr_profile_files = [None]*len(dr_name)
+    if rebound_kernels is None:
+        rebound_kernels = subcomp_c_calculate_emissions.REBOUND_KERNELS
+    # Any change to the settings or to the code of subcomponents a-d reruns everything
+    code = get_code_fingerprint([emissions_parameters, subcomp_a_organize_data,
+                                 subcomp_b_process_emissions_factors,
+                                 subcomp_c_calculate_emissions, subcomp_d_output_data])
+    settings = hash_bytes(pickle.dumps([emissions_rates_files, emissions_scenario_list,
+                                        dr_hrs_files, dr_name, dr_seasons, dr_potential_files,
+                                        subset_products, dr_profile_files, year, n_boot, seed,
+                                        rebound_kernels, dir_out, code]))
+    state = load_state(state_file)
+    if state.get('settings') != settings:
+        state = {'settings': settings}
+    previous_info = {}
+    for info in state.get('data', {}).get('info', {}).values():
+        previous_info.update(info)
+    outputs = state.setdefault('outputs', {'seasonal_ave': {}, 'annual_ave': {},
+                                           'oneyear_ave': {}, 'month_hour_ave': {},
+                                           'impacts': {}})
+
+    # Subcomponent a: read only the changed files
+    inputs = read_changed_inputs(state, emissions_rates_files, emissions_scenario_list,
+                                 dr_hrs_files, dr_name, dr_seasons, dr_potential_files,
+                                 subset_products, dr_profile_files)
+    inputs['dr_name'] = dr_name
+    inputs['dr_seasons'] = dr_seasons
+    registry = create_product_registry(inputs['info'], inputs['hours'])
+    fingerprints = get_input_fingerprints(inputs)
+    affected = get_affected_outputs(get_changed_keys(state.get('fingerprints', {}),
+                                                     fingerprints),
+                                    inputs, dr_name, dr_seasons, previous_info, registry)
+    rates = inputs['rates']
+
+    # Subcomponent b: only the affected averages
+    new_seasonal = {}
+    for plan_season, scenario in sorted(affected['seasonal_ave']):
+        drname, season = plan_season.split('_', 1)
+        value = seasonal_ave([drname], [[season]], [scenario], rates, inputs['hours'],
+                             n_boot, seed)[plan_season][scenario]
+        new_seasonal.setdefault(plan_season, {})[scenario] = value
+        outputs['seasonal_ave'].setdefault(plan_season, {})[scenario] = value
+    new_annual = {}
+    for drname, scenario in sorted(affected['annual_ave']):
+        value = annual_ave([drname], [dr_seasons[dr_name.index(drname)]], [scenario], rates,
+                           inputs['hours'], n_boot, seed)[drname][scenario]
+        new_annual.setdefault(drname, {})[scenario] = value
+        outputs['annual_ave'].setdefault(drname, {})[scenario] = value
+    new_oneyear = {}
+    new_month_hour = {}
+    for scenario in sorted(affected['rates']):
+        for season, value in alldays_oneyear_seasonal_ave([scenario], rates, year).items():
+            new_oneyear.setdefault(season, {})[scenario] = value[scenario]
+            outputs['oneyear_ave'].setdefault(season, {})[scenario] = value[scenario]
+        new_month_hour[scenario] = month_hour_ave([scenario], rates)[scenario]
+        outputs['month_hour_ave'][scenario] = new_month_hour[scenario]
+
+    # Subcomponent c: only the affected impacts tables
+    impacts_dict = outputs['impacts']
+    keys = recompute_impacts(affected, inputs, impacts_dict, rebound_kernels, registry)
+
+    # Subcomponent d: only the affected csv files
+    if affected['dr_hours']:
+        output_dr_hours(inputs['hours'], dir_out)
+    if affected['dr_potential']:
+        output_dr_potential(inputs['potential'], inputs['info'], dir_out, registry)
+    output_dr_days_ave(new_seasonal, new_annual, dir_out)
+    output_alldays_ave(new_oneyear, year, dir_out)
+    if new_month_hour:
+        output_month_hour_ave(new_month_hour, dir_out)
+    if keys:
+        barchart_df, newbins_barchart = make_barchart_df(
+            get_scenario_impacts(impacts_dict, rates.columns[4]))
+        output_emissions_impacts({x: impacts_dict[x] for x in keys},
+                                 barchart_df, newbins_barchart, dir_out)
+
+    state['fingerprints'] = fingerprints
+    save_state(state, state_file)
+
+    return affected
@@ -0,0 +1,383 @@
+"""
+monte_carlo_impacts.py
+
+Runs a Monte Carlo uncertainty analysis of the emissions impacts
+calculated in subcomponent c, alongside subcomp_c_runall.
+
+Each draw samples multipliers of
+(a) the emissions rates, for each year and month;
+(b) the DR potential, for each DR product; and
+(c) the fraction of each event's load that DR shift products shift
+to the rebound hours (1 is the full rebound of subcomponent c),
+from the distributions in MONTE_CARLO_DISTRIBUTIONS.
+
+The hourly emissions rates are summed against the DR hours and the rebound
+hours by month once, so every draw is a small tensor contraction and
+thousands of draws are calculated as batched arrays. Draws are calculated
+in chunks, and each chunk has its own seeded random number stream, so the
+results do not depend on the number of workers. Each chunk is reduced to
+running sums and histograms as it finishes (see summarize_draws), so memory
+is bounded by the chunk size rather than the number of draws.
+
+Outputs percentiles of the yearly avoided emissions (metric tons CO2e)
+for each emissions scenario, DR plan, season, bin, product and year.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from emissions_parameters import EMISSIONS_CHANGEUNITS, MONTE_CARLO_DISTRIBUTIONS
+from subcomp_c_calculate_emissions import stack_impacts_inputs, get_column_labels
+
+
+def get_distributions(distributions=None):
+    """
+    Fills in the default distribution of any perturbation not given.
+
+    Args:
+        distributions: optional dictionary with keys 'rates', 'potential'
+            and/or 'shift_fraction' (see MONTE_CARLO_DISTRIBUTIONS)
+
+    Returns:
+        distributions: dictionary with the distribution of each perturbation
+    """
+    if distributions is None:
+        distributions = {}
+    unknown = [x for x in distributions if x not in MONTE_CARLO_DISTRIBUTIONS]
+    if unknown:
+        raise ValueError('Unknown perturbations: '+', '.join(unknown)\
+                         +'. Use '+', '.join(MONTE_CARLO_DISTRIBUTIONS))
+
+    out = dict(MONTE_CARLO_DISTRIBUTIONS)
+    out.update(distributions)
+    return out
+
+
+def sample_multipliers(rng, distribution, size):
+    """
+    Samples an array of multipliers from a distribution.
+
+    Args:
+        rng: numpy random Generator
+        distribution: tuple of a numpy Generator method name (str), such as
+            'normal', 'uniform', 'triangular' or 'lognormal', and its parameters;
+            or ('fixed', value) for a constant
+        size: shape (tuple) of the output array
+
+    Returns:
+        array of multipliers with shape size
+    """
+    name, params = distribution[0], distribution[1:]
+    if name == 'fixed':
+        return np.full(size, float(params[0]))
+    if not hasattr(rng, name):
+        raise ValueError('Unknown distribution: '+str(name))
+
+    return getattr(rng, name)(*params, size=size)
+
+
+def get_monthly_impacts(inputs):
+    """
+    Sums the hourly emissions rates against the DR hours and against the
+    rebound hours of shift products, by month, for every scenario,
+    year and product. Impacts of a draw are then linear in the sampled
+    multipliers.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+
+    Returns:
+        dispatch: array with shape (scenario, year, month, product)
+            of emissions rates summed over the DR hours
+        rebound: array with shape (scenario, year, month, product)
+            of emissions rates summed over the rebound hours
+    """
+    rates = inputs['rates']
+    hours = inputs['hours']
+    rebound_hours = inputs['load_shapes'] - hours
+
+    dispatch = np.zeros(rates.shape[:2] + (12, hours.shape[0]))
+    rebound = np.zeros(dispatch.shape)
+    for month in range(12):
+        in_month = inputs['months'] == month+1
+        dispatch[:, :, month, :] = np.matmul(rates[..., in_month], hours[:, in_month].T)
+        rebound[:, :, month, :] = np.matmul(rates[..., in_month], rebound_hours[:, in_month].T)
+
+    return dispatch, rebound
+
+
+def calc_draws(dispatch, rebound, potential, n_draws, seed_seq, distributions):
+    """
+    Calculates the avoided emissions of a chunk of Monte Carlo draws.
+
+    Args:
+        dispatch, rebound: output of get_monthly_impacts()
+        potential: array of DR potential with shape (year, product)
+        n_draws: number of draws (int) in the chunk
+        seed_seq: numpy SeedSequence of the chunk's random number stream
+        distributions: output of get_distributions()
+
+    Returns:
+        impacts: array of yearly avoided emissions with shape
+            (draw, scenario, year, product)
+    """
+    rng = np.random.default_rng(seed_seq)
+    nyears, nproducts = potential.shape
+
+    rate_mult = sample_multipliers(rng, distributions['rates'], (n_draws, nyears, 12))
+    potential_mult = sample_multipliers(rng, distributions['potential'], (n_draws, nproducts))
+    shift_fraction = sample_multipliers(rng, distributions['shift_fraction'],
+                                        (n_draws, nproducts))
+
+    impacts = np.einsum('dym,symp->dsyp', rate_mult, dispatch, optimize=True) \
+        + np.einsum('dym,symp->dsyp', rate_mult, rebound, optimize=True) \
+        * shift_fraction[:, None, None, :]
+
+    return impacts * (potential*EMISSIONS_CHANGEUNITS) * potential_mult[:, None, None, :]
+
+
+def iter_draw_chunks(inputs, n_draws=10000, distributions=None, chunk_size=500,
+                     n_workers=1, seed=None):
+    """
+    Calculates the avoided emissions of Monte Carlo draws chunk by chunk,
+    optionally spread over a pool of worker processes. At most n_workers
+    chunks are held in memory at once.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        n_draws: number of draws (int)
+        distributions: optional dictionary of distributions (see get_distributions)
+        chunk_size: maximum number of draws (int) calculated at once
+        n_workers: number of worker processes (int), 1 to run in this process
+        seed: seed (int) of the random number streams, or None
+
+    Returns:
+        generator of arrays of yearly avoided emissions with shape
+            (draw, scenario, year, product), one for each chunk in order
+    """
+    distributions = get_distributions(distributions)
+    dispatch, rebound = get_monthly_impacts(inputs)
+    potential = inputs['potential']
+
+    starts = list(range(0, n_draws, chunk_size))
+    sizes = [min(chunk_size, n_draws-start) for start in starts]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(starts))
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for first in range(0, len(starts), n_workers):
+                futures = [executor.submit(calc_draws, dispatch, rebound, potential,
+                                           sizes[x], seed_seqs[x], distributions) \
+                           for x in range(first, min(first+n_workers, len(starts)))]
+                for future in futures:
+                    yield future.result()
+    else:
+        for size, seed_seq in zip(sizes, seed_seqs):
+            yield calc_draws(dispatch, rebound, potential, size, seed_seq, distributions)
+
+
+def monte_carlo_draws(inputs, n_draws=10000, distributions=None, chunk_size=500,
+                      n_workers=1, seed=None):
+    """
+    Calculates the avoided emissions of every Monte Carlo draw and holds them
+    all in memory (see summarize_draws for large numbers of draws).
+
+    Args:
+        see iter_draw_chunks()
+
+    Returns:
+        draws: array of yearly avoided emissions with shape
+            (draw, scenario, year, product)
+    """
+    return np.concatenate(list(iter_draw_chunks(inputs, n_draws, distributions, chunk_size,
+                                                n_workers, seed)))
+
+
+def get_histogram_percentiles(counts, lower, upper, n_total, percentiles):
+    """
+    Estimates percentiles from histograms of the draws of each value,
+    interpolating linearly within a bin. The error is at most one bin width.
+
+    Args:
+        counts: array of counts with shape (value, bin)
+        lower, upper: arrays of the lower and upper edge of each histogram
+        n_total: number of draws (int)
+        percentiles: list of percentiles (0-100)
+
+    Returns:
+        values: array of percentiles with shape (percentile, value)
+    """
+    n_bins = counts.shape[1]
+    width = (upper - lower)/n_bins
+    cumulative = counts.cumsum(axis=1)
+    rows = np.arange(counts.shape[0])
+
+    def get_order_statistic(rank):
+        # Value of the draw with 0-based rank, placed uniformly within its bin
+        k = np.argmax(cumulative > rank, axis=1)
+        before = cumulative[rows, k] - counts[rows, k]
+        fraction = (rank - before + 0.5)/np.maximum(counts[rows, k], 1)
+        return lower + (k + fraction)*width
+
+    values = []
+    for percentile in percentiles:
+        # Interpolate between the draws around the rank, as in np.percentile
+        rank = percentile/100*(n_total-1)
+        below = np.floor(rank)
+        above = min(below + 1, n_total - 1)
+        values.append(get_order_statistic(below) \
+                      + (rank - below)*(get_order_statistic(above) - get_order_statistic(below)))
+
+    return np.array(values)
+
+
+def summarize_draws(inputs, n_draws=10000, percentiles=(5, 50, 95), distributions=None,
+                    chunk_size=500, n_workers=1, seed=None, n_bins=1000):
+    """
+    Calculates the mean and percentiles of the Monte Carlo draws, reducing
+    each chunk of draws to running summaries as it is calculated, so memory
+    is bounded by the chunk size rather than the number of draws.
+
+    The first pass accumulates the sum, minimum and maximum of each value.
+    The second pass recalculates the same draws from the same random number
+    streams and accumulates a histogram of each value between its minimum
+    and maximum, from which percentiles are interpolated to within
+    (maximum - minimum)/n_bins. With a single chunk, percentiles are exact.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        n_draws, distributions, chunk_size, n_workers, seed: see iter_draw_chunks()
+        percentiles: list of percentiles (0-100)
+        n_bins: number of histogram bins (int) of each value
+
+    Returns:
+        mean: array of the mean yearly avoided emissions with shape
+            (scenario, year, product)
+        values: array of percentiles with shape (percentile, scenario, year, product)
+    """
+    args = (inputs, n_draws, distributions, chunk_size, n_workers, seed)
+    if n_draws <= chunk_size:
+        draws = monte_carlo_draws(*args)
+        return draws.mean(axis=0), np.percentile(draws, percentiles, axis=0)
+
+    total = lower = upper = None
+    for chunk in iter_draw_chunks(*args):
+        if total is None:
+            total = np.zeros(chunk.shape[1:])
+            lower = np.full(chunk.shape[1:], np.inf)
+            upper = np.full(chunk.shape[1:], -np.inf)
+        total += chunk.sum(axis=0)
+        lower = np.minimum(lower, chunk.min(axis=0))
+        upper = np.maximum(upper, chunk.max(axis=0))
+
+    shape = total.shape
+    lower, upper = lower.ravel(), upper.ravel()
+    scale = n_bins/np.where(upper > lower, upper - lower, 1)
+    offsets = np.arange(lower.size)*n_bins
+    counts = np.zeros(lower.size*n_bins, dtype=np.int64)
+    for chunk in iter_draw_chunks(*args):
+        bins = np.clip(((chunk.reshape(len(chunk), -1) - lower)*scale).astype(np.int64),
+                       0, n_bins-1)
+        counts += np.bincount((bins + offsets).ravel(), minlength=counts.size)
+
+    values = get_histogram_percentiles(counts.reshape(lower.size, n_bins), lower, upper,
+                                       n_draws, percentiles)
+
+    return total/n_draws, values.reshape((len(percentiles),) + shape)
+
+
+def get_band_table(inputs, mean, values, percentiles=(5, 50, 95)):
+    """
+    Labels the mean and percentiles of the Monte Carlo draws as percentile bands.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        mean, values: output of summarize_draws()
+        percentiles: list of percentiles (0-100) of values
+
+    Returns:
+        bands: dataframe with columns "Scenario", "Plan", "Season", "Bin",
+            "Product", "Year", "Mean", and a column for each percentile
+            (e.g. "P5"), with a row for each scenario, product and year
+    """
+    nscenarios, nyears, nproducts = mean.shape
+    s_idx, p_idx, y_idx = [x.ravel() for x in np.meshgrid(
+        np.arange(nscenarios), np.arange(nproducts), np.arange(nyears), indexing='ij')]
+
+    scenarios = np.array([x.replace(' Emissions Rate Estimate', '') \
+                          for x in inputs['scenarios']])
+    bands = get_column_labels(inputs).iloc[p_idx].reset_index(drop=True)
+    bands.insert(0, 'Scenario', scenarios[s_idx])
+    bands['Year'] = inputs['years'][y_idx].astype(float)
+    bands['Mean'] = mean[s_idx, y_idx, p_idx]
+
+    for percentile, value in zip(percentiles, values):
+        bands['P'+'{:g}'.format(percentile)] = value[s_idx, y_idx, p_idx]
+
+    return bands
+
+
+def get_percentile_table(draws, inputs, percentiles=(5, 50, 95)):
+    """
+    Summarizes Monte Carlo draws held in memory as percentile bands.
+
+    Args:
+        draws: output of monte_carlo_draws()
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        percentiles: list of percentiles (0-100) to output
+
+    Returns:
+        bands: see get_band_table()
+    """
+    return get_band_table(inputs, draws.mean(axis=0),
+                          np.percentile(draws, percentiles, axis=0), percentiles)
+
+
+def monte_carlo_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                       n_draws=10000, percentiles=(5, 50, 95), distributions=None,
+                       chunk_size=500, n_workers=1, seed=None,
+                       rebound_kernels=None, potential_profiles=None, n_bins=1000,
+                       precision='float64'):
+    """
+    Runs the Monte Carlo uncertainty analysis of the emissions impacts.
+
+    Args:
+        em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+            rebound_kernels, potential_profiles: see subcomp_c_runall
+        n_draws: number of draws (int)
+        percentiles: list of percentiles (0-100) to output
+        distributions: optional dictionary of distributions of the
+            perturbations, defaults to MONTE_CARLO_DISTRIBUTIONS
+        chunk_size: maximum number of draws (int) calculated at once
+        n_workers: number of worker processes (int), 1 to run in this process
+        seed: seed (int) of the random number streams, or None
+        n_bins: number of histogram bins (int) of each value for the
+            percentiles (see summarize_draws)
+        precision: 'float64' or 'float32' precision of the inputs (see
+            stack_impacts_inputs), in which the monthly sums over hours
+            are taken; the draws are calculated in float64
+
+    Returns:
+        bands: output of get_band_table()
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+    if not isinstance(dr_hours,dict):
+        raise ValueError('Please input a dictionary for the dr_hours argument')
+    if not isinstance(dr_potential,dict):
+        raise ValueError('Please input a dictionary for the dr_potential argument')
+    if not isinstance(dr_product_info,dict):
+        raise ValueError('Please input a dictionary for the dr_product_info argument')
+    if not isinstance(n_draws,int) or n_draws < 1:
+        raise ValueError('Please input a positive integer for the n_draws argument')
+    if not isinstance(chunk_size,int) or chunk_size < 1:
+        raise ValueError('Please input a positive integer for the chunk_size argument')
+
+    inputs = stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info,
+                                  bins, seasons, rebound_kernels, potential_profiles, precision)
+    mean, values = summarize_draws(inputs, n_draws, percentiles, distributions, chunk_size,
+                                   n_workers, seed, n_bins)
+
+    return get_band_table(inputs, mean, values, percentiles)
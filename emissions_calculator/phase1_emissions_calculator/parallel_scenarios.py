@@ -0,0 +1,216 @@
+"""
+parallel_scenarios.py
+
+Runs the DR days averages of the hourly emissions rates of subcomponent b
+and the emissions impacts of subcomponent c over a pool of worker processes,
+with a work unit for each emissions scenario and DR plan.
+
+The hourly emissions rates of all scenarios, aligned into a
+(scenario, year, hour) array by stack_impacts_inputs, are copied into
+shared memory once. Each worker attaches to the shared array by name,
+so the rates are never pickled, and only the DR days, DR hours and
+DR potential of a work unit and its results are passed between processes.
+Results are merged in the order of the work units, so they do not depend
+on the number of workers and match the serial calculation.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pandas as pd
+import numpy as np
+
+from subcomp_c_calculate_emissions import stack_impacts_inputs, calc_impacts_array, \
+    build_results_cube, compensated_sum
+
+
+def share_array(array):
+    """
+    Copies an array into a new block of shared memory.
+
+    Args:
+        array: numpy array
+
+    Returns:
+        shm: the SharedMemory block, to close and unlink when done
+        spec: tuple of the block name, shape and dtype (str) of the array,
+            to attach to it with attach_array()
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    """
+    Attaches to an array in shared memory without copying it.
+
+    Args:
+        spec: output of share_array()
+
+    Returns:
+        shm: the SharedMemory block, to close when done
+        array: numpy array backed by the shared memory
+    """
+    shm = shared_memory.SharedMemory(name=spec[0])
+
+    return shm, np.ndarray(spec[1], dtype=spec[2], buffer=shm.buf)
+
+
+def get_dr_day_flags(dr_hours):
+    """
+    Flags the days with DR hours, as selected by get_dr_days_data
+    in subcomponent b.
+
+    Args:
+        dr_hours: DR hours dataframe with 24 rows per day
+
+    Returns:
+        flags: array of bools for each day
+    """
+    return dr_hours['DVR'].values.reshape(-1, 24).sum(axis=1) > 0
+
+
+def calc_unit_averages(rates_spec, s_ind, day_flags):
+    """
+    Work unit of the DR days averages of the hourly emissions rates
+    of one emissions scenario, over all years.
+
+    Args:
+        rates_spec: share_array() spec of the (scenario, year, hour) rates
+        s_ind: index (int) of the emissions scenario
+        day_flags: array of bools with shape (group, day), e.g. the
+            get_dr_day_flags() of each season of a DR plan
+
+    Returns:
+        averages: array of the average emissions rates with shape (group, hour of day)
+    """
+    shm, rates = attach_array(rates_spec)
+    try:
+        day_sums = compensated_sum(rates[s_ind].reshape(rates.shape[1], -1, 24), axis=0)
+        averages = np.matmul(day_flags, day_sums) \
+            / (day_flags.sum(axis=1)[:, None] * rates.shape[1])
+    finally:
+        del rates
+        shm.close()
+
+    return averages
+
+
+def calc_unit_impacts(rates_spec, s_ind, load_shapes, potential, months=None):
+    """
+    Work unit of the yearly avoided emissions of the products
+    of one emissions scenario and DR plan (see calc_impacts_array).
+
+    Args:
+        rates_spec: share_array() spec of the (scenario, year, hour) rates
+        s_ind: index (int) of the emissions scenario
+        load_shapes: array of DR hours plus rebound with shape (product, hour)
+        potential: array of DR potential with shape (year, product)
+        months: array of the month (int) of each hour (see calc_impacts_array)
+
+    Returns:
+        impacts: array of yearly avoided emissions with shape (year, product)
+    """
+    shm, rates = attach_array(rates_spec)
+    try:
+        impacts = calc_impacts_array(rates[s_ind], load_shapes, potential, months)
+    finally:
+        del rates
+        shm.close()
+
+    return impacts
+
+
+def run_work_units(rates, units, n_workers=1):
+    """
+    Shares the rates array and runs the work units, in a pool of worker
+    processes if n_workers > 1.
+
+    Args:
+        rates: array of hourly emissions rates with shape (scenario, year, hour)
+        units: list of (function, arguments) of each work unit, where each
+            function takes the rates spec followed by the arguments
+        n_workers: number of worker processes (int), 1 to run in this process
+
+    Returns:
+        results: list of the results of each work unit, in order
+    """
+    shm, rates_spec = share_array(np.ascontiguousarray(rates))
+    try:
+        if n_workers > 1:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = [executor.submit(func, rates_spec, *args) for func, args in units]
+                results = [x.result() for x in futures]
+        else:
+            results = [func(rates_spec, *args) for func, args in units]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return results
+
+
+def parallel_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                    n_workers=1, rebound_kernels=None, potential_profiles=None,
+                    precision='float64', registry=None):
+    """
+    Runs the DR days averages of subcomponent b (without confidence
+    intervals) and the emissions impacts of subcomponent c, with a work unit
+    for each emissions scenario and DR plan.
+
+    Args:
+        em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+            rebound_kernels, potential_profiles, precision, registry: see subcomp_c_runall
+        n_workers: number of worker processes (int), 1 to run in this process
+
+    Returns:
+        df_seasonal_ave: output of seasonal_ave() in subcomponent b
+        df_annual_ave: output of annual_ave() in subcomponent b
+        cube: output of calc_results_cube() in subcomponent c
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+    if not isinstance(dr_hours,dict):
+        raise ValueError('Please input a dictionary for the dr_hours argument')
+    if not isinstance(n_workers,int) or n_workers < 1:
+        raise ValueError('Please input a positive integer for the n_workers argument')
+
+    inputs = stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info,
+                                  bins, seasons, rebound_kernels, potential_profiles, precision,
+                                  registry)
+
+    # Two work units for each scenario and DR plan, in a fixed order
+    units = []
+    for s_ind in range(len(inputs['scenarios'])):
+        for ind, binning in enumerate(bins):
+            day_flags = [get_dr_day_flags(dr_hours[binning+'_'+x]) for x in seasons[ind]]
+            day_flags.append(np.any(day_flags, axis=0))
+            cols = np.concatenate([x[4] for x in inputs['groups'] if x[0] == binning])
+            units.append((calc_unit_averages, (s_ind, np.array(day_flags, dtype=precision))))
+            units.append((calc_unit_impacts, (s_ind, inputs['load_shapes'][cols],
+                                              inputs['potential'][:, cols], inputs['months'])))
+    results = iter(run_work_units(inputs['rates'], units, n_workers))
+
+    # Merge the results in the order of the work units
+    report_hours = np.unique(em_rates['Report_Hour'].values)
+    impacts = np.empty(inputs['rates'].shape[:2] + (len(inputs['products']),), dtype=precision)
+    df_seasonal_ave = {binning+'_'+x: {} for ind, binning in enumerate(bins) \
+                       for x in seasons[ind]}
+    df_annual_ave = {binning: {} for binning in bins}
+    for s_ind, column_name in enumerate(inputs['scenarios']):
+        scenario_name = column_name.replace(' Emissions Rate Estimate', '')
+        for ind, binning in enumerate(bins):
+            averages = next(results)
+            for idx, season in enumerate(seasons[ind]):
+                df_seasonal_ave[binning+'_'+season][scenario_name] = \
+                    pd.DataFrame({'Report_Hour': report_hours, column_name: averages[idx]})
+            df_annual_ave[binning][scenario_name] = \
+                pd.DataFrame({'Report_Hour': report_hours, column_name: averages[-1]})
+
+            cols = np.concatenate([x[4] for x in inputs['groups'] if x[0] == binning])
+            impacts[s_ind][:, cols] = next(results)
+
+    return df_seasonal_ave, df_annual_ave, build_results_cube(impacts, inputs)
@@ -0,0 +1,304 @@
+"""
+portfolio_explorer.py
+
+Answers "what if only these DR products are deployed" questions for any
+subset (portfolio) of the products of a DR plan, beyond the fixed bin sums
+of the barchart.
+
+The yearly avoided emissions of each product, by scenario and season, are
+arranged once from a results cube into a matrix with a column per product.
+The impacts of a portfolio are then a matrix-vector product with its
+0/1 indicator vector, and a batch of portfolios is a single matrix product.
+Portfolios are represented as bitmasks over the products of a DR plan
+(bit i set if the i-th product is deployed), so that all combinations
+of up to k products can be enumerated and ranked in batches.
+Products that are alternative treatments of one product (e.g. ResTOU_shift
+and ResTOU_shed, see subcomponent a) are mutually exclusive, so portfolios
+with more than one of them are skipped.
+"""
+
+import itertools
+
+import pandas as pd
+import numpy as np
+
+PRODUCT_VARIANTS = ['_shift', '_shed']
+
+
+def get_exclusive_masks(products):
+    """
+    Finds the groups of products that are variants of the same product,
+    i.e. with the same name apart from a suffix in PRODUCT_VARIANTS
+    (e.g. ResTOU_shift and ResTOU_shed), of which a portfolio can
+    include at most one.
+
+    Args:
+        products: list of the products of a DR plan
+
+    Returns:
+        exclusive: array of int64 bitmasks, one for each group of
+            more than one variant
+    """
+    groups = {}
+    for ind, product in enumerate(products):
+        base = product
+        for suffix in PRODUCT_VARIANTS:
+            if product.endswith(suffix):
+                base = product[:-len(suffix)]
+        groups.setdefault(base, []).append(ind)
+
+    return np.array([sum(np.int64(1) << x for x in group) for group in groups.values() \
+                     if len(group) > 1], dtype=np.int64)
+
+
+def is_valid_mask(masks, exclusive):
+    """
+    Flags the portfolios with at most one variant of each product.
+
+    Args:
+        masks: array of int64 bitmasks of the portfolios
+        exclusive: output of get_exclusive_masks()
+
+    Returns:
+        valid: array of bools, one for each portfolio
+    """
+    masks = np.asarray(masks, dtype=np.int64)
+    valid = np.ones(len(masks), dtype=bool)
+    for group in exclusive:
+        shared = masks & group
+        # more than one bit set if clearing the lowest set bit leaves any
+        valid &= (shared & (shared - 1)) == 0
+
+    return valid
+
+
+def build_portfolio_explorer(cube):
+    """
+    Precomputes the yearly avoided emissions of each product of each
+    DR plan, by scenario and season, from a results cube.
+
+    Args:
+        cube: output of calc_results_cube() or build_results_cube()
+            in subcomponent c
+
+    Returns:
+        explorer: dictionary with
+            'coords': dictionary of the labels of the "Scenario",
+                "Season" and "Year" dimensions
+            'plans': dictionary with a dictionary for each DR plan of
+                'products': list of the products in the DR plan,
+                    the bit order of the portfolio bitmasks
+                'exclusive': bitmasks of the variants of each product,
+                    see get_exclusive_masks()
+                'impacts': array of yearly avoided emissions (metric tons
+                    CO2e) with shape (scenario, season, year, product),
+                    0 for seasons without the product
+    """
+    if not isinstance(cube,dict) or 'values' not in cube:
+        raise ValueError('Please input a results cube for the cube argument')
+
+    coords = cube['coords']
+    # A product is in one bin of a DR plan, so summing over bins adds zeros
+    values = np.where(cube['mask'][None, ..., None], cube['values'], 0)
+    values = values.sum(axis=3, dtype=np.float64).transpose(1, 0, 2, 4, 3)
+
+    plans = {}
+    for p_ind, plan in enumerate(coords['Plan']):
+        in_plan = cube['mask'][p_ind].any(axis=(0, 1))
+        products = list(np.array(coords['Product'])[in_plan])
+        plans[plan] = {'products': products,
+                       'exclusive': get_exclusive_masks(products),
+                       'impacts': np.ascontiguousarray(values[p_ind][..., in_plan])}
+
+    return {'coords': {x: list(coords[x]) for x in ['Scenario', 'Season', 'Year']},
+            'plans': plans}
+
+
+def get_portfolio_masks(explorer, plan, portfolios):
+    """
+    Converts portfolios given as lists of product names to bitmasks.
+
+    Args:
+        explorer: output of build_portfolio_explorer()
+        plan: DR plan (str), e.g. "oldbins"
+        portfolios: list of lists of product names
+
+    Returns:
+        masks: array of int64 bitmasks, one for each portfolio
+    """
+    products = explorer['plans'][plan]['products']
+    masks = np.zeros(len(portfolios), dtype=np.int64)
+    for ind, portfolio in enumerate(portfolios):
+        for product in portfolio:
+            if product not in products:
+                raise ValueError('Product '+str(product)+' is not in DR plan '+plan)
+            masks[ind] |= np.int64(1) << products.index(product)
+    if not is_valid_mask(masks, explorer['plans'][plan]['exclusive']).all():
+        raise ValueError('Portfolios can include only one variant of each product, e.g. '\
+                         +' or '.join(PRODUCT_VARIANTS))
+
+    return masks
+
+
+def get_mask_indicators(masks, n_products):
+    """
+    Unpacks bitmasks into 0/1 indicator vectors.
+
+    Args:
+        masks: array of int64 bitmasks
+        n_products: number of products (int) of the DR plan
+
+    Returns:
+        indicators: array of 0/1 floats with shape (portfolio, product)
+    """
+    masks = np.asarray(masks, dtype=np.int64)
+
+    return ((masks[:, None] >> np.arange(n_products)) & 1).astype(np.float64)
+
+
+def query_portfolios(explorer, plan, masks):
+    """
+    Calculates the yearly avoided emissions of a batch of portfolios
+    of a DR plan with one matrix product.
+
+    Args:
+        explorer: output of build_portfolio_explorer()
+        plan: DR plan (str), e.g. "oldbins"
+        masks: array of int64 bitmasks of the portfolios, see get_portfolio_masks()
+
+    Returns:
+        impacts: array of yearly avoided emissions (metric tons CO2e)
+            with shape (portfolio, scenario, season, year)
+    """
+    if plan not in explorer['plans']:
+        raise ValueError('Please input one of '+', '.join(explorer['plans'])\
+                         +' for the plan argument')
+    impacts = explorer['plans'][plan]['impacts']
+    indicators = get_mask_indicators(masks, impacts.shape[-1])
+
+    return np.matmul(indicators, impacts.reshape(-1, impacts.shape[-1]).T)\
+        .reshape((len(indicators),) + impacts.shape[:-1])
+
+
+def query_portfolio(explorer, plan, products):
+    """
+    Outputs the yearly avoided emissions of one portfolio of a DR plan.
+
+    Args:
+        explorer: output of build_portfolio_explorer()
+        plan: DR plan (str), e.g. "oldbins"
+        products: list of the product names in the portfolio
+
+    Returns:
+        df: dataframe with a "Year" column and a column of yearly avoided
+            emissions (metric tons CO2e) for each scenario and season,
+            named as e.g. "Baseline Winter"
+    """
+    impacts = query_portfolios(explorer, plan,
+                               get_portfolio_masks(explorer, plan, [products]))[0]
+    coords = explorer['coords']
+
+    df = pd.DataFrame(data=impacts.reshape(-1, impacts.shape[-1]).T,
+                      columns=[x+' '+y for x in coords['Scenario'] for y in coords['Season']])
+    df.insert(0, 'Year', np.array(coords['Year'], dtype=float))
+
+    return df
+
+
+def enumerate_portfolio_masks(n_products, max_size, batch_size=65536, exclusive=None):
+    """
+    Enumerates the bitmasks of all portfolios of 1 to max_size products,
+    in batches.
+
+    Args:
+        n_products: number of products (int) of the DR plan, at most 62
+        max_size: maximum number of products (int) in a portfolio
+        batch_size: maximum number of portfolios (int) in a batch
+        exclusive: optional output of get_exclusive_masks(), to skip
+            portfolios with more than one variant of a product
+
+    Returns:
+        generator of arrays of int64 bitmasks
+    """
+    if n_products > 62:
+        raise ValueError('Portfolios of more than 62 products are not supported')
+
+    bits = np.int64(1) << np.arange(n_products, dtype=np.int64)
+    for size in range(1, min(max_size, n_products)+1):
+        combinations = itertools.combinations(range(n_products), size)
+        while True:
+            batch = np.fromiter(itertools.chain.from_iterable(
+                itertools.islice(combinations, batch_size)), dtype=np.int64)
+            if len(batch) == 0:
+                break
+            masks = bits[batch.reshape(-1, size)].sum(axis=1)
+            if exclusive is not None:
+                masks = masks[is_valid_mask(masks, exclusive)]
+            yield masks
+
+
+def rank_portfolios(explorer, plan, max_size, scenario=None, season=None, top=10,
+                    batch_size=65536):
+    """
+    Ranks all portfolios of 1 to max_size products of a DR plan by their
+    total avoided emissions over all years, with at most one variant
+    of each product.
+
+    Args:
+        explorer: output of build_portfolio_explorer()
+        plan: DR plan (str), e.g. "oldbins"
+        max_size: maximum number of products (int) in a portfolio
+        scenario: emissions scenario (str), e.g. "Baseline",
+            defaults to the first scenario
+        season: season (str) to rank by, e.g. "Summer",
+            defaults to the sum over all seasons
+        top: number of portfolios (int) to output, ties in total avoided
+            emissions are broken by the smallest bitmask
+        batch_size: number of portfolios (int) evaluated per matrix product
+
+    Returns:
+        df: dataframe sorted by total avoided emissions, with columns
+            "Portfolio" (comma separated products), "Size", "Mask",
+            a column of total avoided emissions (metric tons CO2e) for each
+            season, and "Total" (the ranking value)
+    """
+    if plan not in explorer['plans']:
+        raise ValueError('Please input one of '+', '.join(explorer['plans'])\
+                         +' for the plan argument')
+    if not isinstance(max_size,int) or max_size < 1:
+        raise ValueError('Please input a positive integer for the max_size argument')
+    if not isinstance(top,int) or top < 1:
+        raise ValueError('Please input a positive integer for the top argument')
+
+    coords = explorer['coords']
+    products = explorer['plans'][plan]['products']
+    s_ind = 0 if scenario is None else coords['Scenario'].index(scenario)
+
+    # Total over years of each product by season, shape (product, season)
+    totals = explorer['plans'][plan]['impacts'][s_ind].sum(axis=1).T
+    weights = np.ones(len(coords['Season'])) if season is None \
+        else (np.array(coords['Season']) == season).astype(float)
+    if not weights.any():
+        raise ValueError('Season '+str(season)+' is not in the explorer')
+    objective = np.matmul(totals, weights)
+
+    best_masks = np.zeros(0, dtype=np.int64)
+    best_values = np.zeros(0)
+    for masks in enumerate_portfolio_masks(len(products), max_size, batch_size,
+                                           explorer['plans'][plan]['exclusive']):
+        values = np.matmul(get_mask_indicators(masks, len(products)), objective)
+        best_masks = np.concatenate([best_masks, masks])
+        best_values = np.concatenate([best_values, values])
+        # Sort by value, then by bitmask for ties, so that the cutoff is deterministic
+        keep = np.lexsort((best_masks, -best_values))[:top]
+        best_masks, best_values = best_masks[keep], best_values[keep]
+
+    indicators = get_mask_indicators(best_masks, len(products))
+
+    df = pd.DataFrame(data=np.matmul(indicators, totals), columns=coords['Season'])
+    df.insert(0, 'Portfolio', [', '.join(np.array(products)[x > 0]) for x in indicators])
+    df.insert(1, 'Size', indicators.sum(axis=1).astype(int))
+    df.insert(2, 'Mask', best_masks)
+    df['Total'] = best_values
+
+    return df
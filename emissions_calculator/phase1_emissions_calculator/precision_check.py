@@ -0,0 +1,105 @@
+"""
+precision_check.py
+
+Verifies a lower precision run of subcomponents b and c (e.g. float32,
+see PRECISIONS) against a float64 run, by reporting the maximum absolute
+and relative deviation of each output from its float64 values.
+"""
+
+import pandas as pd
+import numpy as np
+
+from emissions_parameters import PRECISIONS
+from subcomp_b_process_emissions_factors import subcomp_b_runall
+from subcomp_c_calculate_emissions import subcomp_c_runall
+
+
+def get_output_values(output):
+    """
+    Collects the numeric values of an output of subcomponent b or c,
+    e.g. a dataframe or a (nested) dictionary of dataframes.
+
+    Args:
+        output: dataframe, array, or dictionary of these
+
+    Returns:
+        values: 1-D float64 array of the values, in a fixed order
+    """
+    if isinstance(output, dict):
+        values = [get_output_values(output[x]) for x in output]
+        return np.concatenate(values) if values else np.zeros(0)
+    if isinstance(output, pd.DataFrame):
+        output = output.select_dtypes('number').values
+
+    return np.asarray(output, dtype=np.float64).ravel()
+
+
+def get_deviation(test, reference):
+    """
+    Outputs the maximum absolute and relative deviation of values
+    from reference values, ignoring NaN and relative deviations
+    from reference values of 0.
+
+    Args:
+        test: output of get_output_values() for the run to verify
+        reference: output of get_output_values() for the float64 run
+
+    Returns:
+        max_abs: maximum absolute deviation
+        max_rel: maximum relative deviation
+    """
+    if test.shape != reference.shape:
+        raise ValueError('The outputs to compare have different shapes')
+    deviation = np.abs(test - reference)
+    valid = ~np.isnan(deviation)
+    nonzero = valid & (reference != 0)
+
+    max_abs = deviation[valid].max() if valid.any() else 0.
+    max_rel = (deviation[nonzero]/np.abs(reference[nonzero])).max() if nonzero.any() else 0.
+
+    return max_abs, max_rel
+
+
+def precision_check_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                           year, precision='float32', rebound_kernels=None,
+                           potential_profiles=None):
+    """
+    Runs subcomponents b and c in float64 and in a lower precision,
+    and reports how far each output of the lower precision run is
+    from the float64 run.
+
+    Args:
+        em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+            rebound_kernels, potential_profiles: see subcomp_c_runall
+        year: year (int) of the all days averages, see subcomp_b_runall
+        precision: the precision (str) to verify, see PRECISIONS
+
+    Returns:
+        df_deviation: dataframe with columns "Output", "Max Absolute Deviation"
+            and "Max Relative Deviation", with a row for each output
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+    if precision not in PRECISIONS:
+        raise ValueError('Please input one of '+', '.join(PRECISIONS)\
+                         +' for the precision argument')
+
+    scenario_list = [x.replace(' Emissions Rate Estimate', '') for x in em_rates.columns[4:]]
+    outputs = {}
+    for run_precision in ['float64', precision]:
+        outputs[run_precision] = \
+            subcomp_b_runall(bins, seasons, scenario_list, em_rates, dr_hours, year,
+                             precision=run_precision) \
+            + subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins,
+                               seasons, rebound_kernels, potential_profiles, run_precision)
+
+    names = ['DR days seasonal averages', 'DR days annual averages', 'All days averages',
+             'Month x hour averages', 'Yearly avoided emissions', 'Total avoided emissions',
+             'Bin 1 total avoided emissions']
+    rows = []
+    for idx, name in enumerate(names):
+        rows.append([name] + list(get_deviation(get_output_values(outputs[precision][idx]),
+                                                get_output_values(outputs['float64'][idx]))))
+
+    return pd.DataFrame(data=rows, columns=['Output', 'Max Absolute Deviation',
+                                            'Max Relative Deviation'])
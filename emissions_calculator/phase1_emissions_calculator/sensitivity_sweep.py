@@ -0,0 +1,174 @@
+"""
+sensitivity_sweep.py
+
+Runs a sensitivity sweep of the emissions impacts calculated in
+subcomponent c over a grid of parameters (see SWEEP_DEFAULTS):
+scalings of the DR potential and emissions rates, the fraction of
+event load shifted by DR shift products, and moving the start of
+every DR event by a number of hours.
+
+The emissions rates, DR hours and DR potential are aligned once, the
+rates are summed against the DR hours and rebound hours once for each
+event start shift, and every grid point is then evaluated in one
+vectorized batch. Emissions scenarios are swept by including several
+scenarios in the emissions rates, as in subcomponent c.
+
+Outputs one tidy table of avoided emissions (metric tons CO2e)
+for each parameter combination.
+"""
+
+import itertools
+
+import pandas as pd
+import numpy as np
+
+from emissions_parameters import EMISSIONS_CHANGEUNITS, SWEEP_DEFAULTS
+from subcomp_c_calculate_emissions import stack_impacts_inputs, get_column_labels
+
+
+def get_sweep_grid(parameter_grid):
+    """
+    Expands a parameter grid into every combination of parameter values,
+    with parameters not given held at their SWEEP_DEFAULTS values.
+
+    Args:
+        parameter_grid: dictionary with a list of values for each parameter
+            to sweep, e.g. {'potential_scale': [0.9, 1, 1.1], 'start_shift': [-1, 0, 1]}
+
+    Returns:
+        grid: dataframe with a column for each parameter
+            and a row for each parameter combination
+    """
+    if not isinstance(parameter_grid,dict):
+        raise ValueError('Please input a dictionary for the parameter_grid argument')
+    unknown = [x for x in parameter_grid if x not in SWEEP_DEFAULTS]
+    if unknown:
+        raise ValueError('Unknown sweep parameters: '+', '.join(unknown)\
+                         +'. Use '+', '.join(SWEEP_DEFAULTS))
+
+    values = [list(np.atleast_1d(parameter_grid.get(x, SWEEP_DEFAULTS[x]))) \
+              for x in SWEEP_DEFAULTS]
+    grid = pd.DataFrame(data=list(itertools.product(*values)), columns=list(SWEEP_DEFAULTS))
+    if not np.array_equal(grid['start_shift'], grid['start_shift'].astype(int)):
+        raise ValueError('start_shift values must be whole numbers of hours')
+    grid['start_shift'] = grid['start_shift'].astype(int)
+
+    return grid
+
+
+def calc_shifted_sums(inputs, start_shifts):
+    """
+    Sums the hourly emissions rates against the DR hours and against
+    the rebound hours of shift products, with every DR event moved by
+    each number of hours. Moved hours outside the year wrap around
+    to the other end of the year, as for the rebound hours.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        start_shifts: list of hours (int) to move the DR events
+
+    Returns:
+        dispatch: array with shape (start shift, scenario, year, product)
+            of emissions rates summed over the DR hours
+        rebound: array with the same shape of emissions rates
+            summed over the rebound hours
+    """
+    hours = inputs['hours']
+    rebound_hours = inputs['load_shapes'] - hours
+
+    # Moving the DR hours k hours later is the same as moving the rates k hours earlier
+    rates = np.stack([np.roll(inputs['rates'], -k, axis=-1) for k in start_shifts])
+
+    return np.matmul(rates, hours.T), np.matmul(rates, rebound_hours.T)
+
+
+def calc_sweep_impacts(inputs, grid):
+    """
+    Calculates the avoided emissions of every grid point in one batch.
+
+    Args:
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        grid: output of get_sweep_grid()
+
+    Returns:
+        impacts: array of yearly avoided emissions with shape
+            (grid point, scenario, year, product)
+    """
+    start_shifts, shift_idx = np.unique(grid['start_shift'].values, return_inverse=True)
+    dispatch, rebound = calc_shifted_sums(inputs, start_shifts)
+
+    def as_4d(column):
+        return grid[column].values.astype(float)[:, None, None, None]
+
+    impacts = dispatch[shift_idx] + rebound[shift_idx]*as_4d('shift_fraction')
+
+    return impacts * as_4d('rate_scale') * as_4d('potential_scale') \
+        * inputs['potential'] * EMISSIONS_CHANGEUNITS
+
+
+def get_sweep_table(impacts, inputs, grid, sum_years=False):
+    """
+    Formats the sweep impacts into one tidy table.
+
+    Args:
+        impacts: output of calc_sweep_impacts()
+        inputs: output of stack_impacts_inputs() in subcomponent c
+        grid: output of get_sweep_grid()
+        sum_years: True to sum the avoided emissions over all years
+
+    Returns:
+        table: dataframe with the parameter columns of grid, "Scenario",
+            "Plan", "Season", "Bin", "Product", "Year" (unless sum_years)
+            and "Avoided Emissions", with a row for each grid point,
+            scenario, product (and year)
+    """
+    if sum_years:
+        impacts = impacts.sum(axis=2, keepdims=True)
+    npoints, nscenarios, nyears, nproducts = impacts.shape
+    g_idx, s_idx, p_idx, y_idx = [x.ravel() for x in np.meshgrid(
+        np.arange(npoints), np.arange(nscenarios), np.arange(nproducts),
+        np.arange(nyears), indexing='ij')]
+
+    scenarios = np.array([x.replace(' Emissions Rate Estimate', '') \
+                          for x in inputs['scenarios']])
+    table = pd.concat([grid.iloc[g_idx].reset_index(drop=True),
+                       get_column_labels(inputs).iloc[p_idx].reset_index(drop=True)], axis=1)
+    table.insert(len(grid.columns), 'Scenario', scenarios[s_idx])
+    if not sum_years:
+        table['Year'] = inputs['years'][y_idx].astype(float)
+    table['Avoided Emissions'] = impacts[g_idx, s_idx, y_idx, p_idx]
+
+    return table
+
+
+def sensitivity_sweep_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                             parameter_grid, sum_years=False,
+                             rebound_kernels=None, potential_profiles=None):
+    """
+    Runs the sensitivity sweep of the emissions impacts.
+
+    Args:
+        em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+            rebound_kernels, potential_profiles: see subcomp_c_runall
+        parameter_grid: dictionary with a list of values for each parameter
+            to sweep (see get_sweep_grid)
+        sum_years: True to sum the avoided emissions over all years
+
+    Returns:
+        table: output of get_sweep_table()
+    """
+    if not isinstance(em_rates,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the em_rates argument')
+    if not isinstance(dr_hours,dict):
+        raise ValueError('Please input a dictionary for the dr_hours argument')
+    if not isinstance(dr_potential,dict):
+        raise ValueError('Please input a dictionary for the dr_potential argument')
+    if not isinstance(dr_product_info,dict):
+        raise ValueError('Please input a dictionary for the dr_product_info argument')
+
+    grid = get_sweep_grid(parameter_grid)
+    inputs = stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info,
+                                  bins, seasons, rebound_kernels, potential_profiles)
+    impacts = calc_sweep_impacts(inputs, grid)
+
+    return get_sweep_table(impacts, inputs, grid, sum_years)
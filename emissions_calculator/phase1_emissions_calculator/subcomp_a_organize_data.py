@@ -7,7 +7,11 @@ DR implementation hours, and DR potential.
 Returns dataframe for emissions factors,
 and dictionaries of dataframes for DR hours and potential.
 Also returns a product lookup dataframe that gives the bin,
-seasonality, and shift/shed for each product.
+seasonality, and shift/shed for each product, and an indexed product
+registry for constant-time lookups of the products of each bin and
+the bin, shift/shed, and DR hours column of each product.
+
+Optionally reads hour-varying multipliers of DR potential for each product.
 """
 from os import path
 
@@ -47,6 +51,18 @@ def checkarglists(**kwargs):
                     if not isinstance(item,str):
                         raise ValueError('Argument lists must contain strings')
 
+def is_leap_year(year):
+    """
+    Checks if years are leap years under the Gregorian calendar,
+    i.e. divisible by 4, except centuries not divisible by 400.
+
+    Args:
+        year: year (int) or array of years
+    Returns:
+        True for leap years, False otherwise (bool or array of bool)
+    """
+    return (np.mod(year, 4) == 0) & ((np.mod(year, 100) != 0) | (np.mod(year, 400) == 0))
+
 def create_emissions_rates_df(emissions_rates_files,
                               emissions_scenario_list):
     """
@@ -113,7 +129,7 @@ def create_emissions_rates_df(emissions_rates_files,
     years = emissions_rates_df['Report_Year']
 
     for year in range(years.min(),years.max()+1):
-        if year%4==0:
+        if is_leap_year(year):
             nhour = 366*24
         else:
             nhour = 365*24
@@ -133,7 +149,11 @@ def create_dr_hours_df_dict(dr_hrs_files, dr_name, dr_seasons):
     Creates a dictionary of dataframes with each dataframe
     corresponding to a given DR plan and season within that plan.
 
-    Note that subcomp_c will insert values of -1 for hours with shifted
+    DR products are either 1-or-0 flags of DR implementation,
+    or floats between 0 and 1 for the fraction of DR potential
+    dispatched in each hour, e.g. to ramp in and out of an event.
+
+    Note that subcomp_c will insert negative values for hours with shifted
     load for shift products.
 
     Args:
@@ -174,14 +194,19 @@ def create_dr_hours_df_dict(dr_hrs_files, dr_name, dr_seasons):
             if dr_hours_df_dict[dict_key].isnull().values.any():
                 raise ValueError('DR hours contain null values for '+dict_key)
 
-            for column in dr_hours_df_dict[dict_key].columns:
-                if not dr_hours_df_dict[dict_key][column].dtypes == np.int64:
-                    raise ValueError('DR hours are not type int for '+dict_key)
-
             expected_cols = ['hourID','Month','Day']
             for column in expected_cols:
                 if not column in dr_hours_df_dict[dict_key].columns:
                     raise ValueError('DR hours are missing column ' + column + ' for ' + dict_key)
+                if not dr_hours_df_dict[dict_key][column].dtypes == np.int64:
+                    raise ValueError('DR hours are not type int for '+dict_key)
+
+            # DR products can be 0/1 flags or fractions of DR potential dispatched
+            for column in dr_hours_df_dict[dict_key].columns[len(expected_cols):]:
+                if not dr_hours_df_dict[dict_key][column].dtypes in [np.int64, np.float64]:
+                    raise ValueError('DR hours are not type int or float for '+dict_key)
+                if not dr_hours_df_dict[dict_key][column].between(0, 1).all():
+                    raise ValueError('DR hours are not between 0 and 1 for '+dict_key)
 
             if len(dr_hours_df_dict[dict_key].columns) < (len(expected_cols) + 1):
                 raise ValueError('DR hours are missing DR product column for ' + dict_key)
@@ -362,9 +387,148 @@ def create_product_info_df_dict(dr_potential_files, dr_name):
     return dr_product_info_df_dict
 
 
+def create_product_registry(dr_product_info_df_dict, dr_hours_df_dict=None):
+    """
+    Indexes the DR product info of every DR plan into a registry, so that
+    the bin, seasonality, and shift/shed of a product, the products of a bin,
+    and the column of a product in the DR hours are found with dictionary
+    lookups rather than filtering the product info dataframes.
+
+    Args:
+        dr_product_info_df_dict: dictionary of DR product info dataframes
+        dr_hours_df_dict: optional dictionary of DR hours dataframes
+    Returns:
+        registry: dictionary with
+            'records': dataframe with a row for each DR plan and product,
+                with columns Plan, Product, Bin, Bin Number, Seasonality and Shift
+            'products': dictionary of the record (dict) of each (plan, product)
+            'bin_products': dictionary for each DR plan of the list of products
+                in each bin (e.g. 'Bin 1'), in product info order
+            'column_index': dictionary for each DR plan and season
+                (e.g. 'oldbins_Winter') of the column index of each
+                column in the DR hours dataframe
+    """
+    records = []
+    products = {}
+    bin_products = {}
+    for drname, df_info in dr_product_info_df_dict.items():
+        bin_products[drname] = {}
+        for product, bin_name, seasonality, shift_shed in zip(df_info['Product'], \
+                df_info['Bin'], df_info['Seasonality'], df_info['Shift or Shed?']):
+            record = {'Plan': drname, 'Product': product, 'Bin': bin_name,
+                      'Bin Number': int(bin_name.split()[1]), 'Seasonality': seasonality,
+                      'Shift': shift_shed == 'Shift'}
+            records.append(record)
+            products[(drname, product)] = record
+            bin_products[drname].setdefault(bin_name, []).append(product)
+
+    column_index = {}
+    if dr_hours_df_dict is not None:
+        for dict_key, df_hours in dr_hours_df_dict.items():
+            column_index[dict_key] = {x: idx for idx, x in enumerate(df_hours.columns)}
+
+    registry = {'records': pd.DataFrame(records, columns=['Plan', 'Product', 'Bin', \
+                    'Bin Number', 'Seasonality', 'Shift']),
+                'products': products,
+                'bin_products': bin_products,
+                'column_index': column_index}
+    return registry
+
+
+def get_bin_products(registry, drname, dr_names):
+    """
+    Groups a list of DR products of a DR plan by bin, with registry lookups.
+
+    Args:
+        registry: output of create_product_registry()
+        drname: the name of the DR plan (str)
+        dr_names: list of DR products (str) of the DR plan
+    Returns:
+        out_dict: dictionary with bin names (e.g. 'Bin 1') as keys, in order of
+                  first appearance in dr_names, and lists of DR products as values
+    """
+    out_dict = {}
+    for dr_name in dr_names:
+        out_dict.setdefault(registry['products'][(drname, dr_name)]['Bin'], []).append(dr_name)
+
+    return out_dict
+
+
+def create_potential_profile_dict(dr_profile_files, dr_name):
+    """
+    Reads in optional Excel files with multipliers of DR potential that vary
+    by hour, e.g. because air conditioning and water heating loads vary.
+    Each file has a 'PotentialProfile' sheet with columns 'Month' and
+    'hourID' (12 x 24 = 288 rows), or 'hourID', 'Month' and 'Day'
+    (8760 rows, one for each hour of the year), and a column of
+    multipliers for each DR product. Products without a column keep
+    the flat DR potential.
+
+    Args:
+        dr_profile_files: list of potential profile files (str) for each DR plan,
+                          or None for DR plans with flat DR potential
+        dr_name: list of the names of each DR plan (str)
+    Returns:
+        dr_profile_df_dict: dictionary of potential profile dataframes
+                            for each DR plan with a profile file
+    """
+    dr_profile_df_dict = {}
+
+    # check if arguments are lists with matching sizes
+    checkarglists(dr_name = dr_name)
+    if not isinstance(dr_profile_files, list) or len(dr_profile_files) != len(dr_name):
+        raise ValueError('The lists for the arguments dr_profile_files and dr_name '\
+                         'are not the same length.')
+
+    for idx, file_name in enumerate(dr_profile_files):
+
+        if file_name is None:
+            continue
+        drname = dr_name[idx]
+
+        # check file and sheet exists and read file
+        if not path.exists(file_name):
+            raise ValueError('DR potential profile file does not exist')
+        xlsx = pd.ExcelFile(file_name)
+        if not 'PotentialProfile' in xlsx.sheet_names:
+            raise ValueError('DR potential profile file does not contain sheet: PotentialProfile')
+        df_profile = pd.read_excel(xlsx, 'PotentialProfile')
+
+        # check df_profile data makes sense
+        expected_cols = ['hourID', 'Month', 'Day'] if 'Day' in df_profile.columns \
+            else ['Month', 'hourID']
+        for column in expected_cols:
+            if not column in df_profile.columns:
+                raise ValueError('DR potential profile is missing column ' + column \
+                                 + ' for ' + drname)
+        if len(df_profile.columns) < (len(expected_cols) + 1):
+            raise ValueError('DR potential profile is missing DR product column for ' + drname)
+        if df_profile.isnull().values.any():
+            raise ValueError('DR potential profile contains null values for ' + drname)
+        for column in df_profile.columns.drop(expected_cols):
+            if not df_profile[column].dtypes in [np.int64, np.float64]:
+                raise ValueError('DR potential profile is not type float for ' + drname)
+            if (df_profile[column] < 0).any():
+                raise ValueError('DR potential profile is negative for ' + drname)
+        nrow = 365*24 if 'Day' in expected_cols else 12*24
+        if not np.isclose(len(df_profile), nrow):
+            raise ValueError('DR potential profile contains wrong number of hours = ' \
+                             + str(len(df_profile)))
+
+        # for new bins resTOU, copy profile for resTOU_shift and resTOU_shed
+        if drname == 'newbins' and 'ResTOU' in df_profile.columns:
+            df_profile['ResTOU_shed'] = df_profile['ResTOU']
+            df_profile = df_profile.rename(columns={'ResTOU': 'ResTOU_shift'})
+
+        dr_profile_df_dict[drname] = df_profile
+
+    return dr_profile_df_dict
+
+
 ################# Main ####################
 def subcomp_a_runall(emissions_rates_files, emissions_scenario_list,
-                     dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products):
+                     dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products,
+                     return_registry=False):
     """
     Runs through all of the above functions to output dataframes or
     dictionaries of dataframes for emissions rates, DR hours, DR potential,
@@ -382,11 +546,15 @@ def subcomp_a_runall(emissions_rates_files, emissions_scenario_list,
         dr_potential_files: list of DR potential files (str) for each DR plan
         subset_products: array containing a list of the DR products to subset
                          for each DR plan (str), or a [0] if all DR products are included
+        return_registry: whether to also return the product registry
     Returns:
         emissions_rates_df_out: the emissions rates dataframe
         dr_hours_df_dict_out: dictionary of DR hours dataframes
         dr_pot_df_dict_out: dictionary of DR potential dataframes
         dr_product_info_df_dict_out: dictionary of DR product info dataframes
+        registry: if return_registry, the output of create_product_registry()
+                  for the DR product info and DR hours, to pass to
+                  subcomponents b-d rather than rebuilding it
     """
     emissions_rates_df_out = create_emissions_rates_df(emissions_rates_files,
                                                        emissions_scenario_list)
@@ -396,5 +564,10 @@ def subcomp_a_runall(emissions_rates_files, emissions_scenario_list,
     dr_product_info_df_dict_out = create_product_info_df_dict(dr_potential_files,
                                                               dr_name)
 
+    if return_registry:
+        registry = create_product_registry(dr_product_info_df_dict_out, dr_hours_df_dict_out)
+        return emissions_rates_df_out, dr_hours_df_dict_out, \
+               dr_potential_df_dict_out, dr_product_info_df_dict_out, registry
+
     return emissions_rates_df_out, dr_hours_df_dict_out, \
            dr_potential_df_dict_out, dr_product_info_df_dict_out
@@ -10,15 +10,34 @@ only for days with DR, averaged 2022-2041.
 Also return seasonal and annual emissions rates averages
 for all days in a given year (e.g. 2022),
 which will be shown on the general public page.
+
+Also return hourly emissions rates averages stratified by day type
+(weekday, weekend, holiday) and for the peak days of each year
+(optionally from subcomp_b_runall),
+month x hour averages of the emissions rates
+for every year, for the dashboard to slice into heatmaps,
+and potential-weighted effective emissions rates for each
+DR plan, season, and bin, for each year.
+
+Also return the best DR event window of each day, i.e. the start hour
+of the window of hours with the highest sum of emissions rates,
+and how far the DR hours of each product are from it in each season.
+
+The emissions rates can be processed in float32 rather than float64
+(see set_precision).
 """
 
+import numpy as np
 import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
 
-from emissions_parameters import SEASONS_ALLDAYS
+from emissions_parameters import SEASONS_ALLDAYS, SEASON_MONTHS, DAY_TYPES, DAYS_IN_MONTH, \
+    PRECISIONS
+from subcomp_a_organize_data import is_leap_year, create_product_registry, get_bin_products
 
 
 def seasonal_ave(dr_name, dr_seasons, emissions_scenario_list,
-                 emissions_rates_df_out, dr_hours_df_dict_out):
+                 emissions_rates_df_out, dr_hours_df_dict_out, n_boot=0, seed=None):
     """
     Compute seasonal averages of hourly emissions for DR days
     for each DR plan and season and each emissions scenario.
@@ -31,6 +50,9 @@ def seasonal_ave(dr_name, dr_seasons, emissions_scenario_list,
                                  with emissions rates files
         emissions_rates_df_out: the emissions rates dataframe
         dr_hours_df_dict_out: dictionary of DR hours dataframes
+        n_boot: number of bootstrap resamples for confidence intervals (int),
+                or 0 for no confidence intervals
+        seed: seed for the bootstrap random number generator
 
     Returns:
         df_seasonal_ave: dictionary of seasonal emissions rates averages
@@ -53,16 +75,22 @@ def seasonal_ave(dr_name, dr_seasons, emissions_scenario_list,
             for scenario_name in emissions_scenario_list:
 
                 column_name = scenario_name + ' Emissions Rate Estimate'
-                df_seasonal_ave[dict_key][scenario_name] = \
-                    get_hour_ave(emissions_rates_df_out,
-                                 dr_hours_df_dict_out[dict_key],
-                                 column_name)
+                if n_boot > 0:
+                    df_seasonal_ave[dict_key][scenario_name] = \
+                        get_hour_ave_ci(emissions_rates_df_out,
+                                        dr_hours_df_dict_out[dict_key],
+                                        column_name, n_boot, seed=seed)
+                else:
+                    df_seasonal_ave[dict_key][scenario_name] = \
+                        get_hour_ave(emissions_rates_df_out,
+                                     dr_hours_df_dict_out[dict_key],
+                                     column_name)
 
     return df_seasonal_ave
 
 
 def annual_ave(dr_name, dr_seasons, emissions_scenario_list,
-               emissions_rates_df_out, dr_hours_df_dict_out):
+               emissions_rates_df_out, dr_hours_df_dict_out, n_boot=0, seed=None):
     """
     Compute annual averages of hourly emissions for DR days
     for each DR plan and each emissions scenario.
@@ -75,6 +103,9 @@ def annual_ave(dr_name, dr_seasons, emissions_scenario_list,
                                  with emissions rates files
         emissions_rates_df_out: the emissions rates dataframe
         dr_hours_df_dict_out: dictionary of DR hours dataframes
+        n_boot: number of bootstrap resamples for confidence intervals (int),
+                or 0 for no confidence intervals
+        seed: seed for the bootstrap random number generator
 
     Returns:
     df_annual_ave: a dictionary of annual emissions rates averages
@@ -107,8 +138,13 @@ def annual_ave(dr_name, dr_seasons, emissions_scenario_list,
 
         for scenario_name in emissions_scenario_list:
             column_name = scenario_name + ' Emissions Rate Estimate'
-            df_annual_ave[drname][scenario_name] = \
-                get_hour_ave(emissions_rates_df_out, dr_hours_df, column_name)
+            if n_boot > 0:
+                df_annual_ave[drname][scenario_name] = \
+                    get_hour_ave_ci(emissions_rates_df_out, dr_hours_df,
+                                    column_name, n_boot, seed=seed)
+            else:
+                df_annual_ave[drname][scenario_name] = \
+                    get_hour_ave(emissions_rates_df_out, dr_hours_df, column_name)
 
     return df_annual_ave
 
@@ -127,23 +163,84 @@ def get_hour_ave(emissions_data, dr_hours, column_name):
     Returns:
         hourly average emissions rates for DR days
     """
-    df_cp = emissions_data
+    df_2 = get_dr_days_data(emissions_data, dr_hours)
+
+    # Compute daily average
+    return df_2.groupby(['Report_Hour'])[column_name].mean().reset_index()
 
+
+def get_dr_days_data(emissions_data, dr_hours):
+    """
+    Select the rows of the emissions rates for days with DR hours.
+
+    Called in get_hour_ave(), get_hour_ave_ci()
+
+    Args:
+        emissions_data: dataframe with hourly emissions rates
+        dr_hours: dataframe with hours of DR implementation
+    Returns:
+        emissions rates dataframe for DR days only
+    """
     # Group by month and day
     # Sum product column
-    # Select (sum>=1), got DR days!
+    # Select (sum>0), got DR days!
     df_1 = dr_hours.groupby(['Month', 'Day'])['DVR'].sum().reset_index()
-    df_1 = df_1[df_1['DVR'] >= 1]
+    df_1 = df_1[df_1['DVR'] > 0]
 
     # Combine month and day together
-    df_1['month_day'] = df_1['Month']*100 + df_1['Day']
-    df_cp['month_day'] = df_cp['Report_Month']*100 + df_cp['Report_Day']
+    dr_month_day = df_1['Month']*100 + df_1['Day']
+    month_day = emissions_data['Report_Month']*100 + emissions_data['Report_Day']
 
     # Select DR days in emission rates dataset
-    df_2 = df_cp[df_cp['month_day'].isin(df_1['month_day'])]
+    return emissions_data[month_day.isin(dr_month_day)]
 
-    # Compute daily average
-    return df_2.groupby(['Report_Hour'])[column_name].mean().reset_index()
+
+def get_hour_ave_ci(emissions_data, dr_hours, column_name,
+                    n_boot=2000, ci_level=95, seed=None):
+    """
+    Select DR hour days and return hourly average emissions rates
+    with bootstrap confidence intervals, by resampling DR days
+    with replacement.
+
+    All resamples are drawn at once as an index matrix of shape
+    (resample, day), which gathers from a (day, hour) array of rates.
+    The gather is done in chunks of resamples to keep memory bounded.
+
+    Called in seasonal_ave(), annual_ave() when n_boot > 0
+
+    Args:
+        emissions_data: dataframe with hourly emissions rates
+        dr_hours: dataframe with hours of DR implementation
+        column_name: name (str) of emissions rates column in emissions_data
+        n_boot: number of bootstrap resamples (int)
+        ci_level: confidence level of the intervals in percent
+        seed: seed for the random number generator, for reproducible intervals
+    Returns:
+        hourly average emissions rates for DR days,
+        with columns for the lower and upper confidence bounds
+    """
+    df_2 = get_dr_days_data(emissions_data, dr_hours).sort_values(
+        ['Report_Year', 'Report_Month', 'Report_Day', 'Report_Hour'])
+    hours = np.unique(df_2['Report_Hour'].values)
+    day_hour = df_2[column_name].values.reshape(-1, len(hours))
+    ndays = day_hour.shape[0]
+
+    rng = np.random.default_rng(seed)
+    resample_idx = rng.integers(0, ndays, size=(n_boot, ndays))
+
+    # keep each gathered chunk to about 2**23 values
+    chunk = max(1, 2**23//(ndays*len(hours)))
+    boot_ave = np.empty((n_boot, len(hours)))
+    for start in range(0, n_boot, chunk):
+        boot_ave[start:start+chunk] = day_hour[resample_idx[start:start+chunk]].mean(axis=1)
+
+    lower, upper = np.percentile(boot_ave, [(100-ci_level)/2, (100+ci_level)/2], axis=0)
+
+    df_out = pd.DataFrame({'Report_Hour': hours, column_name: day_hour.mean(axis=0)})
+    df_out[column_name + ' Lower'] = lower
+    df_out[column_name + ' Upper'] = upper
+
+    return df_out
 
 
 def alldays_oneyear_seasonal_ave(emissions_scenario_list,
@@ -201,19 +298,10 @@ def get_oneyear_hour_ave(emissions_data, season, column_name, year):
     """
     df_cp = emissions_data
 
-    # Month range for different seasons are defined as follows:
-    if season == 'Winter':
-        month = [1, 2, 3]
-    elif season == 'Spring':
-        month = [4, 5, 6]
-    elif season == 'Summer':
-        month = [7, 8, 9]
-    elif season == 'Fall':
-        month = [10, 11, 12]
-    elif season == 'Annual':
-        month = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
-    else:
+    # Month range for different seasons are defined in SEASON_MONTHS
+    if not season in SEASON_MONTHS:
         raise ValueError('Time period unavailable!')
+    month = SEASON_MONTHS[season]
 
     if not year in df_cp['Report_Year'].tolist():
         raise ValueError('Year unavailable!')
@@ -226,8 +314,513 @@ def get_oneyear_hour_ave(emissions_data, season, column_name, year):
     return df_2.groupby(['Report_Hour'])[column_name].mean().reset_index()
 
 
+def get_day_labels(emissions_data):
+    """
+    Precompute the calendar of days in the emissions rates
+    and an integer label for the day type of each day,
+    where 0 = weekday, 1 = weekend, 2 = holiday (US federal holidays),
+    following the order of DAY_TYPES.
+
+    Called in stratified_hour_ave()
+
+    Args:
+        emissions_data: dataframe with hourly emissions rates
+    Returns:
+        days: dataframe with Report_Year, Report_Month, Report_Day for each day
+        day_idx: index (int) of the day of each row in emissions_data
+        day_type: day type label (int) for each day
+    """
+    day_key = emissions_data['Report_Year'].values*10000 \
+        + emissions_data['Report_Month'].values*100 + emissions_data['Report_Day'].values
+    day_keys, day_idx = np.unique(day_key, return_inverse=True)
+
+    days = pd.DataFrame({'Report_Year': day_keys//10000,
+                         'Report_Month': day_keys//100 % 100,
+                         'Report_Day': day_keys % 100})
+    dates = pd.to_datetime(pd.DataFrame({'year': days['Report_Year'],
+                                         'month': days['Report_Month'],
+                                         'day': days['Report_Day']}))
+    holidays = USFederalHolidayCalendar().holidays(dates.min(), dates.max())
+
+    day_type = (dates.dt.dayofweek.values >= 5).astype(int)
+    day_type[dates.isin(holidays).values] = 2
+
+    return days, day_idx, day_type
+
+
+def stratified_hour_ave(emissions_scenario_list, emissions_rates_df_out,
+                        season='Annual', year=None, top_n=10):
+    """
+    Compute hourly averages of emissions rates stratified by day type
+    (weekday, weekend, holiday), and for the top_n days of each year
+    with the highest daily average emissions rate.
+
+    Every stratum is a set of day-level labels, so all strata are
+    averaged together in one matrix product of a (stratum, day) weight
+    matrix with the (day, hour) array of emissions rates.
+
+    Args:
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+        season: season (str) to calculate averages over
+        year: year (int) to calculate averages over,
+              or None to average over all years
+        top_n: number of peak days (int) in each year
+    Returns:
+        df_stratified_ave: dictionary of stratified hourly average emissions rates
+                           for each emissions scenario
+
+    Access output by:
+    df_stratified_ave=stratified_hour_ave()
+
+    Output example:
+    df_stratified_ave['Baseline']
+    """
+    if not season in SEASON_MONTHS:
+        raise ValueError('Time period unavailable!')
+    if year is not None and not year in emissions_rates_df_out['Report_Year'].tolist():
+        raise ValueError('Year unavailable!')
+    df_stratified_ave = {}
+    if not emissions_scenario_list:
+        return df_stratified_ave
+
+    columns = [x + ' Emissions Rate Estimate' for x in emissions_scenario_list]
+    days, day_idx, day_type = get_day_labels(emissions_rates_df_out)
+    hours, hour_idx = np.unique(emissions_rates_df_out['Report_Hour'].values,
+                                return_inverse=True)
+
+    # (scenario, day, hour) array of emissions rates
+    day_hour = np.full((len(columns), len(days), len(hours)), np.nan)
+    day_hour[:, day_idx, hour_idx] = emissions_rates_df_out[columns].values.T
+
+    selected = days['Report_Month'].isin(SEASON_MONTHS[season]).values
+    if year is not None:
+        selected = selected & (days['Report_Year'].values == year)
+
+    # rank selected days within each year by daily average emissions rate
+    day_year = days['Report_Year'].values
+    daily_ave = np.where(selected, day_hour.mean(axis=2), -np.inf)
+    peak_day = np.zeros(daily_ave.shape, dtype=bool)
+    year_start = np.searchsorted(day_year, day_year)
+    for s_idx in range(len(columns)):
+        order = np.lexsort((-daily_ave[s_idx], day_year))
+        rank = np.empty(len(days), dtype=int)
+        rank[order] = np.arange(len(days)) - year_start[order]
+        peak_day[s_idx] = selected & (rank < top_n)
+
+    # (scenario, stratum, day) weights of each day in each stratum
+    type_weights = (day_type[None, :] == np.arange(len(DAY_TYPES))[:, None]) & selected
+    weights = np.concatenate([np.broadcast_to(type_weights, (len(columns),) + type_weights.shape),
+                              peak_day[:, None, :]], axis=1).astype(float)
+    with np.errstate(invalid='ignore'):
+        strata_ave = np.matmul(weights, day_hour)/weights.sum(axis=2)[:, :, None]
+
+    strata_names = DAY_TYPES + ['Top ' + str(top_n) + ' Days']
+    for s_idx, scenario_name in enumerate(emissions_scenario_list):
+        df_out = pd.DataFrame(strata_ave[s_idx].T, columns=strata_names)
+        df_out.insert(0, 'Report_Hour', hours)
+        df_stratified_ave[scenario_name] = df_out
+
+    return df_stratified_ave
+
+
+def alldays_stratified_ave(emissions_scenario_list, emissions_rates_df_out, top_n=10):
+    """
+    Compute the stratified hourly averages of emissions rates
+    (see stratified_hour_ave) of all days over the full period
+    for each season, including the annual averages.
+
+    Args:
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+        top_n: number of peak days (int) in each year
+    Returns:
+        df_stratified_ave: dictionary of stratified hourly average emissions rates
+                           for each season and emissions scenario
+
+    Access output by:
+    df_stratified_ave=alldays_stratified_ave()
+
+    Output example:
+    df_stratified_ave['Winter']['Baseline']
+    """
+    return {season: stratified_hour_ave(emissions_scenario_list, emissions_rates_df_out,
+                                        season, None, top_n) for season in SEASONS_ALLDAYS}
+
+
+def month_hour_ave(emissions_scenario_list, emissions_rates_df_out):
+    """
+    Compute the average emissions rate for every
+    (scenario, year, month, hour) combination.
+
+    The averages are computed in a single bincount over a calendar index
+    of all scenarios, years, months and hours, rather than
+    a filtered groupby for each combination.
+
+    Args:
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+    Returns:
+        df_month_hour_ave: dictionary of month x hour average emissions rates
+                           with a row for each year and month and
+                           a column for each hour, for each emissions scenario
+
+    Access output by:
+    df_month_hour_ave=month_hour_ave()
+
+    Output example:
+    df_month_hour_ave['Baseline']
+    """
+    df_month_hour_ave = {}
+    if not emissions_scenario_list:
+        return df_month_hour_ave
+
+    columns = [x + ' Emissions Rate Estimate' for x in emissions_scenario_list]
+    years, year_idx = np.unique(emissions_rates_df_out['Report_Year'].values,
+                                return_inverse=True)
+    hours, hour_idx = np.unique(emissions_rates_df_out['Report_Hour'].values,
+                                return_inverse=True)
+    month_idx = emissions_rates_df_out['Report_Month'].values - 1
+
+    # calendar index of each row, offset for each scenario
+    ncell = len(years)*12*len(hours)
+    calendar_idx = (year_idx*12 + month_idx)*len(hours) + hour_idx
+    scenario_idx = np.arange(len(columns))[:, None]*ncell + calendar_idx[None, :]
+    rates = emissions_rates_df_out[columns].values.T
+
+    sums = np.bincount(scenario_idx.ravel(), weights=rates.ravel(),
+                       minlength=len(columns)*ncell)
+    counts = np.bincount(calendar_idx, minlength=ncell)
+    with np.errstate(invalid='ignore'):
+        cube = sums.reshape(len(columns), ncell)/counts
+    cube = cube.reshape(len(columns), len(years)*12, len(hours))
+
+    index = pd.MultiIndex.from_product([years, np.arange(1, 13)],
+                                       names=['Report_Year', 'Report_Month'])
+    for s_idx, scenario_name in enumerate(emissions_scenario_list):
+        df_month_hour_ave[scenario_name] = pd.DataFrame(cube[s_idx], index=index,
+                                                        columns=hours.astype(str)).reset_index()
+
+    return df_month_hour_ave
+
+
+def get_leap_day_index_map(emissions_rates_df_out):
+    """
+    Precompute an integer index for each year that maps the 8760 hours
+    of the 1-year DR hours dataframes onto the rows of the emissions rates
+    for that year. On leap years (Gregorian calendar) the 24 hours of
+    Feb 29 are skipped, as there is no DR implemented on leap days.
+
+    Args:
+        emissions_rates_df_out: the emissions rates dataframe
+    Returns:
+        years: array of years (int)
+        index_map: array of row positions in emissions_rates_df_out
+                   with shape (year, 8760)
+    """
+    year = emissions_rates_df_out['Report_Year'].values
+    order = np.lexsort((emissions_rates_df_out['Report_Hour'].values,
+                        emissions_rates_df_out['Report_Day'].values,
+                        emissions_rates_df_out['Report_Month'].values, year))
+    years, year_start = np.unique(year[order], return_index=True)
+
+    # hours from Mar 1 on are one day later in the rates on leap years
+    hour = np.arange(365*24)
+    leap_offset = 24*(is_leap_year(years)[:, None] & (hour[None, :] >= (31+28)*24))
+    index_map = order[year_start[:, None] + hour[None, :] + leap_offset]
+
+    return years, index_map
+
+
+def get_rates_array(emissions_rates_df_out, emissions_scenario_list):
+    """
+    Reshapes the hourly emissions rates into an array with one row of
+    8760 hours per year for each emissions scenario, by taking the rows
+    of get_leap_day_index_map() so that each row lines up with the
+    1-year DR hours dataframes.
+
+    Args:
+        emissions_rates_df_out: the emissions rates dataframe
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+    Returns:
+        rates: array of hourly emissions rates with shape (scenario, year, hour)
+        years: array of years (int) for the second axis of rates
+    """
+    years, index_map = get_leap_day_index_map(emissions_rates_df_out)
+    columns = [x + ' Emissions Rate Estimate' for x in emissions_scenario_list]
+    rates = emissions_rates_df_out[columns].values.T
+
+    return np.take(rates, index_map, axis=1), years
+
+
+def effective_rates(dr_name, dr_seasons, emissions_scenario_list,
+                    emissions_rates_df_out, dr_hours_df_dict_out,
+                    dr_potential_df_dict_out, dr_product_info_df_dict_out, registry=None):
+    """
+    Compute the effective emissions rate of each DR bin for each year,
+    i.e. the mean of the hourly emissions rates over the hours
+    each product in the bin dispatches, weighted by the DR potential
+    of the product in that year. These explain the emissions impacts
+    from subcomponent c without rerunning it.
+
+    All plans, seasons and scenarios are handled as matrix products of
+    the (scenario, year, hour) rates, the (hour, product) DR hours,
+    the (year, product) DR potential and a (product, bin) indicator.
+
+    Args:
+        dr_name: list of the names of each DR plan (str)
+        dr_seasons: array containing a list of seasons (str) with DR hours
+                    for each DR plan
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+        dr_hours_df_dict_out: dictionary of DR hours dataframes
+        dr_potential_df_dict_out: dictionary of DR potential dataframes
+        dr_product_info_df_dict_out: dictionary of DR product info dataframes
+        registry: optional output of create_product_registry() from
+                  subcomponent a, built from dr_product_info_df_dict_out if None
+
+    Returns:
+        df_effective_rates: dictionary of yearly effective emissions rates
+                            for each bin
+
+    Access output by:
+        df_effective_rates=effective_rates()
+    Output example:
+        df_effective_rates['oldbins_Winter']['Baseline']
+    """
+    df_effective_rates = {}
+    if not emissions_scenario_list:
+        return df_effective_rates
+
+    rates, years = get_rates_array(emissions_rates_df_out, emissions_scenario_list)
+    if registry is None:
+        registry = create_product_registry(dr_product_info_df_dict_out)
+
+    for idx, drname in enumerate(dr_name):
+        for season in dr_seasons[idx]:
+            dict_key = drname + '_' + season
+            df_effective_rates[dict_key] = {}
+
+            hours = dr_hours_df_dict_out[dict_key]
+            products = list(hours.columns.values[3:])
+            dispatch = np.clip(hours[products].values, 0, None)
+            potential = dr_potential_df_dict_out[dict_key].set_index('Year')\
+                .reindex(years)[products].values
+
+            # indicator matrix of which bin each product belongs to
+            bin_dict = get_bin_products(registry, drname, products)
+            bin_names = list(bin_dict)
+            bin_matrix = np.array([[x in bin_dict[y] for y in bin_names] for x in products],
+                                  dtype=float)
+
+            # potential-weighted sums over DR hours: (scenario, year, bin)
+            numerator = (np.matmul(rates, dispatch) * potential) @ bin_matrix
+            denominator = (dispatch.sum(axis=0) * potential) @ bin_matrix
+
+            columns = ['bin' + x.split()[1] for x in bin_names]
+            for s_idx, scenario_name in enumerate(emissions_scenario_list):
+                df_out = pd.DataFrame(numerator[s_idx] / denominator, columns=columns)
+                df_out.insert(0, 'Year', years)
+                df_effective_rates[dict_key][scenario_name] = df_out
+
+    return df_effective_rates
+
+
+def get_best_windows(rates, window_lengths):
+    """
+    Find the best window of each day for each window length, i.e. the
+    window of consecutive hours within the day with the highest sum of
+    emissions rates. All window sums are differences of the cumulative
+    sum of the rates over the hours of the day, for all scenarios,
+    years and days at once.
+
+    Called in best_daily_windows(), seasonal_best_windows()
+
+    Args:
+        rates: array of hourly emissions rates with shape
+               (scenario, year, day, hour of day)
+        window_lengths: list of window lengths (int, hours)
+    Returns:
+        best_start: array of the best start hour index (0-23) with shape
+                    (scenario, year, day, window length)
+        best_score: array of the sum of emissions rates over the best window,
+                    with the same shape
+    """
+    cumsum = np.concatenate([np.zeros(rates.shape[:-1] + (1,)),
+                             np.cumsum(rates, axis=-1)], axis=-1)
+
+    best_start = np.empty(rates.shape[:-1] + (len(window_lengths),), dtype=int)
+    best_score = np.empty(best_start.shape)
+    for l_idx, length in enumerate(window_lengths):
+        window_sums = cumsum[..., length:] - cumsum[..., :-length]
+        best_start[..., l_idx] = window_sums.argmax(axis=-1)
+        best_score[..., l_idx] = window_sums.max(axis=-1)
+
+    return best_start, best_score
+
+
+def best_daily_windows(emissions_scenario_list, emissions_rates_df_out,
+                       window_lengths=(4, 6)):
+    """
+    Compute the best window of each day, for each window length,
+    e.g. 4 hours for non-DLC products and 6 hours for DLC products.
+    Days follow the 1-year DR hours (leap days dropped).
+
+    Args:
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+        window_lengths: list of window lengths (int, hours)
+    Returns:
+        df_best_windows: dictionary of the best window of each year, day and
+                         window length, with the Report_Hour of its start
+                         and the sum of emissions rates over the window,
+                         for each emissions scenario
+
+    Access output by:
+    df_best_windows=best_daily_windows()
+
+    Output example:
+    df_best_windows['Baseline']
+    """
+    df_best_windows = {}
+    if not emissions_scenario_list:
+        return df_best_windows
+
+    rates, years = get_rates_array(emissions_rates_df_out, emissions_scenario_list)
+    rates = rates.reshape(rates.shape[:2] + (-1, 24))
+    best_start, best_score = get_best_windows(rates, window_lengths)
+
+    months = np.repeat(np.arange(1, 13), DAYS_IN_MONTH)
+    days = np.concatenate([np.arange(1, ndays+1) for ndays in DAYS_IN_MONTH])
+    index = pd.MultiIndex.from_product([years, np.arange(len(days)), list(window_lengths)],
+                                       names=['Report_Year', 'Day Index', 'Window Length'])
+    for s_idx, scenario_name in enumerate(emissions_scenario_list):
+        df_out = pd.DataFrame({'Best Start Hour': best_start[s_idx].ravel() + 1,
+                               'Best Score': best_score[s_idx].ravel()},
+                              index=index).reset_index()
+        df_out.insert(1, 'Report_Month', months[df_out['Day Index']])
+        df_out.insert(2, 'Report_Day', days[df_out['Day Index']])
+        df_best_windows[scenario_name] = df_out.drop(columns='Day Index')
+
+    return df_best_windows
+
+
+def seasonal_best_windows(dr_name, dr_seasons, emissions_scenario_list,
+                          emissions_rates_df_out, dr_hours_df_dict_out):
+    """
+    Compare the DR hours of each product to the best window of each of
+    its DR days, for each DR plan and season. The window length of each
+    product is its most common number of DR hours per DR day. Products
+    without DR days, and seasons without any DR days, are left out. Both the
+    best window and the DR hours are scored by the unweighted sum of the
+    emissions rates over their hours, so fractional dispatch in the DR hours
+    does not shrink the schedule score relative to the best window.
+
+    Args:
+        dr_name: list of the names of each DR plan (str)
+        dr_seasons: array containing a list of seasons (str) with DR hours
+                    for each DR plan
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        emissions_rates_df_out: the emissions rates dataframe
+        dr_hours_df_dict_out: dictionary of DR hours dataframes
+    Returns:
+        df_seasonal_windows: dictionary with a row for each year and product,
+                             with the window length, the most common best
+                             start hour, and the average over DR days of
+                             the sum of emissions rates over the best window
+                             ('Best Score') and over the DR hours
+                             ('Schedule Score'), and their difference ('Gap')
+
+    Access output by:
+    df_seasonal_windows=seasonal_best_windows()
+
+    Output example:
+    df_seasonal_windows['oldbins_Winter']['Baseline']
+    """
+    df_seasonal_windows = {}
+    if not emissions_scenario_list:
+        return df_seasonal_windows
+
+    rates, years = get_rates_array(emissions_rates_df_out, emissions_scenario_list)
+    rates = rates.reshape(rates.shape[:2] + (-1, 24))
+
+    for idx, drname in enumerate(dr_name):
+        for season in dr_seasons[idx]:
+            dict_key = drname + '_' + season
+
+            hours = dr_hours_df_dict_out[dict_key]
+            products = list(hours.columns.values[3:])
+            dispatch = np.clip(hours[products].values.T, 0, None).reshape(len(products), -1, 24)
+            dr_day = dispatch.sum(axis=2) > 0
+            lengths = [np.bincount((dispatch[p_idx][dr_day[p_idx]] > 0).sum(axis=1),
+                                   minlength=1).argmax() for p_idx in range(len(products))]
+            window_lengths = sorted(set(x for x in lengths if x > 0))
+            # Skip seasons without any DR days
+            if not window_lengths:
+                continue
+            df_seasonal_windows[dict_key] = {}
+            best_start, best_score = get_best_windows(rates, window_lengths)
+
+            # (scenario, year, day, product) scores of each product's window and DR hours,
+            # both unweighted sums of the rates over their hours
+            l_idx = [window_lengths.index(x) if x > 0 else 0 for x in lengths]
+            best_score = best_score[..., l_idx]
+            best_start = best_start[..., l_idx]
+            schedule_score = np.einsum('sydh,pdh->sydp', rates, (dispatch > 0).astype(float))
+
+            ndays = np.maximum(dr_day.sum(axis=1), 1)
+            weights = dr_day.T.astype(float)
+            best_ave = (best_score*weights).sum(axis=2)/ndays
+            schedule_ave = (schedule_score*weights).sum(axis=2)/ndays
+            start_counts = ((best_start[..., None] == np.arange(24)) \
+                            * weights[..., None]).sum(axis=2)
+
+            index = pd.MultiIndex.from_product([years, products], names=['Year', 'Product'])
+            for s_idx, scenario_name in enumerate(emissions_scenario_list):
+                df_out = pd.DataFrame({'Window Length': np.tile(lengths, len(years)),
+                                       'Best Start Hour': start_counts[s_idx].argmax(axis=-1)\
+                                           .ravel() + 1,
+                                       'Best Score': best_ave[s_idx].ravel(),
+                                       'Schedule Score': schedule_ave[s_idx].ravel()},
+                                      index=index).reset_index()
+                df_out['Gap'] = df_out['Best Score'] - df_out['Schedule Score']
+                df_seasonal_windows[dict_key][scenario_name] = \
+                    df_out[df_out['Window Length'] > 0].reset_index(drop=True)
+
+    return df_seasonal_windows
+
+
+def set_precision(emissions_rates_df_out, emissions_scenario_list, precision='float64'):
+    """
+    Casts the emissions rates columns of each scenario to a floating
+    point precision, so that the averages are computed in that precision.
+
+    Args:
+        emissions_rates_df_out: the emissions rates dataframe
+        emissions_scenario_list: list of policy scenarios (str)
+                                 with emissions rates files
+        precision: 'float64' or 'float32' (see PRECISIONS)
+    Returns:
+        the emissions rates dataframe with the rates in the precision
+    """
+    if precision not in PRECISIONS:
+        raise ValueError('Please input one of '+', '.join(PRECISIONS)\
+                         +' for the precision argument')
+
+    return emissions_rates_df_out.astype({x + ' Emissions Rate Estimate': precision \
+                                          for x in emissions_scenario_list})
+
+
 def subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,
-                     emissions_rates_df_out, dr_hours_df_dict_out, year):
+                     emissions_rates_df_out, dr_hours_df_dict_out, year,
+                     n_boot=0, seed=None, precision='float64', stratified=False):
     """
     Runs through all of the above functions.
     Args:
@@ -240,6 +833,13 @@ def subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,
         dr_hours_df_dict_out: dictionary of DR hours dataframes
         year: year (int) to output emissions rates averages for all days
               for general info page of dashboard
+        n_boot: number of bootstrap resamples for confidence intervals
+                on the DR days averages (int), or 0 for no confidence intervals
+        seed: seed for the bootstrap random number generator
+        precision: 'float64' or 'float32' precision of the emissions rates
+                (see set_precision)
+        stratified: if True, also return the averages stratified by day type
+                and peak days (see alldays_stratified_ave)
     Returns:
         df_seasonal_ave: dictionary of seasonally averaged hourly emissions rates
                         for days with DR averaged over full period (2022-2041)
@@ -247,16 +847,29 @@ def subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,
                         for days with DR averaged over full period (2022-2041)
         df_oneyear_seasonal_ave: dictionary of seasonally, annually averaged hourly
                         emissions rates for all days of a given year
+        df_month_hour_ave: dictionary of month x hour averaged emissions rates
+                        for all days over full period (see month_hour_ave)
+        df_stratified_ave: if stratified, dictionary of seasonally, annually
+                        averaged hourly emissions rates for each day type and
+                        the peak days of each year, averaged over full period
     """
     if not year in emissions_rates_df_out['Report_Year'].tolist():
         raise ValueError('Year unavailable!')
     else:
         pass
+    emissions_rates_df_out = set_precision(emissions_rates_df_out, emissions_scenario_list,
+                                           precision)
     df_seasonal_ave = seasonal_ave(dr_name, dr_seasons, emissions_scenario_list,
-                                   emissions_rates_df_out, dr_hours_df_dict_out)
+                                   emissions_rates_df_out, dr_hours_df_dict_out, n_boot, seed)
     df_annual_ave = annual_ave(dr_name, dr_seasons, emissions_scenario_list,
-                               emissions_rates_df_out, dr_hours_df_dict_out)
+                               emissions_rates_df_out, dr_hours_df_dict_out, n_boot, seed)
     df_oneyear_seasonal_ave = alldays_oneyear_seasonal_ave(emissions_scenario_list,
                                                            emissions_rates_df_out, year)
-
-    return df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave
+    df_month_hour_ave = month_hour_ave(emissions_scenario_list, emissions_rates_df_out)
+    if stratified:
+        df_stratified_ave = alldays_stratified_ave(emissions_scenario_list,
+                                                   emissions_rates_df_out)
+        return df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave, df_month_hour_ave, \
+            df_stratified_ave
+
+    return df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave, df_month_hour_ave
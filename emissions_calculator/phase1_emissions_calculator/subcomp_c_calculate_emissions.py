@@ -5,10 +5,12 @@ Reads emissions rates, DR hours, DR potential, and DR product info
 from subcomponent a.
 
 Calculates emissions impacts (metric tons CO2e/MWh) as the product of
-(a) DR potential (MW) for a given season;
+(a) DR potential (MW) for a given season, optionally times
+hour-varying multipliers of the potential;
 (b) DR implementation hours (1, 0, or -1; h) for each hour
 in the season, where 1 indicates a load reduction, -1 indicates
-a load increase (due to shifting load), and 0 indicates no DR;
+a load increase (due to shifting load), and 0 indicates no DR,
+or fractions in between for hours with part of the potential dispatched;
 (c) marginal emissions rates (lbs CO2e/kWh); and
 (d) a unit conversion factor (kWh/MWh)*(metric tons CO2e/lb).
 
@@ -17,104 +19,246 @@ indicate an emissions increase, which can occur if DR shifts the load
 to more emission-intensive hours.
 
 We assume that for DR shift products, the load is shifted to adjacent
-hours before and after the DR implementation period. For ResTOU
+hours before and after the DR implementation period, following the
+rebound kernel of each product (see REBOUND_KERNELS). For ResTOU
 (Residential Time-of-Use), we calculate emissions impacts that would
 occur if this were a shed product, and also if this were a shift
 product, as DR pilot studies suggest it can be both.
+
+The yearly impacts are held in a results cube, a labeled array over
+(scenario, DR plan, season, bin, product, year) with NaN where
+a combination does not exist (see build_results_cube). The barchart
+tables and the dictionary of tables for each output file are views
+of the cube.
+
+Impacts can be calculated in float32 rather than float64 (see
+the precision argument of stack_impacts_inputs), in which case sums
+over many hours and the totals over all years use compensated summation.
 """
 
 import pandas as pd
 import numpy as np
 
-from emissions_parameters import EMISSIONS_CHANGEUNITS
+from emissions_parameters import EMISSIONS_CHANGEUNITS, REBOUND_KERNELS, PRECISIONS
+from subcomp_a_organize_data import create_product_registry, get_bin_products
+from subcomp_b_process_emissions_factors import get_rates_array
 
 
 def shift_hours(dr_hours):
     """
-    Outputs an updated dr_hours dataframe that adds -1 values to hours
+    Outputs an updated dr_hours array that adds -1 values to hours
     in which the load has increased due to a DR shift product.
     (DR shift products shift load from the time of DR implementation
     to the adjacent hours.)
 
+    Each event (a run of consecutive hours with DR implemented) is found
+    from the differences of the DR hours, and half of its length is shifted
+    to the hours just before the event and half to the hours just after.
+    Events may have different lengths. Shifted hours that fall outside the
+    year wrap around to the other end of the year, as the DR hours repeat
+    each year.
+
     Args:
         dr_hours: A single column (i.e. single DR product) of one of the dataframes
-            of hours implemented for a bin + season combination.
+            of hours implemented for a bin + season combination,
+            or an array of DR hours with shape (product, hour) to shift
+            many products or schedules at once.
 
 
     Returns:
-        dr_hours_out: dataframe containing hours with DR implemented
+        dr_hours_out: array containing hours with DR implemented
                       to reduce load (+1 value), hours with no DR (0 value)
                       and hours with increased load due to a load shift by DR
                       (-1 value)
     """
-
-    # Get first index in set of hours implemented
-    indicies_imp = dr_hours.loc[dr_hours==1].index
-    firsts = np.array([])
-    first = False
-    ind_prev = 0
-    num_hours_implemented = 0
-    for ind in indicies_imp:
-        if first:
-            num_hours_implemented = 1
-            firsts = np.append(firsts, np.array([np.floor(ind)-1]))
-            first = False
-            ind_prev = ind
-            num_hours_implemented +=1
-        else:
-            first = bool(ind-ind_prev > 1)
-            ind_prev = ind
-            num_hours_implemented += 1
-
-    firsts = firsts.astype(int)
-    # Specify indices_shift to insert -1 values for load shift
-    if num_hours_implemented%2!=0:
+    dr_hours_in = np.asarray(dr_hours)
+    dr_hours_2d = np.atleast_2d(dr_hours_in)
+    nhours = dr_hours_2d.shape[1]
+
+    # Find start and end (exclusive) of every event from the differences
+    implemented = np.pad((dr_hours_2d == 1).astype(np.int8), ((0, 0), (1, 1)))
+    changes = np.diff(implemented, axis=1)
+    rows, starts = np.nonzero(changes == 1)
+    _, ends = np.nonzero(changes == -1)
+    lengths = ends - starts
+
+    if np.any(lengths%2 != 0):
         raise ValueError("Number of hours implemented for shifting must be even.")
 
-    hours_to_shift = num_hours_implemented//2
-    indicies_shift_down = np.array([])
-    indicies_shift_up = np.array([])
-    for hour in range(1,hours_to_shift+1):
-        shift_inds_down = firsts - hour
-        shift_inds_up = firsts + (num_hours_implemented-1)+ hour
-        indicies_shift_down = np.append(indicies_shift_down, shift_inds_down)
-        indicies_shift_up = np.append(indicies_shift_up, shift_inds_up)
-
-    indicies_shift = np.append(indicies_shift_down,indicies_shift_up)
+    # Specify hours before and after each event to insert -1 values for load shift
+    hours_to_shift = lengths//2
+    offsets = np.arange(1, hours_to_shift.max(initial=0)+1)
+    in_event = offsets[None, :] <= hours_to_shift[:, None]
+    shift_rows = np.broadcast_to(rows[:, None], in_event.shape)[in_event]
+    shift_down = (starts[:, None] - offsets[None, :])[in_event]
+    shift_up = (ends[:, None] - 1 + offsets[None, :])[in_event]
 
     # Insert -1 values and output new dr_hours
-    dr_product_shifted = dr_hours.copy()
-    dr_product_shifted.loc[indicies_shift] = -1
-    dr_hours_out = dr_product_shifted.values
+    dr_hours_out = dr_hours_2d.copy()
+    dr_hours_out[np.concatenate([shift_rows, shift_rows]),
+                 np.concatenate([shift_down, shift_up]) % nhours] = -1
 
-    return dr_hours_out
+    return dr_hours_out.reshape(dr_hours_in.shape)
 
 
-def sort_bins(dr_info, dr_names):
+def get_rebound_kernel(event_length):
     """
-    This function sorts/reformats the input dr_info dataframe (a single entry of the
-    dr_product_info dictionary that is input into calc_yearly_emissions) into a dictionary
-    with keys for each bin number (e.g. "Bin 1") and entries of the list of DR products
-    that correspond to that bin number.
+    Outputs the default rebound kernel of a DR shift product, which shifts
+    the load of each event evenly to the hours just before and just after
+    the event, half on each side. For odd event lengths the farthest hour
+    on each side gets half of an hour of load.
 
     Args:
-        dr_info: DR product information dataframe for a given DR plan
-        dr_names: list of DR products (str) for a given DR plan, season
+        event_length: number of hours (int) in each event
 
     Returns:
-        out_dict: dictionary with bin number as keys and DR product names
-                  as values, for a given DR plan and season.
+        kernel: dictionary with the 'pre' and 'post' rebound kernels
+    """
+    side = -np.ones(int(np.ceil(event_length/2)))
+    if event_length%2 != 0:
+        side[-1] = -0.5
+
+    return {'pre': side[::-1], 'post': side}
+
+
+def get_rebound_kernels(dr_hours, product_names, shift_flags, rebound_kernels=None):
     """
-    out_dict = {}
+    Outputs the rebound kernel for each row of a DR hours array:
+    the kernel declared for the product in rebound_kernels, 'event' for
+    other shift products, whose rebound follows the length of each event
+    (see apply_load_shapes), and None for shed products.
+
+    Args:
+        dr_hours: array of DR hours with shape (product, hour)
+        product_names: list of DR product names (str) for each row of dr_hours
+        shift_flags: list of bools, True for DR shift products
+        rebound_kernels: dictionary of declared kernels by product name,
+            defaults to REBOUND_KERNELS
 
-    for dr_name in dr_names:
-        bin_name = dr_info.Bin.loc[dr_info.Product == dr_name].values[0]
-        if bin_name in list(out_dict.keys()):
-            out_dict[bin_name] = out_dict[bin_name]+[dr_name]
+    Returns:
+        kernels: list of kernel dictionaries, 'event' or None for each row
+    """
+    if rebound_kernels is None:
+        rebound_kernels = REBOUND_KERNELS
+    if len(product_names) != len(np.atleast_2d(dr_hours)):
+        raise ValueError('Please input a product name for each row of dr_hours')
+
+    kernels = []
+    for dr_name, shift in zip(product_names, shift_flags):
+        if not shift:
+            kernels.append(None)
+        elif dr_name in rebound_kernels:
+            kernels.append(rebound_kernels[dr_name])
         else:
-            out_dict[bin_name] = [dr_name]
+            kernels.append('event')
+
+    return kernels
 
-    return out_dict
+
+def convolve_events(indicator, weights, offset, fft_length=32):
+    """
+    Circular convolution of event indicators with kernels,
+    for all products at once: output[:, h] is the sum over j of
+    weights[:, j]*indicator[:, h-offset-j]. Uses FFTs for long kernels.
+
+    Args:
+        indicator: array with shape (product, hour), 1 at each event start or end
+        weights: array of kernels with shape (product, kernel hour)
+        offset: hours (int) from the indicator to the first kernel hour
+        fft_length: kernel length (int) above which FFTs are used
+
+    Returns:
+        array of load changes with shape (product, hour)
+    """
+    nhours = indicator.shape[1]
+    if weights.shape[1] > fft_length:
+        weights_full = np.zeros(indicator.shape)
+        weights_full[:, (offset + np.arange(weights.shape[1])) % nhours] = weights
+        return np.fft.irfft(np.fft.rfft(indicator, axis=1)*np.fft.rfft(weights_full, axis=1),
+                            n=nhours, axis=1)
+
+    out = np.zeros(indicator.shape)
+    for j in range(weights.shape[1]):
+        out += weights[:, j:j+1]*np.roll(indicator, offset+j, axis=1)
+    return out
+
+
+def apply_load_shapes(dr_hours, kernels, fft_length=32):
+    """
+    Outputs the load shape of each DR product: the DR hours plus the
+    rebound from convolving the start of each event with the product's
+    'pre' kernel and the end of each event with its 'post' kernel.
+    An event is a run of hours with DR dispatched; for fractional DR hours
+    the rebound is scaled by the average fraction dispatched in the event.
+    Kernels can be asymmetric, fractional, pre-cooling, or have a delayed
+    tail (leading zeros in 'post'). Like shift_hours, rebound hours
+    outside the year wrap around to the other end of the year.
+
+    Products with the kernel 'event' use the default kernel of each event's
+    own length (see get_rebound_kernel), so that like shift_hours, events of
+    different lengths each shift half of their load to either side.
+
+    Args:
+        dr_hours: array of DR hours (1-or-0 flags or fractions
+            of DR potential dispatched) with shape (product, hour)
+        kernels: list of kernel dictionaries with 'pre' and 'post' arrays,
+            'event' for the default kernel of each event, or None for no
+            rebound, for each product
+        fft_length: kernel length (int) above which FFTs are used
+
+    Returns:
+        load_shape: array with shape (product, hour) of load reductions (positive)
+            and load increases (negative) as a fraction of DR potential
+    """
+    dr_hours = np.atleast_2d(np.asarray(dr_hours, dtype=float))
+    nprod, nhours = dr_hours.shape
+
+    # Stack kernels, right-aligning 'pre' kernels to the event start
+    pre_len = max([len(k['pre']) for k in kernels if isinstance(k, dict)] + [0])
+    post_len = max([len(k['post']) for k in kernels if isinstance(k, dict)] + [0])
+    pre = np.zeros((nprod, pre_len))
+    post = np.zeros((nprod, post_len))
+    for row, kernel in enumerate(kernels):
+        if isinstance(kernel, dict):
+            pre[row, pre_len-len(kernel['pre']):] = kernel['pre']
+            post[row, :len(kernel['post'])] = kernel['post']
+
+    # Indicators of event starts and (exclusive) event ends,
+    # weighted by the average fraction of DR potential dispatched in the event
+    changes = np.diff(np.pad((dr_hours > 0).astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, start_cols = np.nonzero(changes == 1)
+    _, end_cols = np.nonzero(changes == -1)
+    cumsum = np.cumsum(np.pad(dr_hours, ((0, 0), (1, 0))), axis=1)
+    event_ave = (cumsum[rows, end_cols] - cumsum[rows, start_cols])/(end_cols - start_cols)
+
+    # Events of products with a kernel dictionary are convolved with it
+    kernel_event = np.array([isinstance(x, dict) for x in kernels], dtype=bool)[rows]
+    starts = np.zeros(dr_hours.shape)
+    ends = np.zeros(dr_hours.shape)
+    starts[rows[kernel_event], start_cols[kernel_event]] = event_ave[kernel_event]
+    ends[rows[kernel_event], end_cols[kernel_event] % nhours] = event_ave[kernel_event]
+    load_shape = dr_hours + convolve_events(starts, pre, -pre_len, fft_length) \
+        + convolve_events(ends, post, 0, fft_length)
+
+    # Default kernel of each event's own length for products with 'event':
+    # ceil(length/2) hours on either side, the farthest at half load if odd
+    default_event = np.array([isinstance(x, str) and x == 'event' for x in kernels],
+                             dtype=bool)[rows]
+    lengths = (end_cols - start_cols)[default_event]
+    sides = (lengths + 1)//2
+    offsets = np.arange(1, sides.max(initial=0)+1)
+    in_side = offsets[None, :] <= sides[:, None]
+    weights = np.where((offsets[None, :] == sides[:, None]) & (lengths[:, None]%2 != 0),
+                       -0.5, -1.) * event_ave[default_event][:, None]
+    event_rows = np.broadcast_to(rows[default_event][:, None], in_side.shape)[in_side]
+    np.add.at(load_shape, (event_rows,
+                           (start_cols[default_event][:, None] - offsets)[in_side] % nhours),
+              weights[in_side])
+    np.add.at(load_shape, (event_rows,
+                           (end_cols[default_event][:, None] - 1 + offsets)[in_side] % nhours),
+              weights[in_side])
+
+    return load_shape
 
 
 def make_barchart_df(emissions_impacts_dict):
@@ -140,82 +284,688 @@ def make_barchart_df(emissions_impacts_dict):
         newbins_df: dataframe of bin 1 products from new binning with total
             emissions savings for each product. For plot on homepage.
     """
+    return make_cube_barchart_df(dictionary_to_cube(emissions_impacts_dict))
 
-    bin_nums = 4
-    #Create 2 dicts, one for oldbins, one for new.
-    old_dict = {}
-    new_dict = {}
-    for n_bin in range(1, bin_nums+1):
-        old_dict["bin"+str(n_bin)]=pd.DataFrame(data=[], index = ['Winter', 'Summer'])
-        new_dict['bin'+str(n_bin)]=pd.DataFrame(data=[], index = ['Winter', 'Summer', 'Fall'])
-
-    #Sum all years for a barchart and save that separately
-    start_condition = True
-    for ind, key in enumerate(emissions_impacts_dict.keys()):
-        old_bins = bool('oldbins' in key)
-        #Get the bin number for reformatting
-        for n_bin in range(1, bin_nums+1):
-            if "bin"+str(n_bin) in key:
-                bin_num = n_bin
-                break
-
-        if "Winter" in key:
-            season = "Winter"
-        elif "Summer" in key:
-            season = "Summer"
-        elif "Fall" in key:
-            season = "Fall"
-        elif "Spring" in key:
-            season = "Spring"
-
-        #Check whether the dataframe to put the sums in is empty
-        if old_bins:
-            start_condition = old_dict["bin"+str(bin_num)].empty
-        else:
-            start_condition = new_dict["bin"+str(bin_num)].empty
-
-        df_temp = emissions_impacts_dict[key]
-        df_temp = df_temp.drop(['Year'], axis=1)
-        summed_series = df_temp.sum()
-
-        if start_condition:
-            cols = list(summed_series.index)
-            for col in cols:
-                if old_bins:
-                    old_dict["bin"+str(bin_num)].loc[season, col] = summed_series.loc[col]
-                else:
-                    new_dict["bin"+str(bin_num)].loc[season, col] = summed_series.loc[col]
-        else:
-            cols = list(summed_series.index)
-            if old_bins:
-                old_dict["bin"+str(bin_num)].loc[season, cols] = summed_series
-            else:
-                new_dict["bin"+str(bin_num)].loc[season, cols] = summed_series
-
-    #Need to know all the the DR names and get a big list:
-    out_df = pd.DataFrame(data=[], index = ['Winter', 'Summer', 'Fall'])
-    out_df.index.name = 'Season'
-    out_df['oldbins_bin1'] = old_dict['bin1'].sum(axis=1)
-    out_df['oldbins_bin2'] = old_dict['bin2'].sum(axis=1)
-    out_df['oldbins_bin3'] = old_dict['bin3'].sum(axis=1)
-    out_df['oldbins_bin4'] = old_dict['bin4'].sum(axis=1)
 
-    out_df['newbins_bin1_shed'] = new_dict['bin1'].loc[:, ["DVR", "ResTOU_shed"]].sum(axis=1)
-    out_df['newbins_bin1_shift'] = new_dict['bin1'].loc[:, ["DVR", "ResTOU_shift"]].sum(axis=1)
+def make_cube_barchart_df(cube, scenario=None):
+    """
+    Makes the barchart dataframes of make_barchart_df from a results cube,
+        by summing the cube over years and products.
+
+    Args:
+        cube: output of build_results_cube()
+        scenario: emissions scenario (str), e.g. "Baseline",
+            defaults to the first scenario of the cube
+
+    Returns:
+        out_df, newbins_df: see make_barchart_df()
+    """
+    coords = cube['coords']
+    s_ind = 0 if scenario is None else coords['Scenario'].index(scenario)
+
+    # Sum over years, and over the products of each bin,
+    # with NaN for seasons that are not in a DR plan
+    values = cube['values'][s_ind]
+    product_sums = np.where(cube['mask'],
+                            compensated_sum(np.where(np.isnan(values), 0, values), axis=-1),
+                            np.nan)
+    bin_sums = np.where(cube['mask'].any(axis=(2, 3))[..., None],
+                        np.nansum(product_sums, axis=-1), np.nan)
+
+    season_rows = ['Winter', 'Summer', 'Fall']
+    nseasons = len(coords['Season'])
+    bin_df = pd.DataFrame(data=bin_sums.transpose(1, 0, 2).reshape(nseasons, -1),
+                          index=coords['Season'],
+                          columns=[plan+'_bin'+x.split()[1] for plan in coords['Plan'] \
+                                   for x in coords['Bin']]).reindex(season_rows)
+    out_df = bin_df.reindex(columns=['oldbins_bin'+str(x) for x in range(1, 5)])
+    out_df.index.name = 'Season'
 
-    newbins_df = new_dict['bin1']
+    # Bin 1 products of the new binning
+    newbins_df = pd.DataFrame(data=[], index=season_rows)
+    if 'newbins' in coords['Plan'] and 'Bin 1' in coords['Bin']:
+        p_ind = coords['Plan'].index('newbins')
+        b_ind = coords['Bin'].index('Bin 1')
+        in_bin = cube['mask'][p_ind, :, b_ind].any(axis=0)
+        newbins_df = pd.DataFrame(data=product_sums[p_ind, :, b_ind][:, in_bin],
+                                  index=coords['Season'],
+                                  columns=np.array(coords['Product'])[in_bin]
+                                  ).reindex(season_rows)
     newbins_df.index.name = 'Season'
 
+    out_df['newbins_bin1_shed'] = newbins_df.loc[:, ["DVR", "ResTOU_shed"]].sum(axis=1)
+    out_df['newbins_bin1_shift'] = newbins_df.loc[:, ["DVR", "ResTOU_shift"]].sum(axis=1)
+
     return out_df, newbins_df
 
 
-def calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons):
+def get_potential_multipliers(dr_hours, potential_profile):
+    """
+    Looks up the hour-varying multipliers of DR potential for each hour
+    of a DR hours dataframe, by month and hour or by hour of the year.
+
+    Args:
+        dr_hours: DR hours dataframe for a DR plan and season
+        potential_profile: potential profile dataframe for the DR plan
+            (see create_potential_profile_dict in subcomponent a)
+
+    Returns:
+        multipliers: dataframe of multipliers with the same index and DR product
+            columns as dr_hours, equal to 1 for products without a profile
+    """
+    keys = ['Month', 'hourID', 'Day'] if 'Day' in potential_profile.columns \
+        else ['Month', 'hourID']
+    dr_list = list(dr_hours.columns.values[3:])
+    products = [x for x in dr_list if x in potential_profile.columns]
+
+    merged = dr_hours[keys].merge(potential_profile[keys + products], on=keys, how='left')
+    multipliers = pd.DataFrame(1., index=dr_hours.index, columns=dr_list)
+    multipliers[products] = merged[products].values
+
+    return multipliers
+
+
+def calc_impacts_array(rates, hours, potential, months=None):
+    """
+    Calculates avoided emissions for every scenario, year and DR product
+    in one tensor contraction of the hourly emissions rates,
+    the hours of DR implementation and the DR potential.
+
+    Args:
+        rates: array of hourly emissions rates with shape (scenario, year, hour)
+        hours: array of DR hours with shape (product, hour), i.e. the fraction
+            of DR potential reducing (positive) or increasing (negative) load
+        potential: array of DR potential with shape (year, product)
+        months: optional array of the month (int) of each hour, in calendar
+            order, e.g. inputs['months'] from stack_impacts_inputs(). In float32,
+            the hours of each month are summed separately (12 equal blocks of
+            hours if None)
+
+    Returns:
+        impacts: array of yearly avoided emissions with shape
+            (scenario, year, product)
+    """
+    if rates.dtype == np.float64:
+        return np.matmul(rates, hours.T) * potential * EMISSIONS_CHANGEUNITS
+
+    # In lower precision, sum the hours of each month separately,
+    # then add the months with compensated summation
+    if months is None:
+        bounds = np.linspace(0, rates.shape[-1], 13).astype(int)
+    else:
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(months)) + 1, [len(months)]])
+    partials = np.array([np.matmul(rates[..., start:end], hours[:, start:end].T) \
+                         for start, end in zip(bounds[:-1], bounds[1:])])
+
+    return compensated_sum(partials, axis=0) * potential * EMISSIONS_CHANGEUNITS
+
+
+def compensated_sum(array, axis=-1):
+    """
+    Sums an array along an axis with Neumaier's compensated summation,
+    which carries the rounding error of each addition along with the sum,
+    so that the error does not grow with the number of terms.
+    The sum keeps the dtype of the array, e.g. float32.
+
+    Args:
+        array: numpy array
+        axis: the axis (int) to sum over
+
+    Returns:
+        total: array of the sums, without the summed axis
+    """
+    array = np.moveaxis(np.asarray(array), axis, 0)
+    total = np.zeros(array.shape[1:], dtype=array.dtype)
+    compensation = np.zeros(array.shape[1:], dtype=array.dtype)
+    for value in array:
+        new_total = total + value
+        compensation += np.where(np.abs(total) >= np.abs(value),
+                                 (total - new_total) + value, (value - new_total) + total)
+        total = new_total
+
+    return total + compensation
+
+
+def get_event_intervals(dr_hours):
+    """
+    Converts DR hours into a list of intervals, i.e. runs of consecutive
+    hours with the same nonzero value (1 for DR implemented, -1 for
+    shifted load), found from the differences of the DR hours.
+
+    Args:
+        dr_hours: array of DR hours with shape (product, hour)
+
+    Returns:
+        intervals: dictionary of equal-length arrays with the product index,
+            start hour, end hour (exclusive) and value of each interval
+    """
+    dr_hours = np.atleast_2d(dr_hours)
+    padded = np.pad(dr_hours, ((0, 0), (1, 1)))
+    changes = np.diff(padded, axis=1) != 0
+
+    # each change is the start of a run and the end of the previous one
+    rows, bounds = np.nonzero(changes)
+    value = padded[rows, bounds+1]
+    same_row = rows[1:] == rows[:-1]
+    is_run = same_row & (value[:-1] != 0)
+
+    intervals = {'product': rows[:-1][is_run],
+                 'start': bounds[:-1][is_run],
+                 'end': bounds[1:][is_run],
+                 'value': value[:-1][is_run]}
+    return intervals
+
+
+def get_rates_cumsum(rates):
+    """
+    Precomputes the cumulative sums of the hourly emissions rates
+    for each scenario and year, with a leading zero so that the sum of
+    the rates over hours [start, end) is cumsum[..., end] - cumsum[..., start].
+    The cumulative sums are computed once and reused to score any number
+    of DR schedules (see calc_interval_sums, calc_interval_impacts).
+
+    Args:
+        rates: array of hourly emissions rates with shape (scenario, year, hour),
+            or any leading dimensions, e.g. (hour,)
+
+    Returns:
+        rates_cumsum: array with shape (scenario, year, hour+1)
+    """
+    rates_cumsum = np.zeros(rates.shape[:-1] + (rates.shape[-1]+1,))
+    np.cumsum(rates, axis=-1, out=rates_cumsum[..., 1:])
+    return rates_cumsum
+
+
+def calc_interval_sums(rates_cumsum, starts, ends):
+    """
+    Sums the hourly emissions rates over each interval of hours [start, end)
+    as one difference of the cumulative rates, so the work scales with the
+    number of intervals rather than the number of hours.
+
+    Args:
+        rates_cumsum: output of get_rates_cumsum()
+        starts: array of the start hour (int) of each interval
+        ends: array of the end hour (int, exclusive) of each interval
+
+    Returns:
+        interval_sums: array with shape (scenario, year, interval)
+    """
+    return rates_cumsum[..., ends] - rates_cumsum[..., starts]
+
+
+def calc_interval_impacts(rates_cumsum, intervals, potential):
+    """
+    Calculates avoided emissions for every scenario, year and DR product
+    from the DR hours as intervals, e.g. to score a new DR schedule
+    against precomputed cumulative rates. Each interval costs one difference
+    of the cumulative rates, so the work scales with the number of events
+    rather than the number of hours.
+
+    Args:
+        rates_cumsum: output of get_rates_cumsum(), shape (scenario, year, hour+1)
+        intervals: output of get_event_intervals()
+        potential: array of DR potential with shape (year, product)
+
+    Returns:
+        impacts: array of yearly avoided emissions with shape
+            (scenario, year, product), as from calc_impacts_array()
+    """
+    interval_sums = calc_interval_sums(rates_cumsum, intervals['start'], intervals['end']) \
+        * intervals['value']
+
+    # add up the intervals of each product
+    impacts = np.zeros(rates_cumsum.shape[:-1] + (potential.shape[1],))
+    np.add.at(impacts, (Ellipsis, intervals['product']), interval_sums)
+
+    return impacts * potential * EMISSIONS_CHANGEUNITS
+
+
+def stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                         rebound_kernels=None, potential_profiles=None, precision='float64',
+                         registry=None):
+    """
+    Aligns the emissions rates, DR hours and DR potential of every DR plan,
+        season and product into arrays, so that impacts can be calculated
+        in one tensor contraction (see calc_impacts_array), and so that
+        other analyses of the impacts can reuse the aligned arrays.
+
+    Args:
+        em_rates: emissions rates dataframe. Formatted with columns "Report_Year", "Report Month",
+            "Report Day", "Report Hour", and then column of emissions rates for emissions rate
+            scenario being considered.
+
+        dr_hours: dictionary with keys such as ["newbins_Fall"]. Each entry contains a dataframe
+            with columns ["hourID", "Month", "Day"] and then columns for each DR product in that
+            binning + season combination. Entries for the DR products are 0 in hours when not
+            implemented, and 1 for hours implemented, or the fraction of DR potential
+            dispatched in each hour.
+
+        dr_potential: dictionary with same keys as dr_hours (e.g. ["newbins_Fall"). Each entry
+            is a dataframe with a column of years implemented, and then columns containing avoided
+            emissions potential for each DR product implemented in that bin+season combination.
+
+        dr_product_info: dictionary with two entries, with keys "oldbins" and "newbins". Each entry
+            contains a dataframe with a row for each DR product, containing what Bin it belongs to,
+            Seasons implemented, and whether it is a shift or shed product.
+
+        bins: List of binnings that we're using (e.g. ['oldbins', 'newbins'])
+
+        seasons: List of seasons we use for each binning format
+            (e.g. [['Winter, 'Fall'], ['Winter', 'Summer', 'Fall']])
+
+        rebound_kernels: dictionary of rebound kernels of shift products by
+            product name, defaults to REBOUND_KERNELS (see apply_load_shapes)
+
+        potential_profiles: optional dictionary with a potential profile dataframe
+            for each binning, with hour-varying multipliers of DR potential
+            (see get_potential_multipliers)
+
+        precision: 'float64' or 'float32' (see PRECISIONS), the dtype of the
+            rates, DR hours and DR potential arrays
+
+        registry: optional output of create_product_registry() from subcomponent a,
+            built from dr_product_info and dr_hours if None
+
+    Returns:
+        inputs: dictionary with
+            'rates': array of hourly emissions rates, shape (scenario, year, hour)
+            'scenarios': list of emissions rates column names (str)
+            'years': array of years (int)
+            'months': array of the month (int) of each hour
+            'hours': array of DR hours, times any potential multipliers,
+                shape (product, hour)
+            'load_shapes': DR hours plus the rebound of shift products,
+                shape (product, hour)
+            'potential': array of DR potential, shape (year, product)
+            'products': list of DR product names (str) for each product row
+            'shift': array of bools, True for DR shift products
+            'groups': list of (DR plan, season, bin, products, column indices)
+                for each output table
+    """
+
+    if potential_profiles is None:
+        potential_profiles = {}
+    if precision not in PRECISIONS:
+        raise ValueError('Please input one of '+', '.join(PRECISIONS)\
+                         +' for the precision argument')
+
+    # Hourly rates for each scenario and year, leap days dropped: (scenario, year, hour)
+    scenarios = list(em_rates.columns[4:])
+    rates, years = get_rates_array(em_rates, [x.replace(' Emissions Rate Estimate', '') \
+                                              for x in scenarios])
+
+    # Stack the DR hours and potential of every DR plan, season and product.
+    # groups holds (DR plan, season, bin, products, column indices) for each output table.
+    groups = []
+    hours_list = []
+    name_list = []
+    shift_list = []
+    potential_list = []
+    months = None
+    ncol = 0
+    if registry is None:
+        registry = create_product_registry(dr_product_info, dr_hours)
+    for ind, binning in enumerate(bins):
+        for season in seasons[ind]:
+            # Get a "oldbins_summer" type name
+            combo_name = binning + "_" + season
+            hrs = dr_hours[combo_name]
+            pot = dr_potential[combo_name].set_index('Year').reindex(years)
+            if months is None:
+                months = hrs['Month'].values.astype(int)
+            # Grab the names of the DR products that
+            # are actually implemented for this season.
+            # This assumes we have the same formatted DF everytime
+            dr_list = list(hrs.columns.values[3:])
+            bin_dict = get_bin_products(registry, binning, dr_list)
+            # dr_hours may hold a subset of the products of the registry, and a
+            # registry built without DR hours has no column index
+            column_index = registry['column_index'].get(combo_name)
+            if column_index is None:
+                column_index = {x: idx for idx, x in enumerate(hrs.columns)}
+            hrs_values = hrs.values
+            if binning in potential_profiles:
+                hrs_values = hrs_values.astype(float)
+                hrs_values[:, 3:] = hrs[dr_list].values \
+                    * get_potential_multipliers(hrs, potential_profiles[binning]).values
+            pot_values = pot[dr_list].values
+
+            for bin_num, bin_drs in bin_dict.items():
+                for dr_name in bin_drs:
+                    shift_list.append(registry['products'][(binning, dr_name)]['Shift'])
+                    name_list.append(dr_name)
+                    hours_list.append(hrs_values[:, column_index[dr_name]])
+                    potential_list.append(pot_values[:, column_index[dr_name]-3])
+
+                groups.append((binning, season, bin_num, bin_drs,
+                               np.arange(ncol, ncol+len(bin_drs))))
+                ncol += len(bin_drs)
+
+    # Add the rebound of all shift products at once.
+    hours_array = np.array(hours_list, dtype=float)
+    kernels = get_rebound_kernels(hours_array, name_list, shift_list, rebound_kernels)
+    load_shapes = apply_load_shapes(hours_array, kernels)
+
+    inputs = {'rates': rates.astype(precision),
+              'scenarios': scenarios,
+              'years': years,
+              'months': months,
+              'hours': hours_array.astype(precision),
+              'load_shapes': load_shapes.astype(precision),
+              'potential': np.array(potential_list, dtype=precision).T,
+              'products': name_list,
+              'shift': np.array(shift_list, dtype=bool),
+              'groups': groups}
+    return inputs
+
+
+def get_column_labels(inputs):
+    """
+    Labels each product column of the stacked arrays from stack_impacts_inputs
+    with its DR plan, season, bin and product name.
+
+    Args:
+        inputs: output of stack_impacts_inputs()
+
+    Returns:
+        labels: dataframe with columns "Plan", "Season", "Bin" and "Product",
+            with a row for each product column
+    """
+    rows = []
+    for binning, season, bin_num, bin_drs, _ in inputs['groups']:
+        for dr_name in bin_drs:
+            rows.append([binning, season, bin_num, dr_name])
+
+    return pd.DataFrame(data=rows, columns=['Plan', 'Season', 'Bin', 'Product'])
+
+
+def get_save_name(scenario, binning, season, bin_num):
+    """
+    Outputs the output_dictionary key (e.g. "oldbins_Winter_bin2") of the
+    yearly avoided emissions of an emissions scenario, DR plan, season and bin.
+
+    Args:
+        scenario: emissions rates column name (str)
+        binning: DR plan (str)
+        season: season (str)
+        bin_num: bin name (str), e.g. "Bin 2"
+
+    Returns:
+        save_name: key of the output dictionary (str)
+    """
+    #Naming convention such that if it's baseline, there is no "Baseline"
+    #in output file name. For backwards compatibility with dashboard formatting
+    if scenario == "Baseline Emissions Rate Estimate":
+        save_name = binning+"_"+season+"_"+"bin"+bin_num.split()[1]
+    else:
+        emissions_name = scenario.split()[0]
+        save_name = emissions_name+"_"+binning+"_"+season+"_"\
+            +"bin"+bin_num.split()[1]
+
+    return save_name
+
+
+def build_output_dictionary(impacts, inputs):
+    """
+    Rebuilds the dictionary of yearly avoided emissions tables
+    from an array of impacts of the stacked products.
+
+    Args:
+        impacts: array of yearly avoided emissions with shape
+            (scenario, year, product), e.g. from calc_impacts_array()
+        inputs: output of stack_impacts_inputs()
+
+    Returns:
+        output_dictionary: see calc_yearly_avoided_emissions()
+    """
+    return cube_to_dictionary(build_results_cube(impacts, inputs))
+
+
+def parse_save_name(save_name):
+    """
+    Splits an output_dictionary key made by get_save_name into its
+    emissions scenario, DR plan, season and bin.
+
+    Args:
+        save_name: key of the output dictionary (str), e.g. "oldbins_Winter_bin2"
+            or "High_newbins_Fall_bin1"
+
+    Returns:
+        scenario, binning, season, bin_num: e.g. ("Baseline", "oldbins",
+            "Winter", "Bin 2")
+    """
+    parts = save_name.split('_')
+    if len(parts) < 3:
+        raise ValueError('Unknown emissions impacts key: '+str(save_name))
+    scenario = 'Baseline' if len(parts) == 3 else parts[0]
+    binning = parts[0] if len(parts) == 3 else '_'.join(parts[1:-2])
+
+    return scenario, binning, parts[-2], 'Bin '+parts[-1].replace('bin', '')
+
+
+def build_results_cube(impacts, inputs):
+    """
+    Arranges the impacts of the stacked products into a results cube,
+        a labeled array of yearly avoided emissions over
+        (scenario, DR plan, season, bin, product, year), with NaN
+        where a product is not in a DR plan, season and bin.
+
+    Args:
+        impacts: array of yearly avoided emissions with shape
+            (scenario, year, product), e.g. from calc_impacts_array()
+        inputs: output of stack_impacts_inputs()
+
+    Returns:
+        cube: dictionary with
+            'dims': names of the dimensions ("Scenario", "Plan", "Season",
+                "Bin", "Product", "Year")
+            'coords': dictionary of the labels of each dimension, e.g.
+                'Scenario': ["Baseline"], 'Bin': ["Bin 1", "Bin 2"]
+            'values': array of yearly avoided emissions (metric tons CO2e)
+                with a dimension for each of dims
+            'mask': array of bools with shape (plan, season, bin, product),
+                True for the products in each DR plan, season and bin
+            'order': array of ints with shape (plan, season, bin, product),
+                the column order of each product in its yearly avoided
+                emissions table (see cube_to_dictionary)
+    """
+    labels = get_column_labels(inputs)
+    coords = {'Scenario': [x.replace(' Emissions Rate Estimate', '') \
+                           for x in inputs['scenarios']],
+              'Plan': list(dict.fromkeys(labels['Plan'])),
+              'Season': list(dict.fromkeys(labels['Season'])),
+              'Bin': sorted(set(labels['Bin']), key=lambda x: int(x.split()[1])),
+              'Product': list(dict.fromkeys(labels['Product'])),
+              'Year': list(inputs['years'])}
+
+    dims = ('Scenario', 'Plan', 'Season', 'Bin', 'Product', 'Year')
+    index = tuple(pd.Index(coords[x]).get_indexer(labels[x]) for x in dims[1:5])
+
+    values = np.full(tuple(len(coords[x]) for x in dims), np.nan, dtype=impacts.dtype)
+    values[:, index[0], index[1], index[2], index[3], :] = impacts.transpose(0, 2, 1)
+    mask = np.zeros(values.shape[1:5], dtype=bool)
+    mask[index] = True
+    order = np.zeros(values.shape[1:5], dtype=int)
+    order[index] = np.arange(len(labels))
+
+    return {'dims': dims, 'coords': coords, 'values': values, 'mask': mask, 'order': order}
+
+
+def cube_to_dictionary(cube):
+    """
+    Compatibility view of a results cube as the dictionary of yearly avoided
+        emissions tables of calc_yearly_avoided_emissions(), with a table for
+        each scenario, DR plan, season and bin.
+
+    Args:
+        cube: output of build_results_cube()
+
+    Returns:
+        output_dictionary: see calc_yearly_avoided_emissions()
+    """
+    coords = cube['coords']
+    products = np.array(coords['Product'])
+    years = np.array(coords['Year'], dtype=float)
+
+    output_dictionary = {}
+    for s_ind, scenario in enumerate(coords['Scenario']):
+        for p_ind, s_idx, b_ind in zip(*np.nonzero(cube['mask'].any(axis=-1))):
+            cols = np.flatnonzero(cube['mask'][p_ind, s_idx, b_ind])
+            cols = cols[np.argsort(cube['order'][p_ind, s_idx, b_ind][cols])]
+            yearly_avoided = pd.DataFrame(data=cube['values'][s_ind, p_ind, s_idx, b_ind][cols].T,
+                                          columns=list(products[cols]))
+            yearly_avoided.insert(0, 'Year', years)
+
+            save_name = get_save_name(scenario+' Emissions Rate Estimate', coords['Plan'][p_ind],
+                                      coords['Season'][s_idx], coords['Bin'][b_ind])
+            output_dictionary[save_name] = yearly_avoided
+
+    return output_dictionary
+
+
+def dictionary_to_cube(output_dictionary):
+    """
+    Makes a results cube from a dictionary of yearly avoided emissions
+        tables, e.g. the output of calc_yearly_avoided_emissions().
+
+    Args:
+        output_dictionary: see calc_yearly_avoided_emissions()
+
+    Returns:
+        cube: see build_results_cube()
+    """
+    rows = []
+    for key, yearly_avoided in output_dictionary.items():
+        scenario, binning, season, bin_num = parse_save_name(key)
+        for dr_name in yearly_avoided.columns.drop('Year'):
+            rows.append([scenario, binning, season, bin_num, dr_name])
+    labels = pd.DataFrame(data=rows, columns=['Scenario', 'Plan', 'Season', 'Bin', 'Product'])
+
+    dims = ('Scenario', 'Plan', 'Season', 'Bin', 'Product', 'Year')
+    coords = {'Scenario': list(dict.fromkeys(labels['Scenario'])),
+              'Plan': list(dict.fromkeys(labels['Plan'])),
+              'Season': list(dict.fromkeys(labels['Season'])),
+              'Bin': sorted(set(labels['Bin']), key=lambda x: int(x.split()[1])),
+              'Product': list(dict.fromkeys(labels['Product'])),
+              'Year': list(dict.fromkeys(np.concatenate(
+                  [x['Year'].values for x in output_dictionary.values()])))}
+
+    values = np.full(tuple(len(coords[x]) for x in dims), np.nan)
+    mask = np.zeros(values.shape[1:5], dtype=bool)
+    order = np.zeros(values.shape[1:5], dtype=int)
+    for key, yearly_avoided in output_dictionary.items():
+        table = yearly_avoided.set_index('Year').reindex(coords['Year'])
+        index = tuple(coords[x].index(y) for x, y in zip(dims[:4], parse_save_name(key)))
+        p_idx = pd.Index(coords['Product']).get_indexer(table.columns)
+        values[index][p_idx] = table.values.T
+        mask[index[1:]][p_idx] = True
+        order[index[1:]][p_idx] = np.arange(len(p_idx))
+
+    return {'dims': dims, 'coords': coords, 'values': values, 'mask': mask, 'order': order}
+
+
+def get_hourly_impacts(inputs):
+    """
+    Outputs the hourly avoided emissions of every scenario and product
+    one year at a time, so that the hourly impacts of all years are
+    never held in memory at once. Summing the hourly impacts of a year
+    over the hours gives the yearly avoided emissions.
+
+    Args:
+        inputs: output of stack_impacts_inputs()
+
+    Returns:
+        hourly_impacts: dictionary with
+            'scenarios': list of emissions scenario names (str), e.g. "Baseline"
+            'years': array of years (int)
+            'columns': output of get_column_labels()
+            'impacts': generator of (year, array of avoided emissions with
+                shape (scenario, hour, product)) for each year
+    """
+    def impacts_by_year():
+        for y_ind, year in enumerate(inputs['years']):
+            yield year, inputs['rates'][:, y_ind, :, None] * inputs['load_shapes'].T \
+                * inputs['potential'][y_ind] * EMISSIONS_CHANGEUNITS
+
+    hourly_impacts = {'scenarios': [x.replace(' Emissions Rate Estimate', '') \
+                                    for x in inputs['scenarios']],
+                      'years': inputs['years'],
+                      'columns': get_column_labels(inputs),
+                      'impacts': impacts_by_year()}
+    return hourly_impacts
+
+
+def get_impact_attribution(inputs):
+    """
+    Attributes the yearly avoided emissions of every scenario and product
+        to the months and hours of the day they come from, separately for
+        hours of load reduction and for the rebound hours of shift products
+        (hours of load increase). The hourly impacts of get_hourly_impacts
+        are reduced with one bincount per year, keyed by scenario,
+        reduction or rebound, month x hour, and product, so the rates
+        are not read again.
+
+    Args:
+        inputs: output of stack_impacts_inputs()
+
+    Returns:
+        df_attribution: dataframe with columns "Scenario", "Plan", "Season",
+            "Bin", "Product", "Year", "Month", "Hour" (hourID),
+            "Avoided Emissions" (from load reductions) and "Rebound Emissions"
+            (from load increases), with a row for each scenario, product,
+            year, month and hour with nonzero impacts. Summing both over
+            the months and hours gives the yearly avoided emissions.
+    """
+    nhours = inputs['load_shapes'].shape[1]
+    nproducts = len(inputs['products'])
+    nscenarios = len(inputs['scenarios'])
+    nyears = len(inputs['years'])
+
+    # Bincount key of each (scenario, hour, product) hourly impact
+    month_hour = (inputs['months'] - 1)*24 + np.arange(nhours) % 24
+    is_rebound = (inputs['load_shapes'] < 0).T.astype(int)
+    keys = (is_rebound*288 + month_hour[:, None])*nproducts + np.arange(nproducts)
+    keys = (np.arange(nscenarios)[:, None, None]*2*288*nproducts + keys).ravel()
+
+    attribution = np.empty((nyears, nscenarios, 2, 12, 24, nproducts))
+    for y_ind, (_, impacts) in enumerate(get_hourly_impacts(inputs)['impacts']):
+        attribution[y_ind] = np.bincount(keys, weights=impacts.ravel(),
+                                         minlength=nscenarios*2*288*nproducts)\
+            .reshape(attribution.shape[1:])
+
+    # One row for each (scenario, product, year, month, hour)
+    attribution = attribution.transpose(1, 5, 0, 3, 4, 2).reshape(-1, 2)
+    s_idx, p_idx, y_idx, m_idx, h_idx = [x.ravel()[attribution.any(axis=1)] \
+        for x in np.meshgrid(np.arange(nscenarios), np.arange(nproducts), np.arange(nyears),
+                             np.arange(12), np.arange(24), indexing='ij')]
+    attribution = attribution[attribution.any(axis=1)]
+
+    scenarios = np.array([x.replace(' Emissions Rate Estimate', '') \
+                          for x in inputs['scenarios']])
+    df_attribution = get_column_labels(inputs).iloc[p_idx].reset_index(drop=True)
+    df_attribution.insert(0, 'Scenario', scenarios[s_idx])
+    df_attribution['Year'] = inputs['years'][y_idx]
+    df_attribution['Month'] = m_idx + 1
+    df_attribution['Hour'] = h_idx + 1
+    df_attribution['Avoided Emissions'] = attribution[:, 0]
+    df_attribution['Rebound Emissions'] = attribution[:, 1]
+
+    return df_attribution
+
+
+def calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                                  rebound_kernels=None, potential_profiles=None, registry=None):
     """
     This function uses emissions rates, DR hours, DR potential,
         and DR product information data to calculate avoided emissions
         each year. It outputs a dictionary of dataframes with emissions
         impacts for each DR plan, bin, and season.
 
+        The inputs of all scenarios, DR plans, seasons and products are
+        aligned by stack_impacts_inputs, their impacts are calculated at once
+        by calc_impacts_array into a results cube (see calc_results_cube),
+        and the output_dictionary is a view of the cube.
+
     Args:
         em_rates: emissions rates dataframe. Formatted with columns "Report_Year", "Report Month",
             "Report Day", "Report Hour", and then column of emissions rates for emissions rate
@@ -224,7 +974,8 @@ def calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, dr_product_i
         dr_hours: dictionary with keys such as ["newbins_Fall"]. Each entry contains a dataframe
             with columns ["hourID", "Month", "Day"] and then columns for each DR product in that
             binning + season combination. Entries for the DR products are 0 in hours when not
-            implemented, and 1 for hours implemented.
+            implemented, and 1 for hours implemented, or the fraction of DR potential
+            dispatched in each hour.
 
         dr_potential: dictionary with same keys as dr_hours (e.g. ["newbins_Fall"). Each entry
             is a dataframe with a column of years implemented, and then columns containing avoided
@@ -239,6 +990,15 @@ def calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, dr_product_i
         seasons: List of seasons we use for each binning format
             (e.g. [['Winter, 'Fall'], ['Winter', 'Summer', 'Fall']])
 
+        rebound_kernels: dictionary of rebound kernels of shift products by
+            product name, defaults to REBOUND_KERNELS (see apply_load_shapes)
+
+        potential_profiles: optional dictionary with a potential profile dataframe
+            for each binning, with hour-varying multipliers of DR potential
+            (see get_potential_multipliers)
+
+        registry: optional output of create_product_registry() from subcomponent a
+
     Returns:
         output_dictionary: Dictionary containing keys such as ['oldbins_Winter_bin2'],
             or ['oldbins_Summer_bin3']. Each entry contains a dataframe
@@ -246,102 +1006,38 @@ def calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, dr_product_i
             in that binning+season combination.
     """
 
-    #Define the output_dictionary
+    return cube_to_dictionary(calc_results_cube(em_rates, dr_hours, dr_potential,
+                                                dr_product_info, bins, seasons,
+                                                rebound_kernels, potential_profiles,
+                                                registry=registry))
 
-    em_rates = em_rates.rename({'Report_Month': 'Month', \
-                                'Report_Day': 'Day', "Report_Hour": "hourID"}, axis='columns')
 
-    # Get the start and end years and a list of years.
-    # These are constant across newbins/oldbins, etc.
-    year_start = min(em_rates.Report_Year)
-    year_end = max(em_rates.Report_Year)
-    years = np.arange(year_start, year_end+1)
+def calc_results_cube(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                      rebound_kernels=None, potential_profiles=None, precision='float64',
+                      registry=None):
+    """
+    Calculates the yearly avoided emissions of calc_yearly_avoided_emissions
+        as a results cube.
 
-    output_dictionary = {}
-    #Loop through all the different emissions scenarios provided
-    #in em_rates dataframe.
-    for s_ind, scenario in enumerate(em_rates.columns[4:]):
-        # Loop through DR plan, season, bin, products
-        for ind, binning in enumerate(bins):
-            dr_info = dr_product_info[binning]
-
-            for season in seasons[ind]:
-                # Get a "oldbins_summer" type name
-                combo_name = binning + "_" + season
-                hrs = dr_hours[combo_name]
-                pot = dr_potential[combo_name]
-                # Grab the names of the DR products that
-                # are actually implemented for this season.
-                # This assumes we have the same formatted DF everytime
-                dr_list = list(hrs.columns.values[3:])
-                bin_dict = sort_bins(dr_info, dr_list)
-
-                for bin_num in list(bin_dict.keys()):
-                    bin_drs = bin_dict[bin_num]
-
-                    # Initialize dataframe
-                    if binning=='newbins':
-                        #modify_resTOU_names
-                        new_names = ['DVR', 'ResTOU_shift', 'ResTOU_shed']
-                        start_matrix = np.zeros((len(years), len(new_names)+1))
-                        start_matrix[:, 0] = years.astype(int)
-                        yearly_avoided = pd.DataFrame(data = start_matrix,\
-                              columns=['Year']+new_names)
-                    else:
-                        start_matrix = np.zeros((len(years), len(bin_drs)+1))
-                        start_matrix[:, 0] = years.astype(int)
-                        yearly_avoided = pd.DataFrame(data = start_matrix, columns=['Year']+bin_drs)
-
-                    for dr_name in bin_drs:
-
-                        # Do Shifting if it's a shift product.
-                        shift = dr_product_info[binning]['Shift or Shed?'].\
-                        loc[dr_product_info[binning].Product==dr_name]
-                        shift = shift.iloc[0]
-
-                        if shift == 'Shift':
-                            dr_season_hours = shift_hours(hrs[dr_name])
-                        else:
-                            dr_season_hours = hrs[dr_name]
-
-                        for year in range(year_start, year_end+1):
-                            dr_pot = pot[dr_name].loc[pot.Year==year]
-                            short_df = em_rates.loc[em_rates.Report_Year==year]
-                            if year%4==0:
-
-                                #There's no DR implemented on leap days
-                                #On Leap years, need to delete february 29
-                                truth_array = short_df['Day'].loc[short_df['Month'].values==2]==29
-                                leap_inds = truth_array.loc[truth_array]
-                                delete_inds = short_df.loc[leap_inds.index].index
-                                short_df = short_df.drop(delete_inds, axis=0)
-                                out_arr = short_df[scenario].values\
-                                    *dr_season_hours*dr_pot.values
-                                out_arr = out_arr * EMISSIONS_CHANGEUNITS
-                                yearly_avoided[dr_name].iloc[year-year_start] = out_arr.sum()
-
-                            else:
-                                out_arr = short_df[scenario].values*\
-                                    dr_season_hours*dr_pot.values
-                                out_arr = out_arr * EMISSIONS_CHANGEUNITS
-                                yearly_avoided[dr_name].iloc[year-year_start] = out_arr.sum()
-
-                    #Naming convention such that if it's baseline, there is no "Baseline"
-                    #in output file name. For backwards compatibility with dashboard formatting
-                    if scenario == "Baseline Emissions Rate Estimate":
-                        save_name = binning+"_"+season+"_"+"bin"+bin_num.split()[1]
-                    else:
-                        emissions_name = scenario.split()[0]
-                        save_name = emissions_name+"_"+binning+"_"+season+"_"\
-                            +"bin"+bin_num.split()[1]
-
-
-                    output_dictionary[save_name] = yearly_avoided
+    Args:
+        precision: see stack_impacts_inputs()
+        the other arguments: see calc_yearly_avoided_emissions()
 
-    return output_dictionary
+    Returns:
+        cube: output of build_results_cube()
+    """
+    inputs = stack_impacts_inputs(em_rates, dr_hours, dr_potential, dr_product_info,
+                                  bins, seasons, rebound_kernels, potential_profiles, precision,
+                                  registry)
+    impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'], inputs['potential'],
+                                 inputs['months'])
+
+    return build_results_cube(impacts, inputs)
 
 
-def subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons):
+def subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, seasons,
+                     rebound_kernels=None, potential_profiles=None, precision='float64',
+                     registry=None):
     """
      Args:
         em_rates: emissions rates dataframe. Formatted with columns "Report_Year", "Report Month",
@@ -351,7 +1047,8 @@ def subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, se
         dr_hours: dictionary with keys such as ["newbins_Fall"]. Each entry contains a dataframe
             with columns ["hourID", "Month", "Day"] and then columns for each DR product in that
             binning + season combination. Entries for the DR products are 0 in hours when not
-            implemented, and 1 for hours implemented.
+            implemented, and 1 for hours implemented, or the fraction of DR potential
+            dispatched in each hour.
 
         dr_potential: dictionary with same keys as dr_hours (e.g. ["newbins_Fall"). Each entry
             is a dataframe with a column of years implemented, and then columns containing avoided
@@ -366,6 +1063,18 @@ def subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, se
         seasons: List of seasons we use for each binning format
             (e.g. [['Winter, 'Fall'], ['Winter', 'Summer', 'Fall']])
 
+        rebound_kernels: dictionary of rebound kernels of shift products by
+            product name, defaults to REBOUND_KERNELS (see apply_load_shapes)
+
+        potential_profiles: optional dictionary with a potential profile dataframe
+            for each binning, with hour-varying multipliers of DR potential
+            (see get_potential_multipliers)
+
+        precision: 'float64' or 'float32' precision of the calculation
+            (see stack_impacts_inputs)
+
+        registry: optional output of create_product_registry() from subcomponent a
+
     Returns:
         out_dict: the output of calc_yearly_avoided_emissions
 
@@ -388,27 +1097,31 @@ def subcomp_c_runall(em_rates, dr_hours, dr_potential, dr_product_info, bins, se
     if not isinstance(seasons,list):
         raise ValueError('Please input a dataframe for the seasons argument')
 
-    out_dict = calc_yearly_avoided_emissions(em_rates, dr_hours, dr_potential, \
-                     dr_product_info, bins, seasons)
+    cube = calc_results_cube(em_rates, dr_hours, dr_potential, dr_product_info, \
+                             bins, seasons, rebound_kernels, potential_profiles, precision,
+                             registry)
+    out_dict = cube_to_dictionary(cube)
 
     #Only want to output barchart for first scenario input
-    #This gets only the parts of the dictionary we want to
-    #use to make a barchart.
-    scenario_name = em_rates.columns[4]
-    keys = []
-    emissions_name = scenario_name.split()[0]
-    for i, key in enumerate(out_dict.keys()):
-        if emissions_name in key:
-            keys = keys+[key]
-        elif emissions_name=="Baseline":
-            #Check, if it's baseline, only 3 words in key
-            if len(key.split("_"))==3:
-                keys = keys+[key]
-        else:
-            continue
-            #Do Nothing
-
-    dict_to_pass = {key: out_dict[key] for key in keys}
-    barchart_df, newbins_barchart = make_barchart_df(dict_to_pass)
+    barchart_df, newbins_barchart = make_cube_barchart_df(cube)
 
     return out_dict, barchart_df, newbins_barchart
+
+
+def get_scenario_impacts(out_dict, scenario_name):
+    """
+    This gets only the parts of the output dictionary of
+    calc_yearly_avoided_emissions for one emissions scenario,
+    e.g. to use to make a barchart.
+
+    Args:
+        out_dict: the output of calc_yearly_avoided_emissions
+        scenario_name: emissions rates column name (str) of the scenario
+
+    Returns:
+        dictionary with the entries of out_dict for the scenario
+    """
+    emissions_name = scenario_name.split()[0]
+    keys = [x for x in out_dict.keys() if parse_save_name(x)[0] == emissions_name]
+
+    return {key: out_dict[key] for key in keys}
@@ -6,6 +6,9 @@ including emissions factors, DR hours, and DR potential.
 """
 
 import pandas as pd
+import numpy as np
+
+from subcomp_a_organize_data import create_product_registry
 
 def checkdict(dictofdict,**kwargs):
     """
@@ -40,7 +43,7 @@ def output_dr_hours(dr_hours_dict,dir_out):
     This table will be shown on the more info page.
 
     Args:
-        dr_hours_dict: dictionary of 1-or-0 DR hours dataframes
+        dr_hours_dict: dictionary of DR hours dataframes
                        for each DR plan and season
                        from subcomponent a
         dir_out: the directory to output files to
@@ -74,7 +77,7 @@ def output_dr_hours(dr_hours_dict,dir_out):
         for i in range(1, len(dvr_on)):
 
             # find start time for 4-hr periods
-            if (dvr_on[i] == 1) and (dvr_on[i-1] == 0):
+            if (dvr_on[i] > 0) and (dvr_on[i-1] == 0):
                 if not hour[i] in start_4hr:
                     start_4hr.append(hour[i])
                     period_4hr_nondlc.append(str(hour[i]) + " - " + str(hour[i] + 3))
@@ -82,7 +85,7 @@ def output_dr_hours(dr_hours_dict,dir_out):
             # find start time for 6-hr periods
             if 'ResHPWHDLCGrd' in time_df.columns:
                 dlc_on = time_df['ResHPWHDLCGrd']
-                if (dlc_on[i] == 1) and (dlc_on[i-1] == 0):
+                if (dlc_on[i] > 0) and (dlc_on[i-1] == 0):
                     if not hour[i] in start_6hr:
                         start_6hr.append(hour[i])
                         period_6hr_dlc.append(str(hour[i]) + " - " + str(hour[i] + 5))
@@ -105,7 +108,7 @@ def output_dr_hours(dr_hours_dict,dir_out):
     output_hours_df.to_csv(dir_out+'output_dr_hours.csv', index=False)
 
 
-def output_dr_potential(dr_pot_dict, product_info_dict,dir_out):
+def output_dr_potential(dr_pot_dict, product_info_dict,dir_out, registry=None):
     """
     Given subcomponent a output with DR potential and product info,
     outputs csv files contain DR potential for each product,
@@ -120,10 +123,14 @@ def output_dr_potential(dr_pot_dict, product_info_dict,dir_out):
                            with each dataframe corresponding to a DR plan
                            from subcomponent a
         dir_out: the directory to output files to
+        registry: optional output of create_product_registry() from
+                  subcomponent a, built from product_info_dict if None
     """
     checkdict(False, dr_pot_dict = dr_pot_dict,
                 product_info_dict = product_info_dict)
     dir_out = dir_out + 'dr_potential/'
+    if registry is None:
+        registry = create_product_registry(product_info_dict)
 
     productsum_out = []
     for key in dr_pot_dict.keys():
@@ -132,11 +139,11 @@ def output_dr_potential(dr_pot_dict, product_info_dict,dir_out):
         # get product info to know which products are in which bins
         drplan_season = key.split('_')
         drname = drplan_season[0]
-        df_product_info = product_info_dict[drname]
+        bin_products = registry['bin_products'][drname]
 
         # loop through bins, output products in each bin
         for idx in range(1, 5):
-            pdlist = df_product_info[df_product_info['Bin'] == 'Bin '+str(idx)]['Product'].tolist()
+            pdlist = list(bin_products.get('Bin '+str(idx), []))
             if pdlist:  # only if not empty, excludes empty bins
                 pdlist.insert(0, 'Year')
                 # get potential for these products and output to csv
@@ -177,6 +184,25 @@ def output_avg_emissions_rates(df_seasonal_ave, df_annual_ave,
                 df_oneyear_seasonal_ave = df_oneyear_seasonal_ave)
     if not isinstance(year,int):
         raise ValueError('Please input an int for the year argument')
+
+    output_dr_days_ave(df_seasonal_ave, df_annual_ave, dir_out)
+    output_alldays_ave(df_oneyear_seasonal_ave, year, dir_out)
+
+
+def output_dr_days_ave(df_seasonal_ave, df_annual_ave, dir_out):
+    """
+    Outputs the averages of hourly emissions rates for DR days
+    into csv files for each DR plan (and season) and emissions scenario.
+    Called in output_avg_emissions_rates(), or with only some of the
+    DR plans and scenarios to rewrite their files.
+
+    Args:
+        df_seasonal_ave: dictionary of seasonally averaged hourly emissions rates
+                        for days with DR from subcomponent b
+        df_annual_ave: dictionary of annually averaged hourly emissions rates
+                        for days with DR from subcomponent b
+        dir_out: the directory to output files to
+    """
     dir_out = dir_out + 'emissions_rates/'
 
     for plan_season_key in df_seasonal_ave.keys():
@@ -187,12 +213,124 @@ def output_avg_emissions_rates(df_seasonal_ave, df_annual_ave,
         for scenario_key in df_annual_ave[plan_key].keys():
             fname = dir_out+'DRdays_allyears_'+plan_key+'_Annual_'+scenario_key+'.csv'
             df_annual_ave[plan_key][scenario_key].to_csv(fname, index=False)
+
+
+def output_alldays_ave(df_oneyear_seasonal_ave, year, dir_out):
+    """
+    Outputs the averages of hourly emissions rates for all days of a year
+    into csv files for each season and emissions scenario.
+    Called in output_avg_emissions_rates(), or with only some of the
+    scenarios to rewrite their files.
+
+    Args:
+        df_oneyear_seasonal_ave: dictionary of seasonally, annually averaged hourly
+                        emissions rates for all days of a given year
+                        from subcomponent b
+        year: the year chosen for the main page avg emissions factors (int)
+        dir_out: the directory to output files to
+    """
+    dir_out = dir_out + 'emissions_rates/'
+
     for season_key in df_oneyear_seasonal_ave.keys():
         for scenario_key in df_oneyear_seasonal_ave[season_key].keys():
             fname = dir_out+'alldays_'+str(year)+'_'+season_key+'_'+scenario_key+'.csv'
             df_oneyear_seasonal_ave[season_key][scenario_key].to_csv(fname, index=False)
 
 
+def output_month_hour_ave(df_month_hour_ave, dir_out):
+    """
+    Given subcomp_b output with month x hour average emissions rates,
+    outputs one csv file for each emissions scenario, with a row
+    for each year and month and a column for each hour, so that the
+    dashboard can slice out a month x hour heatmap for any year.
+
+    Args:
+        df_month_hour_ave: dictionary of month x hour averaged emissions rates
+                           for each year, for each emissions scenario
+                           from subcomponent b
+        dir_out: the directory to output files to
+    """
+    checkdict(False, df_month_hour_ave = df_month_hour_ave)
+    dir_out = dir_out + 'emissions_rates/'
+
+    for scenario_key in df_month_hour_ave.keys():
+        fname = dir_out+'monthhour_allyears_'+scenario_key+'.csv'
+        df_month_hour_ave[scenario_key].to_csv(fname, index=False)
+
+
+def output_stratified_ave(df_stratified_ave, dir_out):
+    """
+    Given subcomp_b output with hourly average emissions rates stratified
+    by day type (weekday, weekend, holiday) and peak days, outputs them
+    into csv files for each season and emissions scenario, with a column
+    for each day type and for the peak days.
+
+    Args:
+        df_stratified_ave: dictionary of seasonally, annually averaged hourly
+                           emissions rates for each day type and the peak days
+                           averaged over full period from subcomponent b
+        dir_out: the directory to output files to
+    """
+    checkdict(True, df_stratified_ave = df_stratified_ave)
+    dir_out = dir_out + 'emissions_rates/'
+
+    for season_key in df_stratified_ave.keys():
+        for scenario_key in df_stratified_ave[season_key].keys():
+            fname = dir_out+'stratified_allyears_'+season_key+'_'+scenario_key+'.csv'
+            df_stratified_ave[season_key][scenario_key].to_csv(fname, index=False)
+
+
+def output_effective_rates(df_effective_rates, dir_out):
+    """
+    Given subcomp_b output with the potential-weighted effective emissions
+    rates of each bin, outputs them into csv files for each DR plan, season
+    and emissions scenario, with a row for each year and a column for each bin.
+
+    Args:
+        df_effective_rates: dictionary of yearly effective emissions rates
+                            for each bin from subcomponent b
+        dir_out: the directory to output files to
+    """
+    checkdict(True, df_effective_rates = df_effective_rates)
+    dir_out = dir_out + 'emissions_rates/'
+
+    for plan_season_key in df_effective_rates.keys():
+        for scenario_key in df_effective_rates[plan_season_key].keys():
+            fname = dir_out+'effective_rates_'+plan_season_key+'_'+scenario_key+'.csv'
+            df_effective_rates[plan_season_key][scenario_key].to_csv(fname, index=False)
+
+
+def output_best_windows(df_best_windows, df_seasonal_windows, dir_out):
+    """
+    Given subcomp_b output with the best DR event window of each day and
+    the comparison of each product's DR hours to it, outputs them into
+    csv files for each emissions scenario (best_windows_<scenario>.csv)
+    and for each DR plan, season and emissions scenario
+    (best_windows_<plan>_<season>_<scenario>.csv).
+
+    Args:
+        df_best_windows: dictionary of the best window of each day
+                         for each emissions scenario from subcomponent b
+        df_seasonal_windows: dictionary of the best windows and DR hours scores
+                             of each product, for each DR plan, season
+                             and emissions scenario from subcomponent b
+        dir_out: the directory to output files to
+    """
+    checkdict(False, df_best_windows = df_best_windows)
+    # seasons without DR days are left out, so there may be none
+    if df_seasonal_windows:
+        checkdict(True, df_seasonal_windows = df_seasonal_windows)
+    dir_out = dir_out + 'emissions_rates/'
+
+    for scenario_key in df_best_windows.keys():
+        fname = dir_out+'best_windows_'+scenario_key+'.csv'
+        df_best_windows[scenario_key].to_csv(fname, index=False)
+    for plan_season_key in df_seasonal_windows.keys():
+        for scenario_key in df_seasonal_windows[plan_season_key].keys():
+            fname = dir_out+'best_windows_'+plan_season_key+'_'+scenario_key+'.csv'
+            df_seasonal_windows[plan_season_key][scenario_key].to_csv(fname, index=False)
+
+
 def output_emissions_impacts(emissions_impacts_dict, emissions_annual_df,
                             newbins_barchart_df, dir_out):
     """
@@ -223,16 +361,150 @@ def output_emissions_impacts(emissions_impacts_dict, emissions_annual_df,
     emissions_annual_df.to_csv(dir_out+'emissions_reductions_barchart.csv')
     newbins_barchart_df.to_csv(dir_out+'newbins_barchart.csv')
 
+
+def output_hourly_impacts(hourly_impacts, dir_out):
+    """
+    Given subcomp_c output with hourly emissions impacts, streams them
+    one year at a time into one numpy file for each emissions scenario,
+    hourly_impacts_<scenario>.npy, with shape (year, hour, product), in the
+    precision of the impacts (float64 or float32).
+    Product columns are labelled in hourly_impacts_columns.csv and years
+    in hourly_impacts_years.csv. Read a file with
+    numpy.load(fname, mmap_mode='r') to load only the years and products used.
+
+    Args:
+        hourly_impacts: dictionary of hourly emissions impacts
+                        from get_hourly_impacts in subcomponent c
+        dir_out: the directory to output files to
+    """
+    if not isinstance(hourly_impacts,dict):
+        raise ValueError('Please input a dictionary for the hourly_impacts argument')
+    dir_out = dir_out + 'emissions_impacts/'
+
+    columns = hourly_impacts['columns']
+    years = hourly_impacts['years']
+    columns.to_csv(dir_out+'hourly_impacts_columns.csv', index_label='Column')
+    pd.DataFrame({'Year': years}).to_csv(dir_out+'hourly_impacts_years.csv',
+                                         index_label='Index')
+
+    files = {}
+    for y_ind, (_, impacts) in enumerate(hourly_impacts['impacts']):
+        for s_ind, scenario in enumerate(hourly_impacts['scenarios']):
+            if scenario not in files:
+                files[scenario] = np.lib.format.open_memmap(
+                    dir_out+'hourly_impacts_'+scenario+'.npy', mode='w+',
+                    dtype=impacts.dtype, shape=(len(years),)+impacts.shape[1:])
+            files[scenario][y_ind] = impacts[s_ind]
+            files[scenario].flush()
+
+
+def output_monte_carlo_bands(df_monte_carlo_bands, dir_out):
+    """
+    Given percentile bands of the emissions impacts from the Monte Carlo
+    uncertainty analysis, outputs them into one csv file with a row
+    for each scenario, DR plan, season, bin, product and year.
+
+    Args:
+        df_monte_carlo_bands: dataframe of percentile bands
+                              from monte_carlo_runall
+        dir_out: the directory to output files to
+    """
+    if not isinstance(df_monte_carlo_bands,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the df_monte_carlo_bands argument')
+    dir_out = dir_out + 'emissions_impacts/'
+
+    df_monte_carlo_bands.to_csv(dir_out+'monte_carlo_bands.csv', index=False)
+
+
+def output_impact_attribution(df_attribution, dir_out):
+    """
+    Given the month x hour attribution of the emissions impacts from
+    get_impact_attribution in subcomponent c, outputs one compressed numpy
+    file for each emissions scenario, impact_attribution_<scenario>.npz,
+    with an array for each column. Label columns (Plan, Season, Bin, Product)
+    are stored as integer codes, with their labels in "<column>_labels",
+    and Year, Month and Hour as small integers. Read a file back into
+    a dataframe with read_impact_attribution.
+
+    Args:
+        df_attribution: dataframe of the month x hour attribution
+                        from get_impact_attribution in subcomponent c
+        dir_out: the directory to output files to
+    """
+    if not isinstance(df_attribution,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the df_attribution argument')
+    dir_out = dir_out + 'emissions_impacts/'
+
+    for scenario, df_scenario in df_attribution.groupby('Scenario', sort=False):
+        arrays = {}
+        for column in ['Plan', 'Season', 'Bin', 'Product']:
+            codes, labels = pd.factorize(df_scenario[column])
+            arrays[column] = codes.astype(np.int16)
+            arrays[column+'_labels'] = np.array(labels, dtype=str)
+        arrays['Year'] = df_scenario['Year'].values.astype(np.int16)
+        arrays['Month'] = df_scenario['Month'].values.astype(np.int8)
+        arrays['Hour'] = df_scenario['Hour'].values.astype(np.int8)
+        arrays['Avoided Emissions'] = df_scenario['Avoided Emissions'].values
+        arrays['Rebound Emissions'] = df_scenario['Rebound Emissions'].values
+
+        np.savez_compressed(dir_out+'impact_attribution_'+scenario+'.npz', **arrays)
+
+
+def read_impact_attribution(fname):
+    """
+    Reads a file written by output_impact_attribution into a dataframe.
+
+    Args:
+        fname: the impact_attribution_<scenario>.npz file (str)
+
+    Returns:
+        df_attribution: dataframe with the columns of get_impact_attribution,
+                        except Scenario
+    """
+    with np.load(fname) as arrays:
+        df_attribution = pd.DataFrame()
+        for column in ['Plan', 'Season', 'Bin', 'Product']:
+            df_attribution[column] = arrays[column+'_labels'][arrays[column]]
+        for column in ['Year', 'Month', 'Hour', 'Avoided Emissions', 'Rebound Emissions']:
+            df_attribution[column] = arrays[column]
+
+    return df_attribution
+
+
+def output_abatement_ranking(df_abatement, df_abatement_curves, dir_out):
+    """
+    Given the marginal abatement ranking of the DR products and its
+    cumulative abatement curves from abatement_runall, outputs them into
+    abatement_ranking.csv and abatement_curves.csv, with a row for each
+    scenario, DR plan, season and product in ranked order.
+
+    Args:
+        df_abatement: dataframe of the abatement ranking
+        df_abatement_curves: dataframe of the cumulative abatement curves
+        dir_out: the directory to output files to
+    """
+    if not isinstance(df_abatement,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the df_abatement argument')
+    if not isinstance(df_abatement_curves,pd.DataFrame):
+        raise ValueError('Please input a dataframe for the df_abatement_curves argument')
+    dir_out = dir_out + 'emissions_impacts/'
+
+    df_abatement.to_csv(dir_out+'abatement_ranking.csv', index=False)
+    df_abatement_curves.to_csv(dir_out+'abatement_curves.csv', index=False)
+
 ################# Main ####################
 def subcomp_d_runall(dr_hours_dict, dr_pot_dict, product_info_dict,
            df_seasonal_ave, df_annual_ave, df_oneyear_seasonal_ave, year,
-           emissions_impacts_dict, emissions_annual_df, newbins_barchart_df,
-           dir_out):
+           emissions_impacts_dict, emissions_annual_df, newbins_barchart_df, dir_out,
+           df_month_hour_ave=None, df_monte_carlo_bands=None, hourly_impacts=None,
+           df_attribution=None, df_abatement=None, df_abatement_curves=None, registry=None,
+           df_stratified_ave=None, df_effective_rates=None, df_best_windows=None,
+           df_seasonal_windows=None):
     """
     Runs through all of the above functions to output all csv files.
 
     Args:
-        dr_hours_dict: dictionary of 1-or-0 DR hours dataframes
+        dr_hours_dict: dictionary of DR hours dataframes
                        for each DR plan and season
                        from subcomponent a
         dr_pot_dict: dictionary of DR potential
@@ -259,10 +531,53 @@ def subcomp_d_runall(dr_hours_dict, dr_pot_dict, product_info_dict,
         newbins_barchart_df: Dataframe with yearly avoided emissions for each product
                             in 'newbins' in addition to their sum
         dir_out: the directory to output files to; helps to keep testing output separate
+        df_month_hour_ave: optional dictionary of month x hour averaged emissions
+                           rates for each year, for each emissions scenario
+                           from month_hour_ave in subcomponent b
+        df_monte_carlo_bands: optional dataframe of percentile bands of the
+                              emissions impacts from monte_carlo_runall
+        hourly_impacts: optional dictionary of hourly emissions impacts
+                        from get_hourly_impacts in subcomponent c
+        df_attribution: optional dataframe of the month x hour attribution
+                        of the emissions impacts from get_impact_attribution
+                        in subcomponent c
+        df_abatement: optional dataframe of the marginal abatement ranking
+                      of the DR products from abatement_runall
+        df_abatement_curves: optional dataframe of the cumulative abatement
+                             curves from abatement_runall
+        registry: optional output of create_product_registry()
+                  from subcomponent a
+        df_stratified_ave: optional dictionary of hourly emissions rates averaged
+                           for each day type and the peak days, for each season
+                           and emissions scenario from subcomponent b
+        df_effective_rates: optional dictionary of yearly effective emissions
+                            rates of each bin, for each DR plan, season and
+                            emissions scenario from subcomponent b
+        df_best_windows: optional dictionary of the best window of each day
+                         for each emissions scenario from subcomponent b
+        df_seasonal_windows: optional dictionary of the best windows and DR hours
+                             scores of each product, for each DR plan, season
+                             and emissions scenario from subcomponent b
     """
     output_dr_hours(dr_hours_dict, dir_out)
-    output_dr_potential(dr_pot_dict, product_info_dict, dir_out)
+    output_dr_potential(dr_pot_dict, product_info_dict, dir_out, registry)
     output_avg_emissions_rates(df_seasonal_ave, df_annual_ave,
                                 df_oneyear_seasonal_ave, year, dir_out)
     output_emissions_impacts(emissions_impacts_dict,
                                 emissions_annual_df, newbins_barchart_df, dir_out)
+    if df_month_hour_ave is not None:
+        output_month_hour_ave(df_month_hour_ave, dir_out)
+    if df_stratified_ave is not None:
+        output_stratified_ave(df_stratified_ave, dir_out)
+    if df_effective_rates is not None:
+        output_effective_rates(df_effective_rates, dir_out)
+    if df_best_windows is not None:
+        output_best_windows(df_best_windows, df_seasonal_windows, dir_out)
+    if df_monte_carlo_bands is not None:
+        output_monte_carlo_bands(df_monte_carlo_bands, dir_out)
+    if hourly_impacts is not None:
+        output_hourly_impacts(hourly_impacts, dir_out)
+    if df_attribution is not None:
+        output_impact_attribution(df_attribution, dir_out)
+    if df_abatement is not None:
+        output_abatement_ranking(df_abatement, df_abatement_curves, dir_out)
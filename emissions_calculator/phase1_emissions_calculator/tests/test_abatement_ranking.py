@@ -0,0 +1,88 @@
+"""
+test_abatement_ranking.py
+Contains tests for abatement_ranking, which ranks the DR products
+by avoided emissions per MW of potential and per event hour.
+"""
+import unittest
+import numpy as np
+
+from abatement_ranking import get_abatement_table, get_abatement_curves, abatement_runall
+
+from subcomp_c_calculate_emissions import stack_impacts_inputs, calc_yearly_avoided_emissions
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+
+class TestAbatementRanking(unittest.TestCase):
+    """
+    Tests for the marginal abatement ranking and curves
+    """
+
+    def test_matches_impacts(self):
+        """
+        Test that the ranking holds the average yearly avoided emissions
+        of subcomponent c for every product, divided by its average potential.
+        """
+        df_abatement, df_curves = abatement_runall(emissions_rates_df_out,
+            dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+            dr_name, dr_seasons)
+        out_dict = calc_yearly_avoided_emissions(emissions_rates_df_out,
+            dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+            dr_name, dr_seasons)
+        self.assertEqual(len(df_abatement), sum([x.shape[1]-1 for x in out_dict.values()]))
+
+        row = df_abatement[(df_abatement.Plan == 'newbins') & (df_abatement.Season == 'Summer')
+                           & (df_abatement.Product == 'DVR')].iloc[0]
+        potential = dr_potential_df_dict_out['newbins_Summer']['DVR'].mean()
+        self.assertAlmostEqual(row['Avoided Emissions'],
+                               out_dict['newbins_Summer_bin1']['DVR'].mean(), places=6)
+        self.assertAlmostEqual(row['Tons per MW'], row['Avoided Emissions'] / potential)
+        self.assertEqual(row['Event Hours'],
+                         (dr_hours_df_dict_out['newbins_Summer']['DVR'] > 0).sum())
+
+        for _, group in df_abatement.groupby(['Scenario', 'Plan', 'Season']):
+            self.assertTrue(np.all(np.diff(group['Tons per MW'].values) <= 0))
+            self.assertEqual(list(group['Rank']), list(range(1, len(group)+1)))
+        self.assertTrue(np.allclose(df_curves.groupby(['Plan', 'Season'])\
+                                    ['Cumulative Share'].last(), 1.))
+
+    def test_rank_by_event_hour(self):
+        """
+        one shot test of ranking by avoided emissions per event hour.
+        """
+        inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        df_abatement = get_abatement_table(inputs, metric='Tons per Event Hour')
+        df_curves = get_abatement_curves(df_abatement)
+        for _, group in df_abatement.groupby(['Scenario', 'Plan', 'Season']):
+            self.assertTrue(np.all(np.diff(group['Tons per Event Hour'].values) <= 0))
+        self.assertTrue(np.allclose(df_curves['Cumulative Avoided Emissions'].values[:2],
+                                    np.cumsum(df_abatement['Avoided Emissions'].values[:2])))
+
+    def test_bad_metric(self):
+        """
+        Edge test that an unknown ranking metric raises a ValueError.
+        """
+        with self.assertRaises(ValueError):
+            abatement_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+                dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                dr_name, dr_seasons, metric='Tons')
@@ -0,0 +1,103 @@
+"""
+test_dr_schedule_optimizer.py
+Contains tests for dr_schedule_optimizer, which searches for DR schedules
+that maximize avoided emissions.
+"""
+import unittest
+import tempfile
+import numpy as np
+
+from dr_schedule_optimizer import get_calendar, get_window_scores, get_allowed_starts, \
+    greedy_schedule, dp_schedule, schedule_to_hours, optimize_dr_hours, \
+    dr_schedule_optimizer_runall
+
+from subcomp_a_organize_data import create_dr_hours_df_dict, create_emissions_rates_df
+from subcomp_c_calculate_emissions import apply_load_shapes, get_rebound_kernel
+
+from emissions_parameters import DIR_EMISSIONS_RATES
+
+rng = np.random.default_rng(0)
+rates = rng.random((3, 8760))
+calendar = get_calendar()
+rules = {'DVR': {'event_length': 4, 'window': (15, 22),
+                 'budget': {'Winter': 5, 'Summer': 8}, 'shift': False},
+         'ResTOU_shift': {'event_length': 2, 'window': (12, 23),
+                          'budget': {'Winter': 5, 'Summer': 8}, 'shift': True}}
+
+
+class TestDRScheduleOptimizer(unittest.TestCase):
+    """
+    Tests for the DR schedule optimizer
+    """
+
+    def test_window_scores(self):
+        """
+        one shot test that window scores equal the rates summed over
+        the load shape of an event, with and without rebound.
+        """
+        weights = rates.sum(axis=0)
+        for kernel in [None, get_rebound_kernel(4)]:
+            scores = get_window_scores(weights, 4, kernel)
+            dr_hours = schedule_to_hours([100], 4, 8760)
+            load_shape = apply_load_shapes(dr_hours, [kernel])[0]
+            self.assertTrue(np.isclose(scores[100], (weights*load_shape).sum()))
+
+    def test_allowed_starts(self):
+        """
+        one shot test that events fit in the window and season.
+        """
+        allowed = get_allowed_starts(calendar, 4, (15, 22), [7, 8, 9])
+        starts = calendar[allowed]
+        self.assertEqual(set(starts.hourID), set(range(15, 20)))
+        self.assertEqual(set(starts.Month), {7, 8, 9})
+
+    def test_greedy_and_dp(self):
+        """
+        Test that greedy picks at most one event per day and the budget
+        of events, and that dp, allowing several events per day, scores
+        at least as well.
+        """
+        scores = get_window_scores(rates.sum(axis=0) - 1.5, 2)
+        allowed = get_allowed_starts(calendar, 2, (12, 23), [1, 2, 3])
+        greedy = greedy_schedule(scores, allowed, 5)
+        self.assertEqual(len(greedy), 5)
+        self.assertEqual(len(np.unique(greedy//24)), 5)
+        self.assertTrue(np.all(allowed[greedy]))
+
+        dp_starts = dp_schedule(scores, allowed, 2, 5)
+        self.assertEqual(len(dp_starts), 5)
+        self.assertTrue(np.all(np.diff(dp_starts) >= 2))
+        self.assertGreaterEqual(scores[dp_starts].sum(), scores[greedy].sum())
+
+        # only events that avoid emissions are chosen
+        self.assertEqual(len(greedy_schedule(-np.abs(scores), allowed, 5)), 0)
+
+    def test_optimize_dr_hours(self):
+        """
+        Test the DR hours format, and that the written workbook
+        can be read by subcomponent a.
+        """
+        dr_hours_dict = optimize_dr_hours(rates, rules, 'newbins', ['Winter', 'Summer'], 'dp')
+        summer = dr_hours_dict['newbins_Summer']
+        self.assertEqual(list(summer.columns), ['hourID', 'Month', 'Day', 'DVR', 'ResTOU_shift'])
+        self.assertEqual(summer['DVR'].sum(), 4*8)
+        self.assertTrue(summer['DVR'][~summer.Month.isin([7, 8, 9])].eq(0).all())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rates_df = create_emissions_rates_df([DIR_EMISSIONS_RATES\
+                +'AvoidedEmissionsRateBaseline.xlsx'], ['Baseline'])
+            dr_schedule_optimizer_runall(rates_df, {'DVR': rules['DVR']}, 'oldbins',
+                                         ['Winter', 'Summer'],
+                                         file_name=tmp_dir+'/DRHours_optimized.xlsx')
+            read_dict = create_dr_hours_df_dict([tmp_dir+'/DRHours_optimized.xlsx'],
+                                                ['oldbins'], [['Winter', 'Summer']])
+            self.assertEqual(read_dict['oldbins_Winter']['DVR'].sum(), 4*5)
+
+    def test_bad_input(self):
+        """
+        Edge case tests of an unknown method and season.
+        """
+        with self.assertRaises(ValueError):
+            optimize_dr_hours(rates, rules, 'newbins', ['Winter'], 'annealing')
+        with self.assertRaises(ValueError):
+            dr_schedule_optimizer_runall([], rules, 'newbins', ['Winter'])
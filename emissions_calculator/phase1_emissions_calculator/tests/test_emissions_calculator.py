@@ -4,7 +4,8 @@ test_emissions_calculator.py
 Contains a test for the emissions_calculator script that runs through
 each subcomponent to calculate DR emissions impacts and output data.
 
-Note that this only includes a simple smoke test because
+Note that this only includes a simple smoke test, and a test of the
+warnings about settings that do not apply to a run, because
 emissions_calculator simply runs through all the subcomponents,
 which we test individually in each test_<subcomponent>.py file.
 
@@ -17,11 +18,12 @@ python -m unittest tests/test_<subcompname>.py
 import unittest
 
 from emissions_parameters import DIR_DATA_PROC
-from emissions_calculator import main
+import emissions_calculator
+from emissions_calculator import main, get_ignored_settings
 
 class TestEmissionsCalc(unittest.TestCase):
     """
-    Class of one unit test for the emissions calculator.
+    Class of unit tests for the emissions calculator.
     """
 
     def test_calcsmoke(self):
@@ -29,3 +31,26 @@ class TestEmissionsCalc(unittest.TestCase):
         Smoke test to make sure the emissions calculator runs.
         """
         main(DIR_DATA_PROC)
+
+    def test_ignored_settings(self):
+        """
+        Test that settings which do not apply to a run are listed.
+        """
+        self.assertEqual(get_ignored_settings(), [])
+        try:
+            emissions_calculator.N_WORKERS = 2
+            emissions_calculator.N_BOOTSTRAP = 10
+            self.assertEqual([x[0] for x in get_ignored_settings()], ['N_WORKERS'])
+            emissions_calculator.N_BOOTSTRAP = 0
+            emissions_calculator.IMPACTS_CACHE_DIR = 'cache'
+            self.assertEqual([x[0] for x in get_ignored_settings()], ['IMPACTS_CACHE_DIR'])
+            emissions_calculator.INCREMENTAL_STATE_FILE = 'state.pkl'
+            emissions_calculator.PRECISION = 'float32'
+            self.assertEqual([x[0] for x in get_ignored_settings()],
+                             ['N_WORKERS', 'PRECISION', 'IMPACTS_CACHE_DIR'])
+        finally:
+            emissions_calculator.N_WORKERS = 1
+            emissions_calculator.N_BOOTSTRAP = 0
+            emissions_calculator.INCREMENTAL_STATE_FILE = None
+            emissions_calculator.PRECISION = 'float64'
+            emissions_calculator.IMPACTS_CACHE_DIR = None
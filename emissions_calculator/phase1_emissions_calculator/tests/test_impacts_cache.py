@@ -0,0 +1,121 @@
+"""
+test_impacts_cache.py
+Contains tests for impacts_cache, which memoizes the results
+of subcomponent c on disk.
+"""
+import os
+import tempfile
+import unittest
+
+from impacts_cache import get_cache_key, load_cached, store_cached, evict_lru, \
+    cached_subcomp_c_runall
+
+import subcomp_c_calculate_emissions
+from subcomp_c_calculate_emissions import subcomp_c_runall
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS, REBOUND_KERNELS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+
+class TestImpactsCache(unittest.TestCase):
+    """
+    Tests for the on-disk cache of subcomponent c results
+    """
+
+    def test_cache_key(self):
+        """
+        Test that the key depends on the content of the inputs
+        and on the parameters.
+        """
+        args = [emissions_rates_df_out, dr_hours_df_dict_out, dr_potential_df_dict_out,
+                dr_product_info_df_dict_out, dr_name, dr_seasons]
+        key = get_cache_key(*args)
+        self.assertEqual(key, get_cache_key(emissions_rates_df_out.copy(), *args[1:]))
+        self.assertNotEqual(key, get_cache_key(*args, precision='float32'))
+
+        em_rates = emissions_rates_df_out.copy()
+        em_rates.iloc[0, -1] += 1.
+        self.assertNotEqual(key, get_cache_key(em_rates, *args[1:]))
+
+    def test_cache_key_settings(self):
+        """
+        Test that the key depends on the resolved rebound kernels
+        and the unit conversion factor used by subcomponent c.
+        """
+        args = [emissions_rates_df_out, dr_hours_df_dict_out, dr_potential_df_dict_out,
+                dr_product_info_df_dict_out, dr_name, dr_seasons]
+        key = get_cache_key(*args)
+        self.assertEqual(key, get_cache_key(*args, rebound_kernels=REBOUND_KERNELS))
+        kernels = {'ResTOU_shift': {'pre': [-1.], 'post': [-1.]}}
+        self.assertNotEqual(key, get_cache_key(*args, rebound_kernels=kernels))
+
+        changeunits = subcomp_c_calculate_emissions.EMISSIONS_CHANGEUNITS
+        try:
+            subcomp_c_calculate_emissions.EMISSIONS_CHANGEUNITS = 0.5
+            self.assertNotEqual(key, get_cache_key(*args))
+        finally:
+            subcomp_c_calculate_emissions.EMISSIONS_CHANGEUNITS = changeunits
+
+    def test_hit(self):
+        """
+        Test that a cache hit returns the subcomponent c results
+        without adding to the cache.
+        """
+        expected = subcomp_c_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(2):
+                out_dict, barchart_df, newbins_barchart = cached_subcomp_c_runall(cache_dir,
+                    emissions_rates_df_out, dr_hours_df_dict_out, dr_potential_df_dict_out,
+                    dr_product_info_df_dict_out, dr_name, dr_seasons)
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            self.assertEqual(list(out_dict), list(expected[0]))
+            for key, value in expected[0].items():
+                self.assertTrue(value.equals(out_dict[key]))
+            self.assertTrue(expected[1].equals(barchart_df))
+            self.assertTrue(expected[2].equals(newbins_barchart))
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used results are evicted
+        beyond the size cap.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for idx, key in enumerate(['a', 'b', 'c']):
+                store_cached(cache_dir, key, bytes(1000))
+                os.utime(os.path.join(cache_dir, key+'.pkl'), (idx, idx))
+            self.assertIsNotNone(load_cached(cache_dir, 'a'))
+
+            self.assertEqual(evict_lru(cache_dir, 2500), ['b'])
+            self.assertIsNone(load_cached(cache_dir, 'b'))
+            self.assertEqual(evict_lru(cache_dir, 0), ['c', 'a'])
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_bad_max_bytes(self):
+        """
+        Edge test that a negative size cap raises a ValueError.
+        """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with self.assertRaises(ValueError):
+                cached_subcomp_c_runall(cache_dir, emissions_rates_df_out,
+                    dr_hours_df_dict_out, dr_potential_df_dict_out,
+                    dr_product_info_df_dict_out, dr_name, dr_seasons, max_bytes=-1)
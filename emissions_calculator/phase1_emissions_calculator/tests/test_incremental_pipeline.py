@@ -0,0 +1,141 @@
+"""
+test_incremental_pipeline.py
+Contains tests for incremental_pipeline, which recomputes only the
+outputs affected by changed inputs.
+"""
+import unittest
+import tempfile
+import shutil
+from os import mkdir
+
+import numpy as np
+import pandas as pd
+import openpyxl
+
+from incremental_pipeline import get_input_fingerprints, get_changed_keys, \
+    get_affected_outputs, incremental_runall
+
+from subcomp_a_organize_data import subcomp_a_runall, create_potential_profile_dict
+from subcomp_c_calculate_emissions import calc_yearly_avoided_emissions
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+inputs = {'rates': emissions_rates_df_out, 'hours': dr_hours_df_dict_out,
+          'potential': dr_potential_df_dict_out, 'info': dr_product_info_df_dict_out,
+          'profiles': create_potential_profile_dict([None, None], dr_name)}
+
+
+class TestIncrementalPipeline(unittest.TestCase):
+    """
+    Tests for the incremental pipeline
+    """
+
+    def test_affected_potential(self):
+        """
+        one shot test that a change to one product's potential affects
+        only the impacts table of its bin, and no averages.
+        """
+        old_fingerprints = get_input_fingerprints(inputs)
+        potential = dict(dr_potential_df_dict_out)
+        potential['oldbins_Winter'] = potential['oldbins_Winter'].copy()
+        potential['oldbins_Winter'].loc[3, 'ResBYOT'] *= 2
+        new_fingerprints = get_input_fingerprints(dict(inputs, potential=potential))
+
+        changed = get_changed_keys(old_fingerprints, new_fingerprints)
+        self.assertEqual(changed, {('potential', 'oldbins_Winter', 'ResBYOT')})
+        affected = get_affected_outputs(changed, inputs, dr_name, dr_seasons)
+        bin_num = dr_product_info_df_dict_out['oldbins'].set_index('Product').Bin['ResBYOT']
+        self.assertEqual(affected['impacts'], {('Baseline', 'oldbins', 'Winter', bin_num)})
+        self.assertEqual(affected['dr_potential'], {'oldbins_Winter'})
+        self.assertEqual(affected['seasonal_ave'], set())
+
+    def test_affected_bin_move(self):
+        """
+        one shot test that moving a product to another bin in the product
+        info affects the impacts tables of both its old and new bin.
+        """
+        info = dict(dr_product_info_df_dict_out)
+        info['oldbins'] = info['oldbins'].copy()
+        row = info['oldbins'].index[info['oldbins'].Product == 'ResBYOT'][0]
+        old_bin = info['oldbins'].loc[row, 'Bin']
+        new_bin = 'Bin 4' if old_bin != 'Bin 4' else 'Bin 3'
+        info['oldbins'].loc[row, 'Bin'] = new_bin
+        new_inputs = dict(inputs, info=info)
+
+        changed = get_changed_keys(get_input_fingerprints(inputs),
+                                   get_input_fingerprints(new_inputs))
+        self.assertEqual(changed, {('info', 'oldbins', 'ResBYOT')})
+        affected = get_affected_outputs(changed, new_inputs, dr_name, dr_seasons,
+                                        dr_product_info_df_dict_out)
+        for season in ['Winter', 'Summer']:
+            self.assertIn(('Baseline', 'oldbins', season, old_bin), affected['impacts'])
+            self.assertIn(('Baseline', 'oldbins', season, new_bin), affected['impacts'])
+
+    def test_affected_rates(self):
+        """
+        one shot test that a change to a scenario's rates affects
+        every impacts table and average of that scenario.
+        """
+        rates = emissions_rates_df_out.copy()
+        rates.iloc[0, 4] += 1
+        changed = get_changed_keys(get_input_fingerprints(inputs),
+                                   get_input_fingerprints(dict(inputs, rates=rates)))
+        self.assertEqual(changed, {('rates', 'Baseline')})
+        affected = get_affected_outputs(changed, inputs, dr_name, dr_seasons)
+        self.assertEqual(len(affected['impacts']), 11)
+        self.assertEqual(len(affected['seasonal_ave']), 5)
+        self.assertEqual(affected['rates'], {'Baseline'})
+
+    def test_incremental_runall(self):
+        """
+        Test that a second run with no changes recomputes nothing, and
+        that after editing one DR hour, the rewritten impacts table
+        matches a full recomputation.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dir_out = tmp_dir + '/'
+            for folder in ['dr_hours', 'dr_potential', 'emissions_rates', 'emissions_impacts']:
+                mkdir(dir_out + folder)
+            hrs_files = [dir_out + 'DRHours_' + x + '.xlsx' for x in dr_name]
+            for file_in, file_out in zip(dr_hrs_files, hrs_files):
+                shutil.copy(file_in, file_out)
+            args = [dir_out+'state.pkl', emissions_rates_files, emissions_scenario_list,
+                    hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products,
+                    2022, dir_out]
+
+            affected = incremental_runall(*args)
+            self.assertEqual(len(affected['impacts']), 11)
+            affected = incremental_runall(*args)
+            self.assertEqual(sum([len(x) for x in affected.values()]), 0)
+
+            workbook = openpyxl.load_workbook(hrs_files[1])
+            workbook['Summer'].cell(4000, 4).value = 1
+            workbook.save(hrs_files[1])
+            affected = incremental_runall(*args)
+            self.assertEqual(affected['impacts'], {('Baseline', 'newbins', 'Summer', 'Bin 1')})
+            self.assertEqual(affected['dr_hours'], {'newbins_Summer'})
+
+            hours = dict(dr_hours_df_dict_out)
+            hours['newbins_Summer'] = hours['newbins_Summer'].copy()
+            hours['newbins_Summer'].loc[3998, 'DVR'] = 1
+            expected = calc_yearly_avoided_emissions(emissions_rates_df_out, hours,
+                dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+            checkdf = pd.read_csv(dir_out+'emissions_impacts/newbins_Summer_bin1.csv')
+            self.assertTrue(np.allclose(checkdf.values,
+                                        expected['newbins_Summer_bin1'].values))
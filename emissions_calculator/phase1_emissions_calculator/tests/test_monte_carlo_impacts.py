@@ -0,0 +1,131 @@
+"""
+test_monte_carlo_impacts.py
+Contains tests for monte_carlo_impacts, which runs a Monte Carlo
+uncertainty analysis of the emissions impacts of demand response products.
+"""
+import unittest
+import numpy as np
+
+from monte_carlo_impacts import get_distributions, sample_multipliers, \
+    monte_carlo_draws, get_percentile_table, monte_carlo_runall, summarize_draws
+
+from subcomp_c_calculate_emissions import stack_impacts_inputs, calc_impacts_array
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+                              dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                              dr_name, dr_seasons)
+
+FIXED = {'rates': ('fixed', 1), 'potential': ('fixed', 1), 'shift_fraction': ('fixed', 1)}
+
+
+class TestMonteCarloImpacts(unittest.TestCase):
+    """
+    Tests for the Monte Carlo uncertainty analysis
+    """
+
+    def test_fixed_draws(self):
+        """
+        one shot test that draws without perturbations equal
+        the impacts of subcomponent c, and that draws without
+        shifting equal the impacts without rebound.
+        """
+        draws = monte_carlo_draws(inputs, 3, FIXED, chunk_size=2)
+        impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'],
+                                     inputs['potential'])
+        self.assertEqual(draws.shape, (3,) + impacts.shape)
+        self.assertTrue(np.allclose(draws, impacts[None]))
+
+        no_shift = dict(FIXED, shift_fraction=('fixed', 0))
+        draws = monte_carlo_draws(inputs, 1, no_shift)
+        impacts = calc_impacts_array(inputs['rates'], inputs['hours'], inputs['potential'])
+        self.assertTrue(np.allclose(draws[0], impacts))
+
+    def test_seeded_chunks(self):
+        """
+        Test that seeded draws are reproducible and do not depend
+        on the number of workers.
+        """
+        draws_1 = monte_carlo_draws(inputs, 50, chunk_size=20, seed=1)
+        draws_2 = monte_carlo_draws(inputs, 50, chunk_size=20, seed=1, n_workers=2)
+        self.assertTrue(np.array_equal(draws_1, draws_2))
+        self.assertFalse(np.array_equal(draws_1[:20], draws_1[20:40]))
+
+    def test_streaming_summary(self):
+        """
+        Test that the chunked summary of the draws matches the mean and,
+        to within one histogram bin, the percentiles of all draws.
+        """
+        draws = monte_carlo_draws(inputs, 300, chunk_size=40, seed=2)
+        mean, values = summarize_draws(inputs, 300, (5, 50, 95), chunk_size=40,
+                                       seed=2, n_bins=200)
+        width = (draws.max(axis=0) - draws.min(axis=0))/200
+        exact = np.percentile(draws, (5, 50, 95), axis=0)
+        self.assertTrue(np.allclose(mean, draws.mean(axis=0)))
+        self.assertTrue(np.all(np.abs(values - exact) <= width + 1e-9))
+
+    def test_percentile_table(self):
+        """
+        Test that the percentile bands are ordered and labelled for
+        each scenario, product and year.
+        """
+        draws = monte_carlo_draws(inputs, 200, seed=2)
+        bands = get_percentile_table(draws, inputs, percentiles=(2.5, 50, 97.5))
+        self.assertEqual(list(bands.columns), ['Scenario', 'Plan', 'Season', 'Bin', 'Product',
+                                               'Year', 'Mean', 'P2.5', 'P50', 'P97.5'])
+        self.assertEqual(len(bands), np.prod(draws.shape[1:]))
+        self.assertTrue(np.all(bands['P2.5'] <= bands['P50']))
+        self.assertTrue(np.all(bands['P50'] <= bands['P97.5']))
+
+    def test_distributions(self):
+        """
+        Edge case tests of unknown perturbations and distributions.
+        """
+        with self.assertRaises(ValueError):
+            get_distributions({'participation': ('normal', 1, 0.1)})
+        with self.assertRaises(ValueError):
+            sample_multipliers(np.random.default_rng(0), ('gaussian', 1, 0.1), 3)
+
+    def test_runall_float32(self):
+        """
+        Test that the bands of a float32 run are close to float64.
+        """
+        args = (emissions_rates_df_out, dr_hours_df_dict_out, dr_potential_df_dict_out,
+                dr_product_info_df_dict_out, dr_name, dr_seasons)
+        bands_64 = monte_carlo_runall(*args, n_draws=20, seed=3)
+        bands_32 = monte_carlo_runall(*args, n_draws=20, seed=3, precision='float32')
+        scale = bands_64['Mean'].abs().max()
+        self.assertTrue(np.allclose(bands_32['Mean'], bands_64['Mean'],
+                                    rtol=1e-5, atol=1e-6*scale))
+
+    def test_runall_bad_input(self):
+        """
+        Edge case test of bad inputs to the Monte Carlo analysis.
+        """
+        with self.assertRaises(ValueError):
+            monte_carlo_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+                               dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                               dr_name, dr_seasons, n_draws=0)
+        with self.assertRaises(ValueError):
+            monte_carlo_runall([], dr_hours_df_dict_out, dr_potential_df_dict_out,
+                               dr_product_info_df_dict_out, dr_name, dr_seasons)
@@ -0,0 +1,95 @@
+"""
+test_parallel_scenarios.py
+Contains tests for parallel_scenarios, which runs subcomponents b and c
+over a pool of worker processes with shared emissions rates.
+"""
+import unittest
+import numpy as np
+
+from parallel_scenarios import share_array, attach_array, parallel_runall
+
+from subcomp_b_process_emissions_factors import seasonal_ave, annual_ave
+from subcomp_c_calculate_emissions import calc_results_cube
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+
+class TestParallelScenarios(unittest.TestCase):
+    """
+    Tests for the parallel runs of subcomponents b and c
+    """
+
+    def test_shared_array(self):
+        """
+        one shot test that an attached array is a view of the shared copy.
+        """
+        array = np.arange(12.).reshape(3, 4)
+        shm, spec = share_array(array)
+        try:
+            shm_2, shared = attach_array(spec)
+            self.assertTrue(np.array_equal(shared, array))
+            shared[0, 0] = -1.
+            del shared
+            shm_2.close()
+            self.assertEqual(np.ndarray(spec[1], dtype=spec[2], buffer=shm.buf)[0, 0], -1.)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_matches_serial(self):
+        """
+        Test that the parallel averages and impacts match subcomponents
+        b and c, and do not depend on the number of workers.
+        """
+        seasonal_1, annual_1, cube_1 = parallel_runall(emissions_rates_df_out,
+            dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+            dr_name, dr_seasons)
+        seasonal_2, annual_2, cube_2 = parallel_runall(emissions_rates_df_out,
+            dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+            dr_name, dr_seasons, n_workers=2)
+        self.assertTrue(np.array_equal(cube_1['values'], cube_2['values'], equal_nan=True))
+
+        cube = calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        self.assertTrue(np.array_equal(cube['values'], cube_1['values'], equal_nan=True))
+
+        expected = seasonal_ave(dr_name, dr_seasons, emissions_scenario_list,
+                                emissions_rates_df_out, dr_hours_df_dict_out)
+        for key, value in expected.items():
+            self.assertEqual(list(value['Baseline'].columns),
+                             list(seasonal_1[key]['Baseline'].columns))
+            self.assertTrue(np.allclose(value['Baseline'], seasonal_1[key]['Baseline']))
+            self.assertTrue(seasonal_1[key]['Baseline'].equals(seasonal_2[key]['Baseline']))
+        expected = annual_ave(dr_name, dr_seasons, emissions_scenario_list,
+                              emissions_rates_df_out, dr_hours_df_dict_out)
+        for key, value in expected.items():
+            self.assertTrue(np.allclose(value['Baseline'], annual_1[key]['Baseline']))
+            self.assertTrue(annual_1[key]['Baseline'].equals(annual_2[key]['Baseline']))
+
+    def test_bad_workers(self):
+        """
+        Edge test that a number of workers below 1 raises a ValueError.
+        """
+        with self.assertRaises(ValueError):
+            parallel_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+                dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                dr_name, dr_seasons, n_workers=0)
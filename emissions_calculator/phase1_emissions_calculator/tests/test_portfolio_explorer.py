@@ -0,0 +1,129 @@
+"""
+test_portfolio_explorer.py
+Contains tests for portfolio_explorer, which queries and ranks
+the emissions impacts of subsets of DR products.
+"""
+import itertools
+import unittest
+import numpy as np
+
+from portfolio_explorer import build_portfolio_explorer, get_portfolio_masks, \
+    query_portfolios, query_portfolio, enumerate_portfolio_masks, rank_portfolios, \
+    get_exclusive_masks
+
+from subcomp_c_calculate_emissions import calc_results_cube, make_cube_barchart_df
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+results_cube = calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+    dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+
+
+class TestPortfolioExplorer(unittest.TestCase):
+    """
+    Tests for the portfolio queries and ranking
+    """
+
+    def test_query_matches_barchart(self):
+        """
+        Test that portfolio queries match the barchart sums
+        of subcomponent c.
+        """
+        explorer = build_portfolio_explorer(results_cube)
+        out_df, newbins_df = make_cube_barchart_df(results_cube)
+
+        df = query_portfolio(explorer, 'newbins', ['DVR', 'ResTOU_shed'])
+        for season in ['Winter', 'Summer', 'Fall']:
+            self.assertAlmostEqual(df['Baseline '+season].sum(),
+                                   out_df.loc[season, 'newbins_bin1_shed'], places=4)
+
+        products = explorer['plans']['newbins']['products']
+        impacts = query_portfolios(explorer, 'newbins',
+                                   get_portfolio_masks(explorer, 'newbins', [[x] for x in products]))
+        self.assertTrue(np.allclose(impacts.sum(axis=-1)[:, 0].T, newbins_df[products].values))
+
+    def test_rank(self):
+        """
+        Test that the ranking matches a brute force search over all portfolios.
+        """
+        explorer = build_portfolio_explorer(results_cube)
+        products = explorer['plans']['oldbins']['products'][:8]
+        portfolios = [list(x) for size in range(1, 3) \
+                      for x in itertools.combinations(products, size)]
+        totals = [query_portfolio(explorer, 'oldbins', x)['Baseline Summer'].sum() \
+                  for x in portfolios]
+
+        n_products = len(explorer['plans']['oldbins']['products'])
+        df = rank_portfolios(explorer, 'oldbins', 2, season='Summer',
+                             top=n_products*(n_products+1)//2)
+        df = df[df['Mask'] < 2**8]
+        self.assertEqual(len(df), len(portfolios))
+        self.assertTrue(np.allclose(df['Total'], sorted(totals, reverse=True)))
+        self.assertTrue(np.allclose(df['Total'], df['Summer']))
+        self.assertEqual(df['Portfolio'].iloc[0],
+                         ', '.join(portfolios[int(np.argmax(totals))]))
+
+    def test_rank_ties(self):
+        """
+        Test that ties at the cutoff keep the smallest bitmasks, whatever
+        the batch size, and that top must be a positive integer.
+        """
+        explorer = {'coords': {'Scenario': ['Baseline'], 'Season': ['Summer'], 'Year': [2022]},
+                    'plans': {'plan': {'products': ['A', 'B', 'C', 'D'],
+                                       'exclusive': get_exclusive_masks(['A', 'B', 'C', 'D']),
+                                       'impacts': np.ones((1, 1, 1, 4))}}}
+        for batch_size in [1, 3, 100]:
+            df = rank_portfolios(explorer, 'plan', 2, top=5, batch_size=batch_size)
+            self.assertEqual(list(df['Mask']), [3, 5, 6, 9, 10])
+        with self.assertRaises(ValueError):
+            rank_portfolios(explorer, 'plan', 2, top=0)
+
+    def test_rank_variants(self):
+        """
+        Test that no ranked portfolio includes both the shift and shed
+        variants of ResTOU, and that querying one raises a ValueError.
+        """
+        explorer = build_portfolio_explorer(results_cube)
+        self.assertEqual(list(explorer['plans']['newbins']['exclusive']), [6])
+        df = rank_portfolios(explorer, 'newbins', 3)
+        self.assertEqual(len(df), 5)
+        self.assertFalse((df['Portfolio'].str.contains('ResTOU_shift') \
+                          & df['Portfolio'].str.contains('ResTOU_shed')).any())
+        with self.assertRaises(ValueError):
+            query_portfolio(explorer, 'newbins', ['ResTOU_shift', 'ResTOU_shed'])
+
+    def test_enumerate_masks(self):
+        """
+        one shot test that all portfolios up to the maximum size
+        are enumerated once, across batches.
+        """
+        masks = np.concatenate(list(enumerate_portfolio_masks(6, 3, batch_size=7)))
+        self.assertEqual(len(masks), 6 + 15 + 20)
+        self.assertEqual(len(np.unique(masks)), len(masks))
+        self.assertTrue(all([0 < bin(x).count('1') <= 3 for x in masks]))
+
+    def test_bad_product(self):
+        """
+        Edge test that a product outside the DR plan raises a ValueError.
+        """
+        explorer = build_portfolio_explorer(results_cube)
+        with self.assertRaises(ValueError):
+            query_portfolio(explorer, 'newbins', ['ResCPP'])
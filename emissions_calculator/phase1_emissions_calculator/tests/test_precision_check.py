@@ -0,0 +1,82 @@
+"""
+test_precision_check.py
+Contains tests for precision_check, which reports the deviation of a
+float32 run of subcomponents b and c from a float64 run.
+"""
+import unittest
+import pandas as pd
+import numpy as np
+
+from precision_check import get_output_values, get_deviation, precision_check_runall
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+EMISSIONS_YEAR = 2022
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+
+class TestPrecisionCheck(unittest.TestCase):
+    """
+    Tests for the precision check
+    """
+
+    def test_deviation(self):
+        """
+        one shot test of the deviations of nested outputs, ignoring NaN
+        and relative deviations from 0.
+        """
+        reference = {'a': pd.DataFrame({'Season': ['Winter', 'Summer'], 'x': [2., 0.]}),
+                     'b': {'c': np.array([np.nan, 4.])}}
+        test = {'a': pd.DataFrame({'Season': ['Winter', 'Summer'], 'x': [2.5, 0.1]}),
+                'b': {'c': np.array([1., 4.])}}
+        max_abs, max_rel = get_deviation(get_output_values(test),
+                                         get_output_values(reference))
+        self.assertAlmostEqual(max_abs, 0.5)
+        self.assertAlmostEqual(max_rel, 0.25)
+
+        with self.assertRaises(ValueError):
+            get_deviation(np.zeros(2), np.zeros(3))
+
+    def test_float32_run(self):
+        """
+        Test that the float32 run reports a small deviation for every output,
+        and the float64 run none.
+        """
+        df_deviation = precision_check_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons,
+            EMISSIONS_YEAR)
+        self.assertEqual(list(df_deviation.columns),
+                         ['Output', 'Max Absolute Deviation', 'Max Relative Deviation'])
+        self.assertEqual(len(df_deviation), 7)
+        self.assertTrue((df_deviation['Max Relative Deviation'] < 1e-3).all())
+
+        df_deviation = precision_check_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons,
+            EMISSIONS_YEAR, precision='float64')
+        self.assertTrue((df_deviation['Max Absolute Deviation'] == 0).all())
+
+    def test_bad_precision(self):
+        """
+        Edge test that an unknown precision raises a ValueError.
+        """
+        with self.assertRaises(ValueError):
+            precision_check_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+                dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons,
+                EMISSIONS_YEAR, precision='float16')
@@ -0,0 +1,100 @@
+"""
+test_sensitivity_sweep.py
+Contains tests for sensitivity_sweep, which sweeps the emissions impacts
+of demand response products over a grid of parameters.
+"""
+import unittest
+import numpy as np
+
+from sensitivity_sweep import get_sweep_grid, calc_sweep_impacts, get_sweep_table, \
+    sensitivity_sweep_runall
+
+from subcomp_c_calculate_emissions import stack_impacts_inputs, calc_impacts_array, \
+    apply_load_shapes, get_rebound_kernels
+
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS
+
+from subcomp_a_organize_data import subcomp_a_runall
+
+#Define some parameters for testing
+emissions_scenario_list = ['Baseline']
+emissions_rates_files = [DIR_EMISSIONS_RATES+'AvoidedEmissionsRate'\
+     + x + '.xlsx' for x in emissions_scenario_list]
+dr_name = ['oldbins','newbins']
+dr_hrs_files = [DIR_DR_POTENTIAL_HRS+'DRHours_' + x + '.xlsx' for x in dr_name]
+dr_potential_files = [DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_071420.xlsx'\
+      ,DIR_DR_POTENTIAL_HRS+'DR RPM Inputs_021621_newaMWbins.xlsx']
+dr_seasons = [['Winter','Summer'],['Winter','Summer','Fall']]
+subset_products = [[0],['DVR','ResTOU']]
+
+#Generate Data from subcomp_a
+emissions_rates_df_out, dr_hours_df_dict_out, \
+    dr_potential_df_dict_out, dr_product_info_df_dict_out = \
+        subcomp_a_runall(emissions_rates_files, emissions_scenario_list, \
+            dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
+
+inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+                              dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                              dr_name, dr_seasons)
+
+
+class TestSensitivitySweep(unittest.TestCase):
+    """
+    Tests for the sensitivity sweep
+    """
+
+    def test_grid(self):
+        """
+        one shot test of the grid of parameter combinations, and
+        edge case tests of unknown parameters and fractional hours.
+        """
+        grid = get_sweep_grid({'potential_scale': [0.9, 1.1], 'start_shift': [-1, 0, 1]})
+        self.assertEqual(len(grid), 6)
+        self.assertTrue(np.all(grid['rate_scale'] == 1))
+        with self.assertRaises(ValueError):
+            get_sweep_grid({'participation': [0.5]})
+        with self.assertRaises(ValueError):
+            get_sweep_grid({'start_shift': [0.5]})
+
+    def test_sweep_impacts(self):
+        """
+        one shot test that scalings scale the impacts of subcomponent c,
+        and that moving the events matches moving the DR hours
+        and recalculating the rebound.
+        """
+        grid = get_sweep_grid({'potential_scale': [1, 1.1], 'rate_scale': [0.5],
+                               'start_shift': [0, 2]})
+        impacts = calc_sweep_impacts(inputs, grid)
+        base = calc_impacts_array(inputs['rates'], inputs['load_shapes'], inputs['potential'])
+        self.assertTrue(np.allclose(impacts[0], 0.5*base))
+        self.assertTrue(np.allclose(impacts[2], 0.55*base))
+
+        hours = np.roll(inputs['hours'], 2, axis=1)
+        kernels = get_rebound_kernels(hours, inputs['products'], inputs['shift'])
+        moved = calc_impacts_array(inputs['rates'], apply_load_shapes(hours, kernels),
+                                   inputs['potential'])
+        self.assertTrue(np.allclose(impacts[1], 0.5*moved))
+
+    def test_sweep_table(self):
+        """
+        Test the tidy table of the sweep, by year and summed over years.
+        """
+        grid = get_sweep_grid({'shift_fraction': [0, 1]})
+        impacts = calc_sweep_impacts(inputs, grid)
+        table = get_sweep_table(impacts, inputs, grid)
+        self.assertEqual(len(table), impacts.size)
+        self.assertIn('Year', table.columns)
+
+        totals = get_sweep_table(impacts, inputs, grid, sum_years=True)
+        self.assertNotIn('Year', totals.columns)
+        self.assertTrue(np.isclose(totals['Avoided Emissions'].sum(),
+                                   table['Avoided Emissions'].sum()))
+
+    def test_runall_bad_input(self):
+        """
+        Edge case test of bad inputs to the sensitivity sweep.
+        """
+        with self.assertRaises(ValueError):
+            sensitivity_sweep_runall(emissions_rates_df_out, dr_hours_df_dict_out,
+                                     dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                                     dr_name, dr_seasons, [0.9, 1.1])
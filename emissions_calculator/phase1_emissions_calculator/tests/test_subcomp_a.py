@@ -11,7 +11,8 @@ import pandas as pd
 
 from subcomp_a_organize_data import create_emissions_rates_df, \
     create_dr_hours_df_dict, create_dr_potential_df_dict, \
-    create_product_info_df_dict, subcomp_a_runall
+    create_product_info_df_dict, subcomp_a_runall, is_leap_year, create_potential_profile_dict, \
+    create_product_registry, get_bin_products
 from emissions_parameters import DIR_TESTDATA_IN, DIR_DR_POTENTIAL_HRS
 
 dirdata = DIR_TESTDATA_IN + 'subcomp_a_test_data/'
@@ -45,6 +46,13 @@ class TestSubCompA(unittest.TestCase):
                     dr_hrs_files, dr_name, dr_seasons, dr_potential_files, subset_products)
 
     # Below are one shot tests for all functions
+    def test_leapyear(self):
+        """
+        One-shot test to make sure is_leap_year follows the Gregorian calendar.
+        """
+        self.assertEqual(list(is_leap_year([2000, 2024, 2100, 2041])),
+                         [True, True, False, False])
+
     def test_emissionsrates(self):
         """
         One-shot test to make sure emissions rates output dataframe exists
@@ -112,8 +120,63 @@ class TestSubCompA(unittest.TestCase):
         self.assertTrue(len(dr_dict[usekey]) > 0)
         self.assertEqual(set(dr_dict[usekey].columns), set(expected_cols))
 
+    def test_productregistry(self):
+        """
+        One-shot test to make sure the product registry matches filtering
+        the DR info dataframes, and groups products by bin.
+        """
+        dr_dict = create_product_info_df_dict(dr_potential_files, dr_name)
+        hours_dict = create_dr_hours_df_dict(dr_hrs_files, dr_name, dr_seasons)
+        registry = create_product_registry(dr_dict, hours_dict)
+
+        self.assertEqual(len(registry['records']), sum(len(x) for x in dr_dict.values()))
+        for drname, df_info in dr_dict.items():
+            for _, row in df_info.iterrows():
+                record = registry['products'][(drname, row['Product'])]
+                self.assertEqual(record['Bin'], row['Bin'])
+                self.assertEqual(record['Shift'], row['Shift or Shed?'] == 'Shift')
+            for bin_name, products in registry['bin_products'][drname].items():
+                self.assertEqual(products,
+                                 df_info[df_info['Bin'] == bin_name]['Product'].tolist())
+
+        hours = hours_dict['newbins_Winter']
+        column_index = registry['column_index']['newbins_Winter']
+        self.assertEqual([hours.columns[column_index[x]] for x in hours.columns],
+                         list(hours.columns))
+
+        products = list(hours.columns[3:])
+        bin_dict = get_bin_products(registry, 'newbins', products)
+        self.assertEqual(sorted(sum(bin_dict.values(), [])), sorted(products))
+
+        outputs = subcomp_a_runall([dirdata + 'subset_20232024.xlsx'], ['Baseline'],
+                                   dr_hrs_files, dr_name, dr_seasons, dr_potential_files,
+                                   subset_products, return_registry=True)
+        self.assertEqual(len(outputs), 5)
+        self.assertTrue(outputs[4]['records'].equals(registry['records']))
+        self.assertEqual(outputs[4]['column_index'], registry['column_index'])
+
 
     # Below are edge tests for the checkarglists function, called by all other functions
+    def test_profiledict(self):
+        """
+        One-shot test to make sure create_potential_profile_dict reads
+        month x hour multipliers and skips plans without a profile.
+        """
+        dr_profile = create_potential_profile_dict([None, dirdata + 'potential_profile.xlsx'],
+                                                   dr_name)
+        self.assertEqual(list(dr_profile.keys()), ['newbins'])
+        self.assertEqual(list(dr_profile['newbins'].columns),
+                         ['Month', 'hourID', 'DVR', 'ResTOU_shift', 'ResTOU_shed'])
+        self.assertEqual(len(dr_profile['newbins']), 288)
+
+    def test_profilefile(self):
+        """
+        Edge test to make sure create_potential_profile_dict throws a ValueError
+        when the file doesn't exist.
+        """
+        with self.assertRaises(ValueError):
+            create_potential_profile_dict([dirdata + 'nofile.xlsx'], [dr_name[0]])
+
     def test_listfiles(self):
         """
         Edge test to make sure functions throw a ValueError
@@ -277,10 +340,21 @@ class TestSubCompA(unittest.TestCase):
             print('Hours edge test succeeded, caught the error: ')
             print(err)
 
+    def test_hoursfraction(self):
+        """
+        One-shot test to make sure dr_hours_df_dict accepts
+        fractions of DR potential dispatched in each hour.
+        """
+        hrfile = [dirdata + 'hours_fraction.xlsx']
+        dr_hours = create_dr_hours_df_dict(hrfile,['oldbins'],[['Fall']])
+        self.assertEqual(dr_hours['oldbins_Fall']['DVR'].dtypes, float)
+        self.assertEqual(list(dr_hours['oldbins_Fall']['DVR'].iloc[6569:6573]),
+                         [0.4, 1.0, 1.0, 0.6])
+
     def test_hoursint(self):
         """
         Edge test to make sure dr_hours_df_dict throws a ValueError
-        when the hours data contains non-integer values.
+        when the hours data contains values that are not between 0 and 1.
         """
         hrfile = [dirdata + 'hours_notint.xlsx']
         try:
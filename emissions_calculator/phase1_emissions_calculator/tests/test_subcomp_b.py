@@ -6,12 +6,15 @@ which averages emissions factors for DR days and all days.
 """
 import unittest
 
+import numpy as np
 import pandas as pd
 import pandas.testing as pdt
 
 from subcomp_b_process_emissions_factors import seasonal_ave, annual_ave, \
-    get_hour_ave, alldays_oneyear_seasonal_ave, get_oneyear_hour_ave, subcomp_b_runall
-from emissions_parameters import DIR_TESTDATA_IN
+    get_hour_ave, alldays_oneyear_seasonal_ave, get_oneyear_hour_ave, subcomp_b_runall, \
+    effective_rates, month_hour_ave, get_hour_ave_ci, stratified_hour_ave, \
+    get_leap_day_index_map, best_daily_windows, seasonal_best_windows, alldays_stratified_ave
+from emissions_parameters import DIR_TESTDATA_IN, SEASONS_ALLDAYS
 
 df_emissions_data = pd.read_excel(DIR_TESTDATA_IN+'subcomp_b_test_data/emissions_data.xlsx')
 df_dr_hours_winter = pd.read_excel(DIR_TESTDATA_IN+'subcomp_b_test_data/dr_hours_winter.xlsx')
@@ -30,6 +33,23 @@ emissions_rates_df_out = pd.DataFrame({'Report_Year': [2022, 2023, 2024]},
 dr_hours_df_dict_out = {}
 YEAR = 2022
 
+# For effective rates test, one year of rates equal to hour/10,
+# with two products in one bin dispatching one hour each on Jan 2
+times = pd.date_range('2022-01-01', periods=8760, freq='H')
+df_rates_oneyear = pd.DataFrame({'Report_Year': times.year, 'Report_Month': times.month,
+                                 'Report_Day': times.day, 'Report_Hour': times.hour + 1})
+df_rates_oneyear['Test Emissions Rate Estimate'] = df_rates_oneyear['Report_Hour']/10
+df_hours_oneyear = df_rates_oneyear[['Report_Hour', 'Report_Month', 'Report_Day']].copy()
+df_hours_oneyear.columns = ['hourID', 'Month', 'Day']
+df_hours_oneyear['ProdA'] = 0
+df_hours_oneyear['ProdB'] = 0
+df_hours_oneyear.loc[24+17, 'ProdA'] = 1
+df_hours_oneyear.loc[24+9, 'ProdB'] = 1
+df_pot_oneyear = pd.DataFrame({'Year': [2022.], 'ProdA': [1.], 'ProdB': [3.]})
+df_info_oneyear = pd.DataFrame({'Product': ['ProdA', 'ProdB'], 'Bin': ['Bin 1', 'Bin 1'],
+                                'Seasonality': ['Winter', 'Winter'],
+                                'Shift or Shed?': ['Shed', 'Shed']})
+
 
 class TestSubCompB(unittest.TestCase):
     """
@@ -48,8 +68,9 @@ class TestSubCompB(unittest.TestCase):
         alldays_oneyear_seasonal_ave(emissions_scenario_list,
                                      emissions_rates_df_out, YEAR)
         get_oneyear_hour_ave(df_emissions_data, 'Winter', 'Test Emissions Rate Estimate', YEAR)
-        subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,
-                         emissions_rates_df_out, dr_hours_df_dict_out, YEAR)
+        self.assertEqual(len(subcomp_b_runall(dr_name, dr_seasons, emissions_scenario_list,
+                                              emissions_rates_df_out, dr_hours_df_dict_out,
+                                              YEAR)), 4)
 
     def test_get_hour_ave_winter(self):
         """
@@ -95,6 +116,160 @@ class TestSubCompB(unittest.TestCase):
                                                            'Test Emissions Rate Estimate', 2022)
         pdt.assert_frame_equal(df_output_all_days_ave_winter_2022, df_all_days_ave_winter_2022)
 
+    def test_get_hour_ave_ci(self):
+        """
+        One-shot test for get_hour_ave_ci
+        Averages match get_hour_ave, bounds contain the averages,
+        and the same seed gives the same bounds
+        """
+        column_name = 'Test Emissions Rate Estimate'
+        df_ci = get_hour_ave_ci(df_emissions_data, df_dr_hours_data, column_name,
+                                n_boot=500, seed=1)
+        df_ci_repeat = get_hour_ave_ci(df_emissions_data, df_dr_hours_data, column_name,
+                                       n_boot=500, seed=1)
+        df_ave = get_hour_ave(df_emissions_data, df_dr_hours_data, column_name)
+        self.assertTrue(np.allclose(df_ci[column_name], df_ave[column_name]))
+        self.assertTrue((df_ci[column_name + ' Lower'] <= df_ci[column_name]).all())
+        self.assertTrue((df_ci[column_name + ' Upper'] >= df_ci[column_name]).all())
+        pdt.assert_frame_equal(df_ci, df_ci_repeat)
+
+    def test_stratified_hour_ave(self):
+        """
+        One-shot test for stratified_hour_ave
+        Weekend average matches a groupby over Saturdays and Sundays,
+        and the average over the top 1 day matches that day
+        """
+        column_name = 'Test Emissions Rate Estimate'
+        df_strata = stratified_hour_ave(['Test'], df_emissions_data, 'Winter', 2022, 1)['Test']
+        df_winter = df_emissions_data[df_emissions_data['Report_Month'] <= 3]
+        dates = pd.to_datetime(pd.DataFrame({'year': df_winter['Report_Year'],
+                                             'month': df_winter['Report_Month'],
+                                             'day': df_winter['Report_Day']}))
+        df_weekend = df_winter[dates.dt.dayofweek.values >= 5]
+        self.assertTrue(np.allclose(df_strata['Weekend'],
+                                    df_weekend.groupby('Report_Hour')[column_name].mean()))
+        daily_ave = df_winter.groupby(dates.values)[column_name].mean()
+        df_peak = df_winter[dates.values == daily_ave.idxmax()]
+        self.assertTrue(np.allclose(df_strata['Top 1 Days'], df_peak[column_name]))
+
+    def test_runall_stratified(self):
+        """
+        Test that subcomp_b_runall returns the stratified averages
+        of every season when asked for them.
+        """
+        df_out = subcomp_b_runall([], [], ['Test'], df_rates_oneyear, {}, YEAR,
+                                  stratified=True)
+        self.assertEqual(len(df_out), 5)
+        pdt.assert_frame_equal(df_out[3]['Test'],
+                               month_hour_ave(['Test'], df_rates_oneyear)['Test'])
+        self.assertEqual(set(df_out[4]), set(SEASONS_ALLDAYS))
+        pdt.assert_frame_equal(df_out[4]['Summer']['Test'],
+                               stratified_hour_ave(['Test'], df_rates_oneyear, 'Summer')['Test'])
+        pdt.assert_frame_equal(df_out[4]['Annual']['Test'],
+                               alldays_stratified_ave(['Test'], df_rates_oneyear)['Annual']['Test'])
+
+    def test_time_period_available_stratified(self):
+        """
+        Edge test to make sure input season in stratified_hour_ave is defined.
+        """
+        with self.assertRaises(ValueError):
+            stratified_hour_ave(['Test'], df_emissions_data, 'Autumn')
+
+    def test_month_hour_ave(self):
+        """
+        One-shot test for month_hour_ave
+        Output matches a groupby over year, month and hour
+        """
+        df_month_hour = month_hour_ave(['Test'], df_emissions_data)['Test']
+        df_expected = df_emissions_data.groupby(['Report_Year', 'Report_Month',
+                                                 'Report_Hour'])['Test Emissions Rate Estimate']\
+                                                 .mean().unstack()
+        self.assertEqual(len(df_month_hour), 12)
+        self.assertTrue(np.allclose(df_month_hour.iloc[:, 2:].values, df_expected.values))
+
+    def test_leap_day_index_map(self):
+        """
+        One-shot test for get_leap_day_index_map
+        Feb 29 is skipped in leap years but not in 2100
+        """
+        times = pd.date_range('2024-01-01', '2024-12-31 23:00', freq='H')\
+            .append(pd.date_range('2100-01-01', '2100-12-31 23:00', freq='H'))
+        df_times = pd.DataFrame({'Report_Year': times.year, 'Report_Month': times.month,
+                                 'Report_Day': times.day, 'Report_Hour': times.hour + 1})
+        years, index_map = get_leap_day_index_map(df_times)
+        self.assertEqual(list(years), [2024, 2100])
+        self.assertEqual(index_map.shape, (2, 8760))
+        df_mar1 = df_times.iloc[index_map[:, (31+28)*24]]
+        self.assertEqual(list(df_mar1['Report_Month']), [3, 3])
+        self.assertEqual(list(df_mar1['Report_Day']), [1, 1])
+
+    def test_effective_rates(self):
+        """
+        One-shot test for effective_rates
+        Output is the potential-weighted mean of the rates in DR hours,
+        (1*1.8 + 3*1.0)/4 = 1.2
+        """
+        df_effective_rates = effective_rates(['test'], [['Winter']], ['Test'],
+                                             df_rates_oneyear,
+                                             {'test_Winter': df_hours_oneyear},
+                                             {'test_Winter': df_pot_oneyear},
+                                             {'test': df_info_oneyear})
+        df_out = df_effective_rates['test_Winter']['Test']
+        self.assertEqual(list(df_out.columns), ['Year', 'bin1'])
+        self.assertTrue(np.isclose(df_out['bin1'].iloc[0], 1.2))
+
+    def test_best_daily_windows(self):
+        """
+        One-shot test for best_daily_windows
+        With rates increasing through the day, the best window of every day
+        ends in the last hour, and its score is the sum of those rates
+        """
+        df_best = best_daily_windows(['Test'], df_rates_oneyear, (4, 6))['Test']
+        self.assertEqual(len(df_best), 365*2)
+        df_four = df_best[df_best['Window Length'] == 4]
+        self.assertTrue((df_four['Best Start Hour'] == 21).all())
+        self.assertTrue(np.allclose(df_four['Best Score'], 9.0))
+        self.assertEqual(list(df_best[['Report_Month', 'Report_Day']].iloc[-1]), [12, 31])
+
+    def test_seasonal_best_windows(self):
+        """
+        One-shot test for seasonal_best_windows
+        One-hour DR events on Jan 2 are compared to the last hour of the day
+        """
+        df_windows = seasonal_best_windows(['plan'], [['Winter']], ['Test'], df_rates_oneyear,
+                                           {'plan_Winter': df_hours_oneyear})['plan_Winter']['Test']
+        self.assertEqual(list(df_windows['Product']), ['ProdA', 'ProdB'])
+        self.assertTrue((df_windows['Window Length'] == 1).all())
+        self.assertTrue((df_windows['Best Start Hour'] == 24).all())
+        self.assertTrue(np.allclose(df_windows['Schedule Score'], [1.8, 1.0]))
+        self.assertTrue(np.allclose(df_windows['Gap'], [0.6, 1.4]))
+
+    def test_seasonal_best_windows_fractional(self):
+        """
+        Test that fractional dispatch in the DR hours scores the schedule
+        the same way as the best window, i.e. by the unweighted sum of rates
+        """
+        df_hours = df_hours_oneyear.copy()
+        df_hours.loc[24+17, 'ProdA'] = 0.5
+        df_hours.loc[24+23, 'ProdB'] = 0.25
+        df_hours.loc[24+9, 'ProdB'] = 0
+        df_windows = seasonal_best_windows(['plan'], [['Winter']], ['Test'], df_rates_oneyear,
+                                           {'plan_Winter': df_hours})['plan_Winter']['Test']
+        self.assertTrue(np.allclose(df_windows['Schedule Score'], [1.8, 2.4]))
+        self.assertTrue(np.allclose(df_windows['Gap'], [0.6, 0.]))
+
+    def test_seasonal_best_windows_no_dr_days(self):
+        """
+        Edge test that a season without any DR days is skipped.
+        """
+        df_hours = df_hours_oneyear.copy()
+        df_hours[['ProdA', 'ProdB']] = 0
+        df_windows = seasonal_best_windows(['plan'], [['Winter', 'Summer']], ['Test'],
+                                           df_rates_oneyear,
+                                           {'plan_Winter': df_hours_oneyear,
+                                            'plan_Summer': df_hours})
+        self.assertEqual(list(df_windows), ['plan_Winter'])
+
     def test_time_period_available(self):
         """
         Edge test to make sure input time period(season) in get_oneyear_hour_ave is defined.
@@ -7,12 +7,18 @@ import unittest
 import pandas as pd
 import numpy as np
 
-from subcomp_c_calculate_emissions import shift_hours, sort_bins, \
-    make_barchart_df, calc_yearly_avoided_emissions, subcomp_c_runall
+from subcomp_c_calculate_emissions import shift_hours, make_barchart_df, \
+    calc_yearly_avoided_emissions, subcomp_c_runall, calc_impacts_array, get_event_intervals, \
+    get_rates_cumsum, calc_interval_impacts, get_rebound_kernel, get_rebound_kernels, \
+    apply_load_shapes, stack_impacts_inputs, get_column_labels, build_output_dictionary, \
+    get_hourly_impacts, calc_results_cube, cube_to_dictionary, dictionary_to_cube, \
+    make_cube_barchart_df, parse_save_name, get_save_name, compensated_sum, \
+    get_impact_attribution
 
-from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS, DIR_TESTDATA_IN
+from emissions_parameters import DIR_EMISSIONS_RATES, DIR_DR_POTENTIAL_HRS, DIR_TESTDATA_IN, \
+    EMISSIONS_CHANGEUNITS, DAYS_IN_MONTH
 
-from subcomp_a_organize_data import subcomp_a_runall
+from subcomp_a_organize_data import subcomp_a_runall, create_product_registry
 
 #Load some test data
 dr_hours_5 = pd.read_excel(DIR_TESTDATA_IN+'subcomp_c_test_data/dr_hours_5.xlsx')
@@ -76,25 +82,135 @@ class TestSubCompC(unittest.TestCase):
         self.assertTrue(shifted_hours[11]==-1)
 
 
-    def test_sort_bins_oneshot(self):
+    def test_shift_event_lengths(self):
         """
-        One shot test for the sort_bins helper function
+        one shot test that shift handles events of different lengths
+        for several schedules at once, and wraps shifted hours that
+        fall outside the year.
         """
+        dr_hours = np.array([[0, 0, 1, 1, 0, 0, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0],
+                             [1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
+        expected = np.array([[0, -1, 1, 1, -1, -1, -1, 1, 1, 1, 1, -1, -1, 0, 0, 0],
+                             [1, 1, -1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, -1]])
+        self.assertTrue(np.array_equal(shift_hours(dr_hours), expected))
 
-        dr_product_info = pd.DataFrame(data=[['DVR', 'Bin 1', 'Year-round', 'Shed'],\
-                                     ["ResTOU_shift", "Bin 1", "Year-Round", "Shift"],\
-                                    ["ResTOU_shed", "Bin 1", "Year-Round", "Shed"],\
-                                     ["FakeProduct", "Bin 2", "Year-Round", "Shed"]], \
-                               columns=['Product', 'Bin', 'Seasonality', 'Shift or Shed?'])
-        dr_list = ['DVR', 'ResTOU_shift', 'ResTOU_shed', 'FakeProduct']
-
-        out_dict = sort_bins(dr_product_info, dr_list)
-
-        expected_dict = {'Bin 1': ['DVR', 'ResTOU_shift', 'ResTOU_shed'], 'Bin 2': ['FakeProduct']}
-
-        self.assertTrue(out_dict==expected_dict)
+    def test_load_shapes_default(self):
+        """
+        one shot test that the default rebound kernel reproduces shift_hours,
+        and splits the middle hour for odd event lengths.
+        """
+        hours = dr_hours_4['ResTOU_shift'].values
+        load_shape = apply_load_shapes(hours, [get_rebound_kernel(4)])
+        self.assertTrue(np.array_equal(load_shape[0], shift_hours(dr_hours_4['ResTOU_shift'])))
 
+        odd_shape = apply_load_shapes([0, 0, 0, 1, 1, 1, 0, 0, 0], [get_rebound_kernel(3)])
+        self.assertTrue(np.allclose(odd_shape[0], [0, -0.5, -1, 1, 1, 1, -1, -0.5, 0]))
 
+    def test_load_shapes_event_lengths(self):
+        """
+        one shot test that shift products without a declared kernel
+        shift each event by its own length, matching shift_hours for
+        events of 2 and 4 hours.
+        """
+        hours = np.zeros(24)
+        hours[3:5] = 1
+        hours[12:16] = 1
+        kernels = get_rebound_kernels(hours, ['ResTOU_shift'], [True], rebound_kernels={})
+        self.assertEqual(kernels, ['event'])
+        load_shape = apply_load_shapes(hours, kernels)
+        self.assertTrue(np.array_equal(load_shape[0], shift_hours(hours)))
+
+    def test_load_shapes_fraction(self):
+        """
+        one shot test that fractional DR hours ramping in and out of an event
+        shift the same load as is dispatched during the event.
+        """
+        hours = np.zeros(24)
+        hours[10:14] = [0.4, 1, 1, 0.6]
+        load_shape = apply_load_shapes(hours, [get_rebound_kernel(4)])
+        self.assertTrue(np.allclose(load_shape[0, 8:16], [-0.75, -0.75, 0.4, 1, 1, 0.6,
+                                                          -0.75, -0.75]))
+        self.assertTrue(np.isclose(load_shape.sum(), 0))
+
+    def test_load_shapes_kernels(self):
+        """
+        one shot test of a pre-cooling and delayed tail kernel,
+        and that the FFT path matches the direct convolution.
+        """
+        hours = np.zeros((2, 48))
+        hours[:, 10:14] = 1
+        kernel = {'pre': [0.5, 0.5], 'post': [0, -1, -1, -1, -1, -1]}
+        load_shape = apply_load_shapes(hours, [kernel, None])
+        self.assertTrue(np.allclose(load_shape[0, 8:20], [0.5, 0.5, 1, 1, 1, 1,
+                                                          0, -1, -1, -1, -1, -1]))
+        self.assertTrue(np.array_equal(load_shape[1], hours[1]))
+        load_shape_fft = apply_load_shapes(hours, [kernel, None], fft_length=1)
+        self.assertTrue(np.allclose(load_shape, load_shape_fft))
+
+    def test_registry(self):
+        """
+        one shot test that passing the product registry of subcomponent a
+        gives the same impacts as building it in subcomponent c, with or
+        without the column index of the DR hours.
+        """
+        expected = calc_yearly_avoided_emissions(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        for registry in [create_product_registry(dr_product_info_df_dict_out,
+                                                 dr_hours_df_dict_out),
+                         create_product_registry(dr_product_info_df_dict_out)]:
+            out_dict = calc_yearly_avoided_emissions(emissions_rates_df_out,
+                dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                dr_name, dr_seasons, registry=registry)
+            self.assertEqual(list(out_dict), list(expected))
+            for key, value in expected.items():
+                self.assertTrue(value.equals(out_dict[key]))
+
+    def test_calc_impacts_array(self):
+        """
+        One shot test for calc_impacts_array against a loop over
+        scenarios, years and products.
+        """
+        rng = np.random.default_rng(0)
+        rates = rng.random((2, 3, 24))
+        hours = rng.integers(-1, 2, (4, 24))
+        potential = rng.random((3, 4))
+
+        impacts = calc_impacts_array(rates, hours, potential)
+
+        self.assertEqual(impacts.shape, (2, 3, 4))
+        for scen in range(2):
+            for year in range(3):
+                for prod in range(4):
+                    expected = (rates[scen, year]*hours[prod]*potential[year, prod]).sum()\
+                        *EMISSIONS_CHANGEUNITS
+                    self.assertTrue(np.isclose(impacts[scen, year, prod], expected))
+
+    def test_interval_impacts(self):
+        """
+        One shot test that the prefix-sum interval engine gives the same
+        impacts as calc_impacts_array, for intervals found from DR hours.
+        """
+        rng = np.random.default_rng(1)
+        rates = rng.random((2, 3, 24))
+        hours = np.array([[0, 1, 1, -1, -1, 0]*4, [1, 0, 0, 0, 0, 1]*4])
+        potential = rng.random((3, 2))
+
+        intervals = get_event_intervals(hours)
+        self.assertEqual(list(intervals['start'][:3]), [1, 3, 7])
+        self.assertEqual(list(intervals['end'][:3]), [3, 5, 9])
+        self.assertEqual(list(intervals['value'][:3]), [1, -1, 1])
+
+        rates_cumsum = get_rates_cumsum(rates)
+        impacts = calc_interval_impacts(rates_cumsum, intervals, potential)
+        self.assertTrue(np.allclose(impacts, calc_impacts_array(rates, hours, potential)))
+
+        # New schedules, including fractional dispatch, reuse the same cumulative rates
+        for shift in range(1, 4):
+            schedule = np.roll(hours, shift, axis=1) * np.array([[1.], [0.5]])
+            impacts = calc_interval_impacts(rates_cumsum, get_event_intervals(schedule),
+                                            potential)
+            self.assertTrue(np.allclose(impacts,
+                                        calc_impacts_array(rates, schedule, potential)))
 
     def test_smoke(self):
         """
@@ -109,6 +225,177 @@ class TestSubCompC(unittest.TestCase):
 
         make_barchart_df(emissions_impact_dict)
 
+    def test_stack_impacts_inputs(self):
+        """
+        One shot test that the stacked inputs are aligned with their
+        column labels and rebuild the output dictionary.
+        """
+        inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        labels = get_column_labels(inputs)
+        nproducts = len(labels)
+        self.assertEqual(inputs['hours'].shape, (nproducts, 8760))
+        self.assertEqual(inputs['potential'].shape, (len(inputs['years']), nproducts))
+        self.assertEqual(list(labels.Product), inputs['products'])
+        self.assertEqual(list(np.unique(inputs['months'])), list(range(1, 13)))
+
+        impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'],
+                                     inputs['potential'])
+        out_dict = build_output_dictionary(impacts, inputs)
+        expected = calc_yearly_avoided_emissions(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        self.assertEqual(list(out_dict.keys()), list(expected.keys()))
+
+    def test_results_cube(self):
+        """
+        One shot test that the results cube has NaN for missing combinations,
+        and that its dictionary view and barchart match the output dictionary.
+        """
+        cube = calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        coords = cube['coords']
+        self.assertEqual(cube['values'].shape, tuple(len(coords[x]) for x in cube['dims']))
+        self.assertEqual(coords['Plan'], dr_name)
+        self.assertEqual(coords['Season'], ['Winter', 'Summer', 'Fall'])
+        self.assertTrue(np.isnan(cube['values'][:, 0, 2]).all())
+        self.assertFalse(cube['mask'][0, 2].any())
+
+        out_dict = cube_to_dictionary(cube)
+        expected = calc_yearly_avoided_emissions(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        self.assertEqual(set(out_dict.keys()), set(expected.keys()))
+        for key, table in expected.items():
+            self.assertTrue(table.equals(out_dict[key]))
+
+        round_trip = cube_to_dictionary(dictionary_to_cube(out_dict))
+        for key, table in out_dict.items():
+            self.assertTrue(table.equals(round_trip[key]))
+
+        barchart, newbins = make_cube_barchart_df(cube)
+        expected_barchart, expected_newbins = make_barchart_df(expected)
+        self.assertTrue(np.allclose(barchart, expected_barchart, equal_nan=True))
+        self.assertTrue(expected_newbins.equals(newbins))
+
+    def test_compensated_sum(self):
+        """
+        One shot test that compensated summation in float32 keeps the small
+        terms that a naive float32 sum loses.
+        """
+        values = np.array([1e8] + [1.]*1000 + [-1e8], dtype=np.float32)
+        self.assertEqual(compensated_sum(values, axis=0), 1000.)
+        self.assertEqual(compensated_sum(values[:, None], axis=0).dtype, np.float32)
+        self.assertTrue(np.allclose(compensated_sum(np.arange(12.).reshape(3, 4), axis=-1),
+                                    [6., 22., 38.]))
+
+    def test_float32_impacts(self):
+        """
+        One shot test that float32 impacts are float32 and close to float64.
+        """
+        cube_64 = calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        cube_32 = calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons,
+            precision='float32')
+        self.assertEqual(cube_32['values'].dtype, np.float32)
+        scale = np.nanmax(np.abs(cube_64['values']))
+        self.assertTrue(np.allclose(cube_32['values'], cube_64['values'],
+                                    rtol=1e-5, atol=1e-6*scale, equal_nan=True))
+        with self.assertRaises(ValueError):
+            calc_results_cube(emissions_rates_df_out, dr_hours_df_dict_out,
+                dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons,
+                precision='float16')
+
+    def test_float32_month_blocks(self):
+        """
+        One shot test that float32 impacts summed by calendar month match
+        float64, for months of different lengths.
+        """
+        rng = np.random.default_rng(2)
+        months = np.repeat(np.arange(1, 13), DAYS_IN_MONTH)
+        rates = rng.random((1, 2, len(months)))
+        hours = rng.random((3, len(months)))
+        potential = rng.random((2, 3))
+        impacts = calc_impacts_array(rates.astype(np.float32), hours.astype(np.float32),
+                                     potential.astype(np.float32), months)
+        self.assertEqual(impacts.dtype, np.float32)
+        self.assertTrue(np.allclose(impacts, calc_impacts_array(rates, hours, potential),
+                                    rtol=1e-5))
+
+    def test_parse_save_name(self):
+        """
+        One shot test that parse_save_name inverts get_save_name.
+        """
+        for scenario in ['Baseline', 'High']:
+            save_name = get_save_name(scenario+' Emissions Rate Estimate', 'newbins', 'Fall',
+                                      'Bin 3')
+            self.assertEqual(parse_save_name(save_name),
+                             (scenario, 'newbins', 'Fall', 'Bin 3'))
+        with self.assertRaises(ValueError):
+            parse_save_name('newbins_bin1')
+
+    def test_hourly_impacts(self):
+        """
+        One shot test that the hourly impacts of each year sum to
+        the yearly impacts.
+        """
+        inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'],
+                                     inputs['potential'])
+        hourly_impacts = get_hourly_impacts(inputs)
+        self.assertEqual(hourly_impacts['scenarios'], ['Baseline'])
+        for y_ind, (year, hourly) in enumerate(hourly_impacts['impacts']):
+            self.assertEqual(year, inputs['years'][y_ind])
+            self.assertEqual(hourly.shape, (1, 8760, len(inputs['products'])))
+            self.assertTrue(np.allclose(hourly.sum(axis=1), impacts[:, y_ind]))
+
+    def test_impact_attribution(self):
+        """
+        One shot test that the month x hour attribution sums to the
+        yearly impacts, with rebound only from shift products.
+        """
+        inputs = stack_impacts_inputs(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        impacts = calc_impacts_array(inputs['rates'], inputs['load_shapes'],
+                                     inputs['potential'])
+        df_attribution = get_impact_attribution(inputs)
+        self.assertTrue(df_attribution['Month'].between(1, 12).all())
+        self.assertTrue(df_attribution['Hour'].between(1, 24).all())
+
+        labels = get_column_labels(inputs)
+        totals = (df_attribution['Avoided Emissions'] + df_attribution['Rebound Emissions'])\
+            .groupby([df_attribution[x] for x in ['Plan', 'Season', 'Bin', 'Product', 'Year']])\
+            .sum()
+        expected = pd.Series(impacts[0].T.ravel(), index=pd.MultiIndex.from_arrays(
+            [np.repeat(labels[x].values, len(inputs['years'])) \
+             for x in ['Plan', 'Season', 'Bin', 'Product']] \
+            + [np.tile(inputs['years'], len(labels))]))
+        self.assertTrue(np.allclose(totals.reindex(expected.index).fillna(0), expected))
+
+        rebound = df_attribution[df_attribution['Rebound Emissions'] != 0]
+        self.assertTrue(set(rebound['Product']) <= set(np.array(inputs['products'])[
+            inputs['shift']]))
+
+    def test_potential_profiles(self):
+        """
+        One shot test that multipliers of 1 give the same impacts as flat
+        potential, and multipliers of 2 double the impacts.
+        """
+        flat_dict = calc_yearly_avoided_emissions(emissions_rates_df_out, dr_hours_df_dict_out,
+            dr_potential_df_dict_out, dr_product_info_df_dict_out, dr_name, dr_seasons)
+        for multiplier in [1., 2.]:
+            profile = pd.DataFrame({'Month': np.repeat(np.arange(1, 13), 24),
+                                    'hourID': np.tile(np.arange(1, 25), 12)})
+            for product in dr_hours_df_dict_out['newbins_Winter'].columns[3:]:
+                profile[product] = multiplier
+            profile_dict = calc_yearly_avoided_emissions(emissions_rates_df_out,
+                dr_hours_df_dict_out, dr_potential_df_dict_out, dr_product_info_df_dict_out,
+                dr_name, dr_seasons, potential_profiles={'newbins': profile})
+            self.assertTrue(np.allclose(profile_dict['newbins_Winter_bin1'].iloc[:, 1:],
+                                        flat_dict['newbins_Winter_bin1'].iloc[:, 1:]*multiplier))
+            self.assertTrue(np.allclose(profile_dict['oldbins_Winter_bin1'],
+                                        flat_dict['oldbins_Winter_bin1']))
+
     def test_make_barchart(self):
         """
         one-shot test for the make barchart function.
@@ -5,14 +5,19 @@ Contains tests for subcomp_d_output_data, which outputs processed data
 into csv files for the dashboard generator to read.
 """
 
-from os import path
+from os import path, mkdir
+import tempfile
 
 import unittest
 import pandas as pd
+import numpy as np
 
 from emissions_parameters import DIR_TESTDATA_IN
 from subcomp_d_output_data import output_dr_hours, \
-    output_dr_potential, output_avg_emissions_rates, output_emissions_impacts
+    output_dr_potential, output_avg_emissions_rates, output_emissions_impacts, \
+    output_hourly_impacts, output_impact_attribution, read_impact_attribution, \
+    output_abatement_ranking, output_stratified_ave, output_effective_rates, \
+    output_best_windows
 from emissions_calculator import main
 
 # Using subcomp_d which needs input from earlier subcomps,
@@ -24,13 +29,15 @@ main(dir_out)
 # This would need to be modified for different DR plans, bins, seasons
 folders = ['dr_hours/','dr_potential/','emissions_rates/','emissions_impacts/']
 files = [['output_dr_hours'],['comparison_barchart','newbins_Fall_bin1'],\
-         ['alldays_2022_Spring_Baseline','DRdays_allyears_newbins_Winter_Baseline'],\
+         ['alldays_2022_Spring_Baseline','DRdays_allyears_newbins_Winter_Baseline',\
+          'monthhour_allyears_Baseline'],\
          ['emissions_reductions_barchart','oldbins_Summer_bin2']]
 columns = [[['DR Plan','Season','DR Hours: Non-DLC Products','DR Hours: DLC Products']],\
         [['DR Plan, Season, and Bin','2041 Potential'],\
         ['Year','DVR','ResTOU_shift','ResTOU_shed']],\
         [['Report_Hour','Baseline Emissions Rate Estimate'],\
-        ['Report_Hour','Baseline Emissions Rate Estimate']],\
+        ['Report_Hour','Baseline Emissions Rate Estimate'],\
+        ['Report_Year','Report_Month']+[str(x) for x in range(1,25)]],\
         [['Season','oldbins_bin1','oldbins_bin2','oldbins_bin3','oldbins_bin4',\
         'newbins_bin1_shed','newbins_bin1_shift'],\
         ['Year','NRCurtailCom','NRCurtailInd','ResTOU','NRCoolSwchMed','ResBYOT']]]
@@ -67,6 +74,119 @@ class TestSubCompD(unittest.TestCase):
                 self.assertEqual(set(checkdf.columns), set(expected_cols))
                 self.assertTrue(len(checkdf) > 0)
 
+    def test_hourly_impacts(self):
+        """
+        One-shot test that hourly impacts streamed by year can be read back
+        by year and product, in the precision of the impacts.
+        """
+        columns = pd.DataFrame({'Plan': ['oldbins']*2, 'Season': ['Winter']*2,
+                                'Bin': ['Bin 1']*2, 'Product': ['A', 'B']})
+        yearly = [np.full((1, 8760, 2), year, dtype=np.float32) for year in [2022, 2023, 2024]]
+        hourly_impacts = {'scenarios': ['Baseline'], 'years': np.array([2022, 2023, 2024]),
+                          'columns': columns,
+                          'impacts': ((2022+i, x) for i, x in enumerate(yearly))}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_impacts')
+            output_hourly_impacts(hourly_impacts, tmp_dir+'/')
+            impacts = np.load(tmp_dir+'/emissions_impacts/hourly_impacts_Baseline.npy',
+                              mmap_mode='r')
+            self.assertEqual(impacts.shape, (3, 8760, 2))
+            self.assertEqual(impacts.dtype, np.float32)
+            self.assertTrue(np.all(impacts[1] == 2023))
+            checkdf = pd.read_csv(tmp_dir+'/emissions_impacts/hourly_impacts_columns.csv')
+            self.assertEqual(list(checkdf.Product), ['A', 'B'])
+            del impacts
+
+    def test_impact_attribution(self):
+        """
+        One-shot test that the impact attribution written for each scenario
+        is read back with the same labels and values.
+        """
+        df_attribution = pd.DataFrame({'Scenario': ['Baseline']*3 + ['High'],
+                                       'Plan': ['oldbins', 'oldbins', 'newbins', 'oldbins'],
+                                       'Season': ['Winter']*4, 'Bin': ['Bin 1']*4,
+                                       'Product': ['A', 'B', 'A', 'A'],
+                                       'Year': [2022, 2022, 2023, 2022], 'Month': [1, 2, 3, 1],
+                                       'Hour': [18, 19, 24, 18],
+                                       'Avoided Emissions': [1.5, 0., 2., 3.],
+                                       'Rebound Emissions': [0., -0.5, 0., 0.]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_impacts')
+            output_impact_attribution(df_attribution, tmp_dir+'/')
+            checkdf = read_impact_attribution(tmp_dir+'/emissions_impacts/'\
+                                              +'impact_attribution_Baseline.npz')
+            expected = df_attribution[df_attribution.Scenario == 'Baseline']\
+                .drop(columns='Scenario')
+            self.assertTrue(np.array_equal(checkdf.values, expected.values))
+            self.assertTrue(path.exists(tmp_dir+'/emissions_impacts/'\
+                                        +'impact_attribution_High.npz'))
+
+    def test_abatement_ranking(self):
+        """
+        One-shot test that the abatement ranking and curves are written
+        to csv files and read back unchanged.
+        """
+        df_abatement = pd.DataFrame({'Scenario': ['Baseline']*2, 'Product': ['A', 'B'],
+                                     'Rank': [1, 2], 'Tons per MW': [2.5, 1.]})
+        df_curves = pd.DataFrame({'Scenario': ['Baseline']*2, 'Rank': [1, 2],
+                                  'Cumulative Avoided Emissions': [5., 6.]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_impacts')
+            output_abatement_ranking(df_abatement, df_curves, tmp_dir+'/')
+            checkdf = pd.read_csv(tmp_dir+'/emissions_impacts/abatement_ranking.csv')
+            self.assertTrue(checkdf.equals(df_abatement))
+            checkdf = pd.read_csv(tmp_dir+'/emissions_impacts/abatement_curves.csv')
+            self.assertTrue(checkdf.equals(df_curves))
+
+    def test_stratified_ave(self):
+        """
+        One-shot test that the stratified averages are written to a csv file
+        for each season and scenario.
+        """
+        df_strata = pd.DataFrame({'Report_Hour': [1, 2], 'Weekday': [0.5, 0.6],
+                                  'Weekend': [0.4, 0.5], 'Holiday': [0.3, np.nan],
+                                  'Top 10 Days': [0.7, 0.8]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_rates')
+            output_stratified_ave({'Winter': {'Baseline': df_strata}}, tmp_dir+'/')
+            checkdf = pd.read_csv(tmp_dir+'/emissions_rates/'\
+                                  +'stratified_allyears_Winter_Baseline.csv')
+            self.assertTrue(checkdf.equals(df_strata))
+
+    def test_effective_rates(self):
+        """
+        One-shot test that the effective emissions rates are written to a csv
+        file for each DR plan, season and scenario.
+        """
+        df_rates = pd.DataFrame({'Year': [2022, 2023], 'bin1': [0.5, 0.6], 'bin2': [0.4, 0.3]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_rates')
+            output_effective_rates({'oldbins_Winter': {'Baseline': df_rates}}, tmp_dir+'/')
+            checkdf = pd.read_csv(tmp_dir+'/emissions_rates/'\
+                                  +'effective_rates_oldbins_Winter_Baseline.csv')
+            self.assertTrue(checkdf.equals(df_rates))
+
+    def test_best_windows(self):
+        """
+        One-shot test that the best windows are written to a csv file for each
+        scenario, and for each DR plan, season and scenario.
+        """
+        df_best = pd.DataFrame({'Report_Year': [2022], 'Report_Month': [1], 'Report_Day': [1],
+                                'Window Length': [4], 'Best Start Hour': [17],
+                                'Best Score': [2.5]})
+        df_seasonal = pd.DataFrame({'Year': [2022], 'Product': ['A'], 'Window Length': [4],
+                                    'Best Start Hour': [17], 'Best Score': [2.5],
+                                    'Schedule Score': [2.0], 'Gap': [0.5]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mkdir(tmp_dir+'/emissions_rates')
+            output_best_windows({'Baseline': df_best},
+                                {'oldbins_Winter': {'Baseline': df_seasonal}}, tmp_dir+'/')
+            checkdf = pd.read_csv(tmp_dir+'/emissions_rates/best_windows_Baseline.csv')
+            self.assertTrue(checkdf.equals(df_best))
+            checkdf = pd.read_csv(tmp_dir+'/emissions_rates/'\
+                                  +'best_windows_oldbins_Winter_Baseline.csv')
+            self.assertTrue(checkdf.equals(df_seasonal))
+
     def test_df(self):
         """
         Edge test to make sure output_emissions_impacts throws a ValueError